@@ -1,8 +1,6 @@
 #!/opt/privacyidea/bin/python
-from privacyidea.lib.token import add_tokeninfo
+from pi_bootstrap import app_context, lazy_import
 import argparse
-from privacyidea.app import create_app
-from privacyidea.lib.tokenclass import DATE_FORMAT
 import datetime
 
 __doc__ = """
@@ -26,21 +24,28 @@ It relies on the token serial which is given as argument --serial <SERIAL>.
     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 """
 
+token_lib = lazy_import("privacyidea.lib.token")
+tokenclass_lib = lazy_import("privacyidea.lib.tokenclass")
+
 tokeninfo_key = "timestamp"
-tokeninfo_value = datetime.datetime.now().strftime(DATE_FORMAT)
+
 
 def add_tokeninfo_creation_time(serial, key, value):
-    app = create_app(config_name="production",
-                     config_file="/etc/privacyidea/pi.cfg",
-                     silent=True)
+    with app_context():
+        token_lib.add_tokeninfo(serial, key, value)
+
 
-    with app.app_context():
-        add_tokeninfo(serial, key, value)
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial')
+    args = parser.parse_args(argv)
 
+    # The timestamp is taken per call, so that the script can also be run
+    # by a long-running host process.
+    tokeninfo_value = datetime.datetime.now().strftime(tokenclass_lib.DATE_FORMAT)
+    add_tokeninfo_creation_time(args.serial, tokeninfo_key,
+                                tokeninfo_value)
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', dest='serial')
-args = parser.parse_args()
 
-add_tokeninfo_creation_time(args.serial, tokeninfo_key,
-                            tokeninfo_value)
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
 #!/opt/privacyidea/bin/python
 # -*- coding: utf-8 -*-
 
-from privacyidea.app import create_app
-from privacyidea.lib.machine import attach_token
+from pi_bootstrap import app_context, lazy_import
 import argparse
 
 __doc__ = """
@@ -41,20 +40,24 @@ Adapt SSH_HOST to your needs.
 SSH_HOST = "test_host"
 PI_CONFIG = '/etc/privacyidea/pi.cfg'
 
+machine_lib = lazy_import("privacyidea.lib.machine")
+
 
 def assign_ssh_token(serial, username):
-    app = create_app(config_name='production',
-                     config_file=PI_CONFIG,
-                     silent=True)
-    with app.app_context():
-        attach_token(serial, 'ssh', hostname=SSH_HOST, options={'user': username})
+    with app_context(PI_CONFIG):
+        machine_lib.attach_token(serial, 'ssh', hostname=SSH_HOST, options={'user': username})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial', required=True)
+    parser.add_argument('--user', dest='username', required=True)
+    args, unknown = parser.parse_known_args(argv)
 
+    # assign the token to a specific machine
+    if args.serial and args.username:
+        assign_ssh_token(args.serial, args.username)
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', dest='serial', required=True)
-parser.add_argument('--user', dest='username', required=True)
-args, unknown = parser.parse_known_args()
 
-# assign the token to a specific machine
-if args.serial and args.username:
-    assign_ssh_token(args.serial, args.username)
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
 #!/opt/privacyidea/bin/python
 # -*- coding: utf-8 -*-
 
-from privacyidea.app import create_app
-from privacyidea.lib.machine import attach_token
+from pi_bootstrap import app_context, lazy_import
 import argparse
 
 __doc__ = """
@@ -38,19 +37,23 @@ and use it in the script event handler with the configuration:
 
 PI_CONFIG = '/etc/privacyidea/pi.cfg'
 
+machine_lib = lazy_import("privacyidea.lib.machine")
+
 
 def attach_offline(serial):
-    app = create_app(config_name='production',
-                     config_file=PI_CONFIG,
-                     silent=True)
-    with app.app_context():
-        attach_token(serial, 'offline')
+    with app_context(PI_CONFIG):
+        machine_lib.attach_token(serial, 'offline')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial', required=True)
+    args, unknown = parser.parse_known_args(argv)
 
+    # attach offline
+    if args.serial:
+        attach_offline(args.serial)
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', dest='serial', required=True)
-args, unknown = parser.parse_known_args()
 
-# attach offline
-if args.serial:
-    attach_offline(args.serial)
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from pi_rest import Client
 import argparse
-import requests
-import re
-import sys
  
 __doc__ = """
 This scripts creates a registration token for a given user via the REST API.
@@ -44,28 +42,29 @@ REMOTE_SERVER = "https://localhost"
 VERIFY_TLS = False
 
 
-def create_token(username, realm):
+def create_token(client, username, realm):
     # Set global values
     params = { "genkey": 1 }
     params["user"] = username
     params["realm"] = realm
     params["type"] = REMOTE_TOKEN
-    r = requests.post('{0!s}/auth'.format(REMOTE_SERVER), verify=VERIFY_TLS,
-                      data={"username": API_USER, "password": API_PASSWORD})
-    authorization = r.json().get("result").get("value").get("token")
-    r = requests.post('{0!s}/token/init'.format(REMOTE_SERVER), verify=VERIFY_TLS,
-                      data=params,
-                      headers={"Authorization": authorization})
-    serial = r.json().get("detail").get("serial")
-    regcode = r.json().get("detail").get("registrationcode")
+    response = client.post('/token/init', data=params)
+    serial = response.detail.get("serial")
+    regcode = response.detail.get("registrationcode")
     return serial, regcode
  
  
-parser = argparse.ArgumentParser()
-parser.add_argument('--user', dest='username')
-parser.add_argument('--realm', dest='realm')
-args = parser.parse_args()
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--user', dest='username')
+    parser.add_argument('--realm', dest='realm')
+    args = parser.parse_args(argv)
 
-serial, regcode = create_token(args.username, args.realm)
-print(serial)
-print(regcode)
\ No newline at end of file
+    client = Client(REMOTE_SERVER, API_USER, API_PASSWORD, verify=VERIFY_TLS)
+    serial, regcode = create_token(client, args.username, args.realm)
+    print(serial)
+    print(regcode)
+
+
+if __name__ == "__main__":
+    main()
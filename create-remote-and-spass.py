@@ -1,13 +1,6 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import init_token, get_tokens
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context, lazy_import
 import argparse
-from flask_sqlalchemy import SQLAlchemy
-from privacyidea.lib.utils import BASE58
-from privacyidea.lib.crypto import generate_password
-from privacyidea.app import create_app
-import requests
 import re
 import sys
  
@@ -55,19 +48,19 @@ REMOTE_SERVER = "https://localhost"
 # List of regex of users to exclude
 EXCLUCDE_USERS = [".*@.*"]
 
+token_lib = lazy_import("privacyidea.lib.token")
+user_lib = lazy_import("privacyidea.lib.user")
+requests = lazy_import("requests")
+
 
 def create_token(username, realm):
-    app = create_app(config_name="production",
-                     config_file="/etc/privacyidea/pi.cfg",
-                     silent=True)
- 
-    with app.app_context():
+    with app_context():
         # Set global values
         params = {"type": LOCAL_TOKEN}
         if username:
-            user = User(username, realm)
+            user = user_lib.User(username, realm)
         else:
-            user = User()
+            user = user_lib.User()
         
         if LOCAL_TOKEN == "remote":
             # For a remote token, we need some additional parameters
@@ -75,8 +68,8 @@ def create_token(username, realm):
             params["remote.user"] = username
             params["remote.realm"] = REMOTE_REALM
             params_remote = {"type": REMOTE_TOKEN}
-            remote_user = User(username, REMOTE_REALM)
-            remote_token = init_token(params_remote, remote_user)
+            remote_user = user_lib.User(username, REMOTE_REALM)
+            remote_token = token_lib.init_token(params_remote, remote_user)
         else:
             # For other tokens, we need genkey=1
             params["genkey"] = 1
@@ -92,22 +85,27 @@ def create_token(username, realm):
                               headers={"Authorization": authorization})
             serial = r.json().get("detail").get("serial")
         else:
-            tok = init_token(params, user)
+            tok = token_lib.init_token(params, user)
             serial = tok.token.serial
         return serial
  
  
-parser = argparse.ArgumentParser()
-parser.add_argument('--user', dest='username')
-parser.add_argument('--realm', dest='realm')
-parser.add_argument('--logged_in_realm', dest='lrealm')
-parser.add_argument('--logged_in_user', dest='tuser')
-args = parser.parse_args()
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--user', dest='username')
+    parser.add_argument('--realm', dest='realm')
+    parser.add_argument('--logged_in_realm', dest='lrealm')
+    parser.add_argument('--logged_in_user', dest='tuser')
+    args = parser.parse_args(argv)
+
+    for exclude_re in EXCLUCDE_USERS:
+        if re.match(exclude_re, args.username):
+            print("We do not enroll token for user {0!s}.".format(args.username))
+            sys.exit(0)
+
+    serial = create_token(args.username, args.realm)
+    print(serial)
 
-for exclude_re in EXCLUCDE_USERS:
-    if re.match(exclude_re, args.username):
-        print("We do not enroll token for user {0!s}.".format(args.username))
-        sys.exit(0)
 
-serial = create_token(args.username, args.realm)
-print(serial)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,6 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import init_token
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context, lazy_import
 import argparse
-from privacyidea.app import create_app
 import sys
  
 __doc__ = """
@@ -55,14 +52,14 @@ REMOTE_SERVER_ID = 1
 # SHould we check the PIN locally of the different users?
 REMOTE_LOCAL_CHECK_PIN = False
 
+token_lib = lazy_import("privacyidea.lib.token")
+user_lib = lazy_import("privacyidea.lib.user")
+
+
 def create_tokens(serial):
-    app = create_app(config_name="production",
-                     config_file="/etc/privacyidea/pi.cfg",
-                     silent=True)
- 
-    with app.app_context():
+    with app_context():
         for username in USERNAMES:
-            user = User(username, REALM)
+            user = user_lib.User(username, REALM)
             if not user:
                 sys.stderr.write("User {0!s} does not exist.\n".format(username))
                 continue
@@ -73,11 +70,16 @@ def create_tokens(serial):
             params["remote.local_checkpin"] = REMOTE_LOCAL_CHECK_PIN
             params["type"] = "remote"
 
-            remote_token = init_token(params, user=user)
+            remote_token = token_lib.init_token(params, user=user)
             print("Created remote token {0!s} for user {1!s}.".format(remote_token, username))
  
  
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', dest='serial')
-args = parser.parse_args()
-serial = create_tokens(args.serial)
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial')
+    args = parser.parse_args(argv)
+    create_tokens(args.serial)
+
+
+if __name__ == "__main__":
+    main()
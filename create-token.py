@@ -1,12 +1,9 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import init_token, get_tokens
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context, lazy_import, transaction
+import pi_bulk
 import argparse
-from flask_sqlalchemy import SQLAlchemy
-from privacyidea.lib.utils import BASE58
-from privacyidea.lib.crypto import generate_password
-from privacyidea.app import create_app
+import itertools
+import sys
 
 __doc__ = """
 This scripts create new tokens for a given user.
@@ -21,6 +18,17 @@ It can also run to create multiple tokens:
 
    create-token.py --user <existing user> --count 100
 
+or to create one token for each user in a CSV file with the columns
+username and optionally realm:
+
+   create-token.py --csv users.csv
+
+In batch mode all tokens are created in one app context. The secrets are
+generated in bulk and the tokens are committed in chunks of CHUNK_SIZE
+tokens (--chunk-size). The serial and password of each token are written
+to stdout as soon as its chunk is committed. If a chunk fails, it is
+rolled back and the script stops, the tokens of the previous chunks stay.
+
 You can place the script in your scripts directory /etc/privacyidea/scripts/
 and use it in the script event handler.
 
@@ -45,37 +53,86 @@ Adapt it (like the TOKENTYPE and REALM) to your needs.
 TOKENTYPE = "pw"
 PW_LEN = 10
 REALM = "testfoo"
-
-
-def create_token(serial, username):
-    app = create_app(config_name="production",
-                     config_file="/etc/privacyidea/pi.cfg",
-                     silent=True)
-
-    with app.app_context():
-        # Set global values
-        params = {"type": TOKENTYPE}
-        if username:
-            user = User(username, REALM)
-        else:
-            user = User()
-        if serial:
-            params["serial"] = serial
-        password = generate_password(size=PW_LEN, characters=BASE58)
-        params["otplen"] = PW_LEN
-        params["otpkey"] = password
-        tok = init_token(params, user)
-        return tok.token.serial, password
-
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', dest='serial')
-parser.add_argument('--user', dest='username')
-parser.add_argument('--count', dest='count')
-args = parser.parse_args()
-
-count = int(args.count or 1)
-for i in range(0, count):
-    serial, password = create_token(args.serial, args.username)
-    print("{0!s}: {1!s}".format(serial, password))
-
+# The number of tokens, that are committed in one transaction
+CHUNK_SIZE = 500
+
+token_lib = lazy_import("privacyidea.lib.token")
+user_lib = lazy_import("privacyidea.lib.user")
+crypto_lib = lazy_import("privacyidea.lib.crypto")
+utils_lib = lazy_import("privacyidea.lib.utils")
+
+
+def generate_passwords(count):
+    """
+    Generate the passwords of count tokens with a single call of
+    generate_password.
+    """
+    chars = crypto_lib.generate_password(size=PW_LEN * count, characters=utils_lib.BASE58)
+    return [chars[i:i + PW_LEN] for i in range(0, PW_LEN * count, PW_LEN)]
+
+
+def create_token(user, password, serial=None):
+    params = {"type": TOKENTYPE,
+              "otplen": PW_LEN,
+              "otpkey": password}
+    if serial:
+        params["serial"] = serial
+    tok = token_lib.init_token(params, user)
+    return tok.token.serial
+
+
+def create_tokens(users, serial=None, chunk_size=CHUNK_SIZE):
+    """
+    Create a token for each (username, realm) in users. The serial and the
+    password of the tokens are yielded after their chunk was committed.
+    """
+    user_key = user = None
+    with app_context():
+        for chunk in pi_bulk.chunked(users, chunk_size):
+            passwords = generate_passwords(len(chunk))
+            serials = []
+            with transaction():
+                for (username, realm), password in zip(chunk, passwords):
+                    if (username, realm) != user_key:
+                        user_key = (username, realm)
+                        user = user_lib.User(username, realm) if username else user_lib.User()
+                    serials.append(create_token(user, password, serial))
+            for tok_serial, password in zip(serials, passwords):
+                yield tok_serial, password
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial')
+    parser.add_argument('--user', dest='username')
+    parser.add_argument('--count', dest='count')
+    parser.add_argument('--csv', dest='csv',
+                        help="CSV file with the columns username and realm. "
+                             "One token is created for each line.")
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=CHUNK_SIZE,
+                        help="The number of tokens, that are committed in one transaction.")
+    args = parser.parse_args(argv)
+
+    count = int(args.count or 1)
+    if args.serial and (count > 1 or args.csv):
+        parser.error("--serial can only be used for a single token")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.csv:
+        users = pi_bulk.read_users(args.csv, REALM)
+    else:
+        users = itertools.repeat((args.username, REALM), count)
+
+    created = 0
+    try:
+        for serial, password in create_tokens(users, args.serial, args.chunk_size):
+            print("{0!s}: {1!s}".format(serial, password), flush=True)
+            created += 1
+    except Exception as err:
+        sys.stderr.write("Stopped after {0!s} created tokens, the current chunk was "
+                         "rolled back: {1!s}\n".format(created, err))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
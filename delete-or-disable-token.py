@@ -1,11 +1,7 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import get_tokens, enable_token
-from privacyidea.lib.tokenclass import ROLLOUTSTATE
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context, lazy_import
+import pi_bulk
 import argparse
-from flask_sqlalchemy import SQLAlchemy
-from privacyidea.app import create_app
 import datetime
 
 __doc__ = """
@@ -18,6 +14,19 @@ it takes the arguments
 
    delete-or-disable-token.py --user <existing user> --realm <user-realm>
 
+For an incident cleanup it can also run for all users of a realm or a
+resolver:
+
+   delete-or-disable-token.py --realm-wide --realm <realm> [--dry-run]
+   delete-or-disable-token.py --realm-wide --resolver <resolver> [--dry-run]
+
+In realm-wide mode the matching tokens (TOKENTYPES_TO_DELETE, ACTIVE,
+ROLLOUT_STATE) are selected with one query and disabled or deleted with one
+statement per chunk of CHUNK_SIZE tokens. Like in the library, locked tokens
+are not disabled. Each chunk is committed on its own. The log contains the
+uid of the token owner instead of the login name. The event handler mode
+uses the functions of the privacyIDEA library.
+
 You can place the script in your scripts directory /etc/privacyidea/scripts/
 and use it in the script event handler.
 
@@ -43,40 +52,91 @@ Adapt it (like the TOKENTYPE and ACTION) to your needs.
 TOKENTYPES_TO_DELETE = ["sms"]
 ACTIVE = True
 ACTION = "disable"
-#ACTION = "delete"
+# ACTION = "delete"
 LOGFILE = "/var/log/privacyidea/disabled-tokens.log"
 ROLLOUT_STATE = None
-#ROLLOUT_STATE = ROLLOUTSTATE.VERIFYPENDING
+# ROLLOUT_STATE = "verify"  # privacyidea.lib.tokenclass.ROLLOUTSTATE.VERIFYPENDING
+# The number of tokens, that are disabled or deleted in one transaction
+CHUNK_SIZE = 1000
 
+token_lib = lazy_import("privacyidea.lib.token")
+user_lib = lazy_import("privacyidea.lib.user")
 
-def modify_token(username, realm, ttypes):
-    app = create_app(config_name="production",
-                     config_file="/etc/privacyidea/pi.cfg",
-                     silent=True)
-
-    with app.app_context():
-        user_obj = User(username, realm)
-        if user_obj:
-            for ttype in ttypes:
-                # Get all active tokens of this types from this user
-                toks = get_tokens(user=user_obj, tokentype=ttype, active=ACTIVE, rollout_state=ROLLOUT_STATE)
-                # Delete all SMS tokens.
-                for tok_obj in toks:
-                    serial = tok_obj.token.serial
-                    if ACTION == "delete":
-                        tok_obj.delete_token()
-                    else:
-                        enable_token(serial, False)
-                    with open(LOGFILE, "a") as f:
-                        f.write(u"{0!s}, {1!s}, {2!s}, {3!s}, {4!s}\n".format(
-                            datetime.datetime.now().strftime("%Y-%m-%dT%H:%M"),
-                            args.username, args.realm, ACTION, serial))
 
+def modify_tokens(tokens):
+    """
+    Disable or delete the tokens in chunks and log each token. The log
+    contains the uid of the token owner.
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--user', dest='username')
-parser.add_argument('--realm', dest='realm')
-args = parser.parse_args()
+    :param tokens: list of pi_bulk.TokenRow
+    """
+    with open(LOGFILE, "a", buffering=1024 * 1024) as f:
+        for chunk in pi_bulk.chunked(tokens, CHUNK_SIZE):
+            if ACTION == "delete":
+                pi_bulk.delete_tokens(chunk)
+            else:
+                pi_bulk.set_active([tok.id for tok in chunk], False)
+            pi_bulk.commit()
+            now = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M")
+            f.writelines(u"{0!s}, {1!s}, {2!s}, {3!s}, {4!s}\n".format(
+                now, tok.user_id, tok.realm, ACTION, tok.serial) for tok in chunk)
 
-modify_token(args.username, args.realm, TOKENTYPES_TO_DELETE)
 
+def modify_token(username, realm, ttypes):
+    with app_context():
+        user_obj = user_lib.User(username, realm)
+        if user_obj:
+            with open(LOGFILE, "a") as f:
+                for ttype in ttypes:
+                    # Get all active tokens of this types from this user
+                    toks = token_lib.get_tokens(user=user_obj, tokentype=ttype, active=ACTIVE,
+                                                rollout_state=ROLLOUT_STATE)
+                    for tok_obj in toks:
+                        serial = tok_obj.token.serial
+                        if ACTION == "delete":
+                            tok_obj.delete_token()
+                        else:
+                            token_lib.enable_token(serial, False)
+                        f.write(u"{0!s}, {1!s}, {2!s}, {3!s}, {4!s}\n".format(
+                            datetime.datetime.now().strftime("%Y-%m-%dT%H:%M"),
+                            username, realm, ACTION, serial))
+
+
+def modify_realm_tokens(realm, resolver, ttypes, dry_run=False):
+    with app_context():
+        tokens = pi_bulk.find_tokens(tokentypes=ttypes, active=ACTIVE,
+                                     rollout_state=ROLLOUT_STATE,
+                                     realm=realm, resolver=resolver,
+                                     locked=None if ACTION == "delete" else False)
+        if dry_run:
+            for tok in tokens:
+                print("{0!s}: {1!s} token {2!s} of {3!s}@{4!s}".format(
+                    ACTION, tok.tokentype, tok.serial, tok.user_id, tok.realm))
+            print("Would {0!s} {1!s} tokens.".format(ACTION, len(tokens)))
+        else:
+            modify_tokens(tokens)
+            print("{0!s}d {1!s} tokens.".format(ACTION.capitalize(), len(tokens)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--user', dest='username')
+    parser.add_argument('--realm', dest='realm')
+    parser.add_argument('--resolver', dest='resolver',
+                        help="Only in realm-wide mode: the resolver of the users.")
+    parser.add_argument('--realm-wide', dest='realm_wide', action='store_true',
+                        help="Act on the tokens of all users of the realm or resolver.")
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help="Only in realm-wide mode: list the tokens without changing them.")
+    args = parser.parse_args(argv)
+
+    if args.realm_wide:
+        if not (args.realm or args.resolver):
+            parser.error("--realm-wide needs --realm or --resolver")
+        modify_realm_tokens(args.realm, args.resolver, TOKENTYPES_TO_DELETE, args.dry_run)
+    else:
+        modify_token(args.username, args.realm, TOKENTYPES_TO_DELETE)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from pi_csv import read_users
+from pi_rest import APIError, Client
 import argparse
-import requests
-import re
+import collections
+import concurrent.futures
 import sys
  
 __doc__ = """
@@ -13,6 +15,18 @@ This is a script that can be called by the privacyIDEA script handler.
 it takes the arguments
  
    delete-totp.py --user <existing user> --realm <original_realm>
+
+It can also delete the TOTP tokens of many users in one run. The users are
+read from a CSV file or stdin ("-") with the columns username and
+optionally realm:
+
+   delete-totp.py --users <file> [--realm <default realm>]
+
+The tokens are listed page by page (PAGESIZE) and deleted by WORKERS
+parallel requests, while the tokens of the next users are already listed.
+All requests share one auth token and one connection pool.
+The deleted serials are printed, each serial, that could not be deleted,
+is reported on stderr.
  
  
 You can place the script in your scripts directory /etc/privacyidea/scripts/
@@ -42,39 +56,111 @@ API_PASSWORD = "test"
 TOKENTYPE = "totp"
 REMOTE_SERVER = "https://localhost"
 VERIFY_TLS = False
+# The number of tokens, that are listed per request
+PAGESIZE = 100
+# The number of parallel delete requests
+WORKERS = 10
 
 
-def delete_token(username, realm):
+def list_serials(client, username, realm):
+    """
+    Return the serials of all tokens of the user, page by page.
+    """
     serials = []
+    params = {"user": username, "realm": realm, "type": TOKENTYPE, "pagesize": PAGESIZE}
+    page = 1
+    while page:
+        params["page"] = page
+        response = client.get('/token/', params=params)
+        if not response.ok:
+            raise APIError(response.error_message)
+        serials.extend(tok.get("serial") for tok in response.value.get("tokens", []))
+        page = response.value.get("next")
+    return serials
+
+
+def delete_serial(client, serial):
+    response = client.delete('/token/{0!s}'.format(serial))
+    if not response.ok:
+        raise APIError(response.error_message)
+
+
+def delete_token(client, executor, username, realm):
+    """
+    Delete the tokens of the user in parallel.
+
+    :return: list of (serial, error), the error is None for a deleted token
+    """
     if not username:
         raise Exception("No username specified!")
-    params = {"user": username}
-    params["realm"] = realm
-    params["type"] = TOKENTYPE
-    r = requests.post('{0!s}/auth'.format(REMOTE_SERVER), verify=VERIFY_TLS,
-                      data={"username": API_USER, "password": API_PASSWORD})
-    authorization = r.json().get("result").get("value").get("token")
-    r = requests.get('{0!s}/token/'.format(REMOTE_SERVER), verify=VERIFY_TLS,
-                     data=params,
-                     headers={"Authorization": authorization})
-    result_value = r.json().get("result").get("value")
-    if result_value.get("count") > 15:
-        # FIXME: We would have to take care, if the user had more than 15 TOTP tokens!
-        raise Exception("This script is bullocks. The user has more than 15 TOTP tokens.")
-    for tok in result_value.get("tokens"):
-        serial = tok.get("serial")
-        r = requests.delete('{0!s}/token/{1!s}'.format(REMOTE_SERVER, serial), verify=VERIFY_TLS,
-                            headers={"Authorization": authorization})
-        if r.status_code == 200:
-            serials.append(serial)
-    return serials
- 
- 
-parser = argparse.ArgumentParser()
-parser.add_argument('--user', dest='username')
-parser.add_argument('--realm', dest='realm')
-args = parser.parse_args()
-
-serials = delete_token(args.username, args.realm)
-for serial in serials:
-    print(serial)
\ No newline at end of file
+    # All pages are read before deleting, so that the pages do not shift
+    serials = list_serials(client, username, realm)
+    futures = {executor.submit(delete_serial, client, serial): serial for serial in serials}
+    results = []
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            future.result()
+            results.append((futures[future], None))
+        except Exception as err:
+            results.append((futures[future], err))
+    return results
+
+
+def print_result(username, realm, future):
+    """
+    Print the deleted serials of the user and the serials, that could not
+    be deleted.
+
+    :return: True, if a deletion failed
+    """
+    try:
+        results = future.result()
+    except Exception as err:
+        sys.stderr.write("Deleting the tokens of {0!s}@{1!s} failed: {2!s}\n".format(
+            username, realm, err))
+        return True
+    failed = False
+    for serial, err in results:
+        if err is None:
+            print(serial)
+        else:
+            failed = True
+            sys.stderr.write("Deleting the token {0!s} of {1!s}@{2!s} failed: {3!s}\n".format(
+                serial, username, realm, err))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--user', dest='username')
+    parser.add_argument('--realm', dest='realm')
+    parser.add_argument('--users', dest='users',
+                        help="CSV file with the columns username and realm, - for stdin.")
+    args = parser.parse_args(argv)
+
+    if args.users:
+        users = read_users(args.users, args.realm)
+    else:
+        users = [(args.username, args.realm)]
+    client = Client(REMOTE_SERVER, API_USER, API_PASSWORD, verify=VERIFY_TLS,
+                    pool_size=2 * WORKERS)
+    # Authenticate once before the requests are sent in parallel
+    client.token()
+    failed = False
+    # The users are handled in parallel, their tokens are deleted by a second pool
+    with concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS) as user_pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS) as delete_pool:
+        pending = collections.deque()
+        for username, realm in users:
+            pending.append((username, realm, user_pool.submit(delete_token, client, delete_pool,
+                                                              username, realm)))
+            if len(pending) >= 2 * WORKERS:
+                failed |= print_result(*pending.popleft())
+        while pending:
+            failed |= print_result(*pending.popleft())
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,7 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import get_tokens, enable_token
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context
+import pi_bulk
 import argparse
-from privacyidea.app import create_app
-import sys
 
 __doc__ = """
 This script is supposed to be called by the event handler after a token is created.
@@ -14,6 +11,16 @@ This script then checks if the user has a TAN token assigned and disables all TA
 
    disable-tan.py --user <username> --realm <realm>
 
+For a rollout it can also disable the TAN tokens of a list of users (a CSV
+file with the columns username and optionally realm, "-" reads stdin) or of
+all users of a realm:
+
+   disable-tan.py --users <file> [--realm <default realm>]
+   disable-tan.py --realm-wide --realm <realm>
+
+The tokens are selected by type in the database query and disabled with one
+statement per chunk of CHUNK_SIZE users or tokens.
+
 You can place the script in your scripts directory /etc/privacyidea/scripts/
 and use it in the script event handler.
 
@@ -50,23 +57,67 @@ Adapt it (like the DISABLE_TOKENTYPES) to your needs.
 # This is a list of users to create remote tokens for
 DISABLE_TOKENTYPES = ["tan"]
 CONFIG_FILE = "/etc/privacyidea/pi.cfg"
-
-
-def disable_tokens(user, realm):
-    app = create_app(config_name="production",
-                     config_file=CONFIG_FILE,
-                     silent=True)
-
-    with app.app_context():
-        user_obj = User(login=user, realm=realm)
-        tokens = get_tokens(user=user_obj, active=True)
-        for token in tokens:
-            if token.get_type() in DISABLE_TOKENTYPES:
-                enable_token(token.token.serial, False)
-                print("Disabled {0!s} token {1!s} for user {2!s}.".format(token.get_type(), token.token.serial, user))
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--user', dest='user')
-parser.add_argument('--realm', dest='realm')
-args = parser.parse_args()
-disable_tokens(args.user, args.realm)
+# The number of users or tokens, that are handled in one transaction
+CHUNK_SIZE = 1000
+
+
+def disable(tokens, owners=None):
+    """
+    Disable the tokens with one statement and print them. Locked tokens can
+    not be disabled, so they must not be passed.
+
+    :param tokens: list of pi_bulk.TokenRow
+    :param owners: dictionary of (resolver, uid) to (username, realm) for the output
+    """
+    if not tokens:
+        return
+    pi_bulk.set_active([tok.id for tok in tokens], False)
+    pi_bulk.commit()
+    owners = owners or {}
+    for tok in tokens:
+        user = owners.get((tok.resolver, tok.user_id), (tok.user_id, tok.realm))[0]
+        print("Disabled {0!s} token {1!s} for user {2!s}.".format(tok.tokentype, tok.serial, user))
+
+
+def disable_tokens(users):
+    """
+    Disable the tokens of the given users.
+
+    :param users: list of (username, realm)
+    """
+    with app_context(CONFIG_FILE):
+        for chunk in pi_bulk.chunked(users, CHUNK_SIZE):
+            owners = pi_bulk.resolve_users(chunk)
+            disable(pi_bulk.find_tokens(tokentypes=DISABLE_TOKENTYPES, active=True,
+                                        locked=False, owners=list(owners)), owners)
+
+
+def disable_realm_tokens(realm):
+    with app_context(CONFIG_FILE):
+        tokens = pi_bulk.find_tokens(tokentypes=DISABLE_TOKENTYPES, active=True, realm=realm,
+                                     locked=False)
+        for chunk in pi_bulk.chunked(tokens, CHUNK_SIZE):
+            disable(chunk)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--user', dest='user')
+    parser.add_argument('--realm', dest='realm')
+    parser.add_argument('--users', dest='users',
+                        help="CSV file with the columns username and realm, - for stdin.")
+    parser.add_argument('--realm-wide', dest='realm_wide', action='store_true',
+                        help="Disable the tokens of all users of the realm.")
+    args = parser.parse_args(argv)
+    if args.realm_wide:
+        if not args.realm:
+            parser.error("--realm-wide needs --realm")
+        disable_realm_tokens(args.realm)
+    elif args.users:
+        disable_tokens(pi_bulk.read_users(args.users, args.realm))
+    else:
+        disable_tokens([(args.user, args.realm)])
+
+
+if __name__ == "__main__":
+    main()
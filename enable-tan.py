@@ -1,10 +1,7 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import get_token_owner, enable_token, get_tokens
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context, lazy_import
+import pi_bulk
 import argparse
-from privacyidea.app import create_app
-import sys
 
 __doc__ = """
 This script is supposed to be called by the event handler before a token is deleted.
@@ -14,6 +11,16 @@ This script then checks, if the token owner has a TAN token assigned and enables
 
    enable-tan.py --serial <serialnumber>
 
+For a rollout it can also enable the TAN tokens of a list of users (a CSV
+file with the columns username and optionally realm, "-" reads stdin) or of
+all users of a realm:
+
+   enable-tan.py --users <file> [--realm <default realm>]
+   enable-tan.py --realm-wide --realm <realm>
+
+The tokens are selected by type in the database query and enabled with one
+statement per chunk of CHUNK_SIZE users or tokens.
+
 You can place the script in your scripts directory /etc/privacyidea/scripts/
 and use it in the script event handler.
 
@@ -49,23 +56,83 @@ Adapt it (like the ENABLE_TOKENTYPES) to your needs.
 # This is a list of users to create remote tokens for
 ENABLE_TOKENTYPES = ["tan"]
 CONFIG_FILE = "/etc/privacyidea/pi.cfg"
+# The number of users or tokens, that are handled in one transaction
+CHUNK_SIZE = 1000
+
+token_lib = lazy_import("privacyidea.lib.token")
+
+
+def enable(tokens, owners=None):
+    """
+    Enable the tokens with one statement and print them. Locked and revoked
+    tokens can not be enabled, so they must not be passed.
+
+    :param tokens: list of pi_bulk.TokenRow
+    :param owners: dictionary of (resolver, uid) to (username, realm) for the output
+    """
+    if not tokens:
+        return
+    pi_bulk.set_active([tok.id for tok in tokens], True)
+    pi_bulk.commit()
+    owners = owners or {}
+    for tok in tokens:
+        user = owners.get((tok.resolver, tok.user_id), (tok.user_id, tok.realm))[0]
+        print("Enabled {0!s} token {1!s} for user {2!s}.".format(tok.tokentype, tok.serial, user))
 
 
 def enable_tokens(serial):
-    app = create_app(config_name="production",
-                     config_file=CONFIG_FILE,
-                     silent=True)
-
-    with app.app_context():
-        user_obj = get_token_owner(serial)
-        tokens = get_tokens(user=user_obj, active=False)
-        for token in tokens:
-            if token.get_type() in ENABLE_TOKENTYPES:
-                enable_token(token.token.serial, True)
-                print("Enabled {0!s} token {1!s} for user {2!s}.".format(token.get_type(), token.token.serial,
-                                                                         user_obj.login))
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', dest='serial')
-args = parser.parse_args()
-enable_tokens(args.serial)
+    with app_context(CONFIG_FILE):
+        user_obj = token_lib.get_token_owner(serial)
+        if user_obj:
+            owners = {(user_obj.resolver, str(user_obj.uid)): (user_obj.login, user_obj.realm)}
+            enable(pi_bulk.find_tokens(tokentypes=ENABLE_TOKENTYPES, active=False,
+                                       locked=False, revoked=False,
+                                       owners=list(owners)), owners)
+
+
+def enable_user_tokens(users):
+    """
+    Enable the tokens of the given users.
+
+    :param users: list of (username, realm)
+    """
+    with app_context(CONFIG_FILE):
+        for chunk in pi_bulk.chunked(users, CHUNK_SIZE):
+            owners = pi_bulk.resolve_users(chunk)
+            enable(pi_bulk.find_tokens(tokentypes=ENABLE_TOKENTYPES, active=False,
+                                       locked=False, revoked=False,
+                                       owners=list(owners)), owners)
+
+
+def enable_realm_tokens(realm):
+    with app_context(CONFIG_FILE):
+        tokens = pi_bulk.find_tokens(tokentypes=ENABLE_TOKENTYPES, active=False, realm=realm,
+                                     locked=False, revoked=False)
+        for chunk in pi_bulk.chunked(tokens, CHUNK_SIZE):
+            enable(chunk)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial')
+    parser.add_argument('--user', dest='user')
+    parser.add_argument('--realm', dest='realm')
+    parser.add_argument('--users', dest='users',
+                        help="CSV file with the columns username and realm, - for stdin.")
+    parser.add_argument('--realm-wide', dest='realm_wide', action='store_true',
+                        help="Enable the tokens of all users of the realm.")
+    args = parser.parse_args(argv)
+    if args.realm_wide:
+        if not args.realm:
+            parser.error("--realm-wide needs --realm")
+        enable_realm_tokens(args.realm)
+    elif args.users:
+        enable_user_tokens(pi_bulk.read_users(args.users, args.realm))
+    elif args.user:
+        enable_user_tokens([(args.user, args.realm)])
+    else:
+        enable_tokens(args.serial)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/opt/privacyidea/bin/python
+# -*- coding: utf-8 -*-
+from pi_bootstrap import app_context, load_script, transaction
+import argparse
+import datetime
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+__doc__ = """
+This script spools the actions of event handler scripts, that fire for every
+enrolled token, and applies them in batches.
+
+Scripts like add_tokeninfo_timestamp.py or attach_offline.py are called at
+each token_init. During a mass rollout each call creates its own privacyIDEA
+app and its own transaction. Instead, the event handler can call this script,
+which only writes the action to a local SQLite spool and returns immediately.
+Enqueuing only uses the Python standard library.
+
+   handler-spool.py enqueue attach_offline.py --serial <serial>
+
+The name of the script can also be taken from a symlink with the prefix
+"spool-" in your scripts directory, which you then configure in the script
+event handler:
+
+   ln -s handler-spool.py spool-attach_offline.py
+   spool-attach_offline.py --serial <serial>
+
+A worker drains the spool, e.g. from a systemd unit or cron:
+
+   handler-spool.py drain [--loop]
+
+The worker creates the privacyIDEA app only once. It coalesces the spooled
+actions per serial and applies each batch in one app context and one database
+transaction:
+
+ * duplicate actions are only applied once,
+ * the timestamp of add_tokeninfo_timestamp.py is the time of the event and
+   the earliest timestamp of a serial wins,
+ * unassign_ssh_token.py supersedes all earlier ssh assignments of the serial.
+
+If a batch fails, its actions are applied one by one, so that a single
+failing token does not block the others. Actions, that failed MAX_ATTEMPTS
+times, stay in the spool with the state "failed".
+
+The actions call the functions of the spooled scripts, so the configuration
+(like SSH_HOST or PIN) is the one of the scripts.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+SPOOL_FILE = '/var/lib/privacyidea/handler-spool.sqlite'
+SPOOL_PREFIX = "spool-"
+SPOOLED_SCRIPTS = ["add_tokeninfo_timestamp.py",
+                   "attach_offline.py",
+                   "assign_ssh_token.py",
+                   "unassign_ssh_token.py",
+                   "set-pin.py"]
+# The number of spooled actions, that are read and applied in one transaction
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 3
+# seconds to wait for new actions in --loop mode
+POLL_INTERVAL = 5
+
+log = logging.getLogger("privacyidea.scripts.handler-spool")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    enqueued REAL NOT NULL,
+    script TEXT NOT NULL,
+    argv TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+)
+"""
+
+
+def open_spool(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SCHEMA)
+    return conn
+
+
+def enqueue(path, script, argv):
+    if script not in SPOOLED_SCRIPTS:
+        sys.stderr.write("The script {0!s} can not be spooled.\n".format(script))
+        sys.exit(2)
+    conn = open_spool(path)
+    try:
+        conn.execute("INSERT INTO spool (enqueued, script, argv) VALUES (?, ?, ?)",
+                     (time.time(), script, json.dumps(argv)))
+    finally:
+        conn.close()
+
+
+def parse_action(argv):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--serial', dest='serial')
+    parser.add_argument('--user', dest='username')
+    args, unknown = parser.parse_known_args(argv)
+    return args
+
+
+def coalesce(entries):
+    """
+    Reduce the spooled actions to the operations, that need to be applied.
+
+    :param entries: list of (id, enqueued, script, argv) ordered by id
+    :return: list of operations. Each operation is a dictionary with the
+        script, the serial, the user, the time of the event and the ids of all
+        spooled actions, that are covered by this operation.
+    """
+    ops = {}
+    for entry_id, enqueued, script, argv in entries:
+        args = parse_action(json.loads(argv))
+        serial = args.serial
+        if script == "assign_ssh_token.py":
+            key = (script, serial, args.username)
+        else:
+            key = (script, serial)
+        ids = [entry_id]
+        if script == "unassign_ssh_token.py":
+            # Detaching the token makes earlier assignments obsolete
+            for old_key in [k for k in ops if k[0] == "assign_ssh_token.py" and k[1] == serial]:
+                ids.extend(ops.pop(old_key)["ids"])
+        if key in ops:
+            if script in ["assign_ssh_token.py", "unassign_ssh_token.py"]:
+                # The last action wins, so it is moved to the end
+                ids.extend(ops.pop(key)["ids"])
+            else:
+                # Duplicates are only applied once, the earliest event wins
+                ops[key]["ids"].extend(ids)
+                continue
+        ops[key] = {"script": script, "serial": serial, "username": args.username,
+                    "enqueued": enqueued, "ids": ids}
+    return list(ops.values())
+
+
+class Worker(object):
+    """
+    Applies the spooled actions with the functions of the spooled scripts,
+    which share the app context and the transaction of the batch.
+    """
+
+    def __init__(self, spool_path):
+        self.conn = open_spool(spool_path)
+        self.scripts = {script: load_script(script) for script in SPOOLED_SCRIPTS}
+
+    def apply(self, op):
+        script = op["script"]
+        module = self.scripts[script]
+        serial = op["serial"]
+        if script == "add_tokeninfo_timestamp.py":
+            event_time = datetime.datetime.fromtimestamp(op["enqueued"])
+            module.add_tokeninfo_creation_time(
+                serial, module.tokeninfo_key,
+                event_time.strftime(module.tokenclass_lib.DATE_FORMAT))
+        elif script == "attach_offline.py":
+            module.attach_offline(serial)
+        elif script == "assign_ssh_token.py":
+            module.assign_ssh_token(serial, op["username"])
+        elif script == "unassign_ssh_token.py":
+            module.unassign_ssh_token(serial)
+        elif script == "set-pin.py":
+            module.setpin(serial)
+
+    def done(self, ids):
+        self.conn.executemany("DELETE FROM spool WHERE id = ?", [(i,) for i in ids])
+
+    def failed(self, ids, err):
+        self.conn.executemany("UPDATE spool SET attempts = attempts + 1, error = ?, "
+                              "state = CASE WHEN attempts + 1 >= ? THEN 'failed' "
+                              "ELSE state END WHERE id = ?",
+                              [(str(err), MAX_ATTEMPTS, i) for i in ids])
+
+    def drain_batch(self):
+        """
+        Apply the next batch of spooled actions.
+
+        :return: the number of spooled actions, that were processed
+        """
+        entries = self.conn.execute("SELECT id, enqueued, script, argv FROM spool "
+                                    "WHERE state = 'pending' ORDER BY id LIMIT ?",
+                                    (BATCH_SIZE,)).fetchall()
+        if not entries:
+            return 0
+        ops = coalesce(entries)
+        with app_context():
+            try:
+                with transaction():
+                    for op in ops:
+                        self.apply(op)
+                self.done([entry[0] for entry in entries])
+                log.info("Applied {0!s} spooled actions as {1!s} "
+                         "operations.".format(len(entries), len(ops)))
+            except Exception as err:
+                log.warning("Batch failed ({0!s}), applying the actions one by one.".format(err))
+                for op in ops:
+                    try:
+                        with transaction():
+                            self.apply(op)
+                        self.done(op["ids"])
+                    except Exception as op_err:
+                        log.error("{0!s} for serial {1!s} failed: "
+                                  "{2!s}".format(op["script"], op["serial"], op_err))
+                        self.failed(op["ids"], op_err)
+        return len(entries)
+
+    def drain(self, loop=False):
+        while True:
+            if not self.drain_batch():
+                if not loop:
+                    break
+                time.sleep(POLL_INTERVAL)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+        name = os.path.basename(sys.argv[0])
+        if name.startswith(SPOOL_PREFIX):
+            enqueue(SPOOL_FILE, name[len(SPOOL_PREFIX):], argv)
+            return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spool', dest='spool', default=SPOOL_FILE,
+                        help="The SQLite file of the spool.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    enqueue_parser = subparsers.add_parser('enqueue', help="Spool an action of a script.")
+    enqueue_parser.add_argument('script', help="The script of the action.")
+    enqueue_parser.add_argument('arguments', nargs=argparse.REMAINDER,
+                                help="The arguments of the script.")
+    drain_parser = subparsers.add_parser('drain', help="Apply the spooled actions.")
+    drain_parser.add_argument('--loop', dest='loop', action='store_true',
+                              help="Keep waiting for new actions.")
+    args = parser.parse_args(argv)
+
+    if args.command == 'enqueue':
+        enqueue(args.spool, args.script, args.arguments)
+    else:
+        # Only one worker may drain the spool at a time
+        with open(args.spool + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            Worker(args.spool).drain(loop=args.loop)
+
+
+if __name__ == "__main__":
+    main()
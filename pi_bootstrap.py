@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Shared bootstrap for the scripts in this directory.
+
+The event handler scripts are short-lived, so their startup time matters.
+This module only uses the Python standard library at import time. The
+privacyIDEA modules are imported lazily on first use and the privacyIDEA app
+is created only once per config file:
+
+    from pi_bootstrap import app_context, lazy_import
+
+    token_lib = lazy_import("privacyidea.lib.token")
+
+    with app_context():
+        token_lib.set_pin(serial, "1234")
+
+If the environment variable PI_SCRIPTS_IMPORT_REPORT is set, the time spent
+in each lazy import and in create_app is written to stderr when the script
+exits. The same data is returned by import_report().
+
+The config file defaults to the environment variable PRIVACYIDEA_CONFIGFILE
+and then to /etc/privacyidea/pi.cfg.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+import atexit
+import contextlib
+import importlib
+import importlib.util
+import os
+import re
+import sys
+import time
+
+PI_CONFIG = os.environ.get("PRIVACYIDEA_CONFIGFILE", "/etc/privacyidea/pi.cfg")
+# The directory of the scripts, that can be loaded with load_script()
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_apps = {}
+_scripts = {}
+_report = []
+
+
+def _timed(name, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    _report.append((name, time.perf_counter() - start))
+    return result
+
+
+class LazyModule(object):
+    """
+    A placeholder for a module, that is imported on the first attribute access.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            if self._name in sys.modules:
+                self._module = sys.modules[self._name]
+            else:
+                self._module = _timed(self._name, importlib.import_module, self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return "<lazy module {0!s}>".format(self._name)
+
+
+def lazy_import(name):
+    """
+    Return a placeholder for the module, that imports the module on first use.
+
+    :param name: The full name of the module like "privacyidea.lib.token"
+    """
+    return LazyModule(name)
+
+
+def get_app(config_file=None):
+    """
+    Return the privacyIDEA app for the config file. The app is only created
+    once per config file, so that long-running processes reuse the app and
+    its database connection pool.
+    """
+    config_file = config_file or PI_CONFIG
+    if config_file not in _apps:
+        app_module = lazy_import("privacyidea.app")
+        _apps[config_file] = _timed("create_app", app_module.create_app,
+                                    config_name="production",
+                                    config_file=config_file,
+                                    silent=True)
+    return _apps[config_file]
+
+
+def apps():
+    """
+    Return the apps, that were created so far.
+    """
+    return list(_apps.values())
+
+
+@contextlib.contextmanager
+def app_context(config_file=None):
+    """
+    Push an app context of the cached app. Each context gets its own
+    database session. Within an app context of the same app, no new context
+    is pushed, so that the functions of the scripts share the session and
+    the transaction of the caller.
+    """
+    from flask import current_app, has_app_context
+    app = get_app(config_file)
+    if has_app_context() and current_app._get_current_object() is app:
+        yield
+        return
+    with app.app_context():
+        yield
+
+
+@contextlib.contextmanager
+def transaction():
+    """
+    The privacyIDEA library commits after each change. Within this context
+    the commits of the library only flush the changes to the database, so
+    that all changes are committed once at the end or rolled back together.
+    It must be used within an app context. A nested transaction is part of
+    the outer transaction.
+    """
+    from privacyidea.models import db
+    session = db.session
+    if "commit" in vars(session):
+        yield
+        return
+    session.commit = session.flush
+    try:
+        try:
+            yield
+        finally:
+            del session.commit
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+
+
+def load_script(script):
+    """
+    Load a script of this directory like "set-pin.py" as a module. The
+    script is only executed once, later calls return the same module.
+    """
+    if script not in _scripts:
+        module_name = "pi_script_{0!s}".format(re.sub(r"\W", "_", script[:-3]))
+        spec = importlib.util.spec_from_file_location(module_name,
+                                                      os.path.join(SCRIPT_DIR, script))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _scripts[script] = module
+    return _scripts[script]
+
+
+def import_report():
+    """
+    Return a list of (name, seconds) of the lazy imports and the app creation.
+    """
+    return list(_report)
+
+
+def _write_report():
+    for name, seconds in _report:
+        sys.stderr.write("{0:40} {1:8.3f} s\n".format(name, seconds))
+
+
+if os.environ.get("PI_SCRIPTS_IMPORT_REPORT"):
+    atexit.register(_write_report)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Set-based token operations for the scripts in this directory.
+
+The functions of privacyidea.lib.token work on one token object at a time and
+commit after each change. For realm-wide runs this means one query and one
+commit per token. The functions in this module select the tokens with one
+query and change them with one statement per chunk of CHUNK_SIZE tokens:
+
+    from pi_bootstrap import app_context
+    import pi_bulk
+
+    with app_context():
+        tokens = pi_bulk.find_tokens(tokentypes=["sms"], realm="defrealm")
+        for chunk in pi_bulk.chunked(tokens):
+            pi_bulk.set_active([tok.id for tok in chunk], False)
+            pi_bulk.commit()
+
+The functions must be used within an app context. Like the library they
+only write to the token tables, no audit entries are written.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+from pi_bootstrap import lazy_import
+# read_users is also used by the scripts, that import pi_bulk
+from pi_csv import read_users  # noqa: F401
+import collections
+import itertools
+import sys
+
+# The number of tokens, that are changed with one statement
+CHUNK_SIZE = 1000
+
+models = lazy_import("privacyidea.models")
+user_lib = lazy_import("privacyidea.lib.user")
+sqlalchemy = lazy_import("sqlalchemy")
+
+TokenRow = collections.namedtuple("TokenRow", ["id", "serial", "tokentype", "active",
+                                               "rollout_state", "user_id", "resolver",
+                                               "realm"])
+
+
+def chunked(items, size=CHUNK_SIZE):
+    """
+    Split the items into lists of at most size items.
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def resolve_users(users):
+    """
+    Resolve the users to their resolver and uid. Users, that do not exist,
+    are skipped with a message on stderr.
+
+    :param users: list of (username, realm)
+    :return: dictionary of (resolver, uid) to (username, realm)
+    """
+    owners = collections.OrderedDict()
+    for username, realm in users:
+        try:
+            user_obj = user_lib.User(username, realm)
+        except Exception as err:
+            sys.stderr.write("User {0!s}@{1!s} could not be resolved: {2!s}\n".format(
+                username, realm, err))
+            continue
+        if not user_obj:
+            sys.stderr.write("User {0!s}@{1!s} does not exist.\n".format(username, realm))
+            continue
+        owners[(user_obj.resolver, str(user_obj.uid))] = (username, realm)
+    return owners
+
+
+def find_tokens(tokentypes=None, active=None, rollout_state=None, realm=None,
+                resolver=None, user_id=None, serials=None, owners=None, locked=None,
+                revoked=None):
+    """
+    Select all matching tokens with their owner in one query.
+
+    :param tokentypes: list of token types like ["sms", "email"]
+    :param active: True or False to only select enabled or disabled tokens
+    :param rollout_state: only select tokens with this rollout state
+    :param realm: only select tokens of users in this realm
+    :param resolver: only select tokens of users in this resolver
+    :param user_id: only select tokens of the user with this uid in the resolver
+    :param serials: only select tokens with these serials
+    :param owners: only select tokens of these users, a list of (resolver, uid)
+    :param locked: True or False to only select locked or not locked tokens
+    :param revoked: True or False to only select revoked or not revoked tokens
+    :return: list of TokenRow. A token with several owners is only returned once.
+    """
+    if owners is not None and not owners:
+        return []
+    Token = models.Token
+    TokenOwner = models.TokenOwner
+    Realm = models.Realm
+    query = models.db.session.query(Token.id, Token.serial, Token.tokentype, Token.active,
+                                    Token.rollout_state, TokenOwner.user_id,
+                                    TokenOwner.resolver, Realm.name)
+    query = query.outerjoin(TokenOwner, TokenOwner.token_id == Token.id)
+    query = query.outerjoin(Realm, Realm.id == TokenOwner.realm_id)
+    if tokentypes:
+        query = query.filter(Token.tokentype.in_([t.lower() for t in tokentypes]))
+    if active is not None:
+        query = query.filter(Token.active == bool(active))
+    if rollout_state is not None:
+        query = query.filter(Token.rollout_state == rollout_state)
+    if locked is not None:
+        query = query.filter(Token.locked == bool(locked))
+    if revoked is not None:
+        query = query.filter(Token.revoked == bool(revoked))
+    if realm:
+        query = query.filter(Realm.name == realm.lower())
+    if resolver:
+        query = query.filter(TokenOwner.resolver == resolver)
+    if user_id is not None:
+        query = query.filter(TokenOwner.user_id == str(user_id))
+    if serials is not None:
+        query = query.filter(Token.serial.in_(list(serials)))
+    if owners is not None:
+        uids = collections.defaultdict(list)
+        for owner_resolver, owner_uid in owners:
+            uids[owner_resolver].append(str(owner_uid))
+        query = query.filter(sqlalchemy.or_(*[sqlalchemy.and_(TokenOwner.resolver == res,
+                                                              TokenOwner.user_id.in_(ids))
+                                              for res, ids in uids.items()]))
+    tokens = collections.OrderedDict()
+    for row in query.order_by(Token.id):
+        if row[0] not in tokens:
+            tokens[row[0]] = TokenRow(*row)
+    return list(tokens.values())
+
+
+def get_tokeninfo(token_ids, key):
+    """
+    Read one tokeninfo value of many tokens with one query.
+
+    :return: dictionary of token id to value. Tokens without the key are missing.
+    """
+    TokenInfo = models.TokenInfo
+    query = models.db.session.query(TokenInfo.token_id, TokenInfo.Value).filter(
+        TokenInfo.Key == key, TokenInfo.token_id.in_(list(token_ids)))
+    return dict(query)
+
+
+def match_tokeninfo(tokens, tokeninfo):
+    """
+    Return the ids of the tokens, that have all the given tokeninfo values.
+    One query is run per tokeninfo key.
+
+    :param tokens: list of TokenRow
+    :param tokeninfo: dictionary like {"tokenkind": "software"}. If it is
+        empty, all tokens match.
+    :return: set of token ids
+    """
+    token_ids = set(tok.id for tok in tokens)
+    for key, value in (tokeninfo or {}).items():
+        values = get_tokeninfo(token_ids, key)
+        token_ids = set(token_id for token_id, info in values.items() if info == value)
+    return token_ids
+
+
+def plan_removal(tokens, remove):
+    """
+    Split a snapshot of tokens into the tokens to remove and the remaining
+    tokens, so that the remaining tokens need not be queried again after
+    the removal.
+
+    :param tokens: list of TokenRow
+    :param remove: function, that returns True for a TokenRow to remove
+    :return: tuple of the list of tokens to remove and the list of remaining tokens
+    """
+    removal = []
+    remaining = []
+    for tok in tokens:
+        (removal if remove(tok) else remaining).append(tok)
+    return removal, remaining
+
+
+def set_active(token_ids, active=True):
+    """
+    Enable or disable the tokens with one UPDATE statement. Like enable_token
+    of the library, locked tokens are neither enabled nor disabled and
+    revoked tokens are not enabled.
+
+    :return: the number of changed tokens
+    """
+    Token = models.Token
+    query = models.db.session.query(Token).filter(Token.id.in_(list(token_ids)))
+    query = query.filter(Token.locked == False)  # noqa: E712
+    if active:
+        query = query.filter(Token.revoked == False)  # noqa: E712
+    return query.update({Token.active: bool(active)}, synchronize_session=False)
+
+
+def reset_failcount(token_ids):
+    """
+    Reset the fail counter of the tokens with one UPDATE statement.
+
+    :return: the number of changed tokens
+    """
+    Token = models.Token
+    return models.db.session.query(Token).filter(Token.id.in_(list(token_ids))).update(
+        {Token.failcount: 0}, synchronize_session=False)
+
+
+def _delete_where(table, column, values):
+    """
+    Delete the rows of the table, whose column is in values. Rows of other
+    tables, that reference these rows by a foreign key, are deleted first.
+    """
+    for child in models.db.metadata.sorted_tables:
+        if child is table:
+            continue
+        for fk in child.foreign_keys:
+            if fk.column.table is table:
+                referenced = sqlalchemy.select(fk.column).where(column.in_(values))
+                _delete_where(child, fk.parent, referenced)
+    models.db.session.execute(table.delete().where(column.in_(values)))
+
+
+def delete_tokens(tokens):
+    """
+    Delete the tokens and all rows, that belong to them (tokeninfo, owners,
+    realms, machine attachments, challenges, ...) with a few DELETE
+    statements. The dependent tables are taken from the foreign keys of the
+    privacyIDEA models, so that this works for different privacyIDEA versions.
+
+    :param tokens: list of TokenRow
+    :return: the number of deleted tokens
+    """
+    token_ids = [tok.id for tok in tokens]
+    if not token_ids:
+        return 0
+    # Challenges only reference the token by serial
+    challenge = models.Challenge.__table__
+    models.db.session.execute(challenge.delete().where(
+        challenge.c.serial.in_([tok.serial for tok in tokens])))
+    token_table = models.Token.__table__
+    _delete_where(token_table, token_table.c.id, token_ids)
+    return len(token_ids)
+
+
+def delete_machine_tokens(machinetoken_ids):
+    """
+    Detach tokens from machines by deleting the machine token rows and their
+    options with a few DELETE statements.
+
+    :param machinetoken_ids: list of ids of the MachineToken table
+    :return: the number of deleted attachments
+    """
+    machinetoken_ids = list(machinetoken_ids)
+    if machinetoken_ids:
+        table = models.MachineToken.__table__
+        _delete_where(table, table.c.id, machinetoken_ids)
+    return len(machinetoken_ids)
+
+
+def commit():
+    models.db.session.commit()
+
+
+def rollback():
+    models.db.session.rollback()
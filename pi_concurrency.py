@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive concurrency for the bulk scripts, that use the privacyIDEA REST API.
+
+The limiter measures the latency and the errors of the requests and adapts
+the number of requests in flight with AIMD (additive increase,
+multiplicative decrease):
+
+ * a round ends after as many requests as the current limit, whatever
+   their outcome,
+ * after a round of successful requests the limit is increased by
+   INCREASE, if the limit is used,
+ * on a server error (5xx), a timeout or a connection error, or if the
+   average latency rises above LATENCY_TOLERANCE times the best average
+   latency seen so far, the limit is multiplied by DECREASE. The limit is
+   decreased at most once per round, so that one slow burst does not
+   collapse the limit, but it keeps decreasing while the errors or the
+   slow requests go on.
+
+This keeps bulk runs from overloading privacyIDEA nodes, that also serve
+live /validate/check requests. The threads of a script acquire a slot for
+each request:
+
+    limiter = AdaptiveLimiter(maximum=32)
+    with limiter.slot():
+        start = time.monotonic()
+        r = session.post(...)
+        limiter.record("/token/init", time.monotonic() - start, r.status_code >= 500)
+
+pi_rest.Client does this for every request, if it gets a limiter. The
+current limit, the requests in flight, the latency per path and the error
+rate are written to stderr every REPORT_INTERVAL seconds.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+import contextlib
+import sys
+import threading
+import time
+
+INCREASE = 1
+DECREASE = 0.7
+# The average latency may rise to this factor of the best average latency
+LATENCY_TOLERANCE = 2.0
+# weight of a new latency in the moving average
+LATENCY_SMOOTHING = 0.1
+# seconds between two status lines on stderr, 0 disables the status
+REPORT_INTERVAL = 5
+
+
+class AdaptiveLimiter(object):
+
+    def __init__(self, initial=4, minimum=1, maximum=64, report_interval=REPORT_INTERVAL,
+                 out=sys.stderr):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.report_interval = report_interval
+        self.out = out
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        # moving average of the latency per path
+        self.latency = {}
+        self.average = None
+        self.best_average = None
+        # requests and successful requests in the current round
+        self.round_requests = 0
+        self.round_done = 0
+        self.decreased_in_round = False
+        self.requests = 0
+        self.errors = 0
+        self.last_report = time.monotonic()
+        self.last_requests = 0
+        self.last_errors = 0
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Wait until a request may be sent.
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify()
+
+    def _smooth(self, old, value):
+        return value if old is None else old + LATENCY_SMOOTHING * (value - old)
+
+    def _new_round(self):
+        self.round_requests = 0
+        self.round_done = 0
+        self.decreased_in_round = False
+
+    def _decrease(self):
+        if not self.decreased_in_round:
+            self.limit = max(self.minimum, self.limit * DECREASE)
+            self.decreased_in_round = True
+
+    def record(self, path, latency, error=False):
+        """
+        Record the result of a request and adapt the limit.
+
+        :param path: the path of the request like "/token/init"
+        :param latency: the duration of the request in seconds
+        :param error: True for a server error, a timeout or a connection error
+        """
+        with self.condition:
+            self.requests += 1
+            self.round_requests += 1
+            self.latency[path] = self._smooth(self.latency.get(path), latency)
+            if error:
+                self.errors += 1
+                self._decrease()
+            else:
+                self.average = self._smooth(self.average, latency)
+                # Only learn the best latency after a few requests
+                if self.requests > 10:
+                    if self.best_average is None or self.average < self.best_average:
+                        self.best_average = self.average
+                if self.best_average and self.average > LATENCY_TOLERANCE * self.best_average:
+                    self._decrease()
+                else:
+                    self.round_done += 1
+                    # Only increase the limit, if the script uses it
+                    if self.round_done >= int(self.limit) and self.in_flight >= int(self.limit) - 1:
+                        self.limit = min(self.maximum, self.limit + INCREASE)
+                        self._new_round()
+            if self.round_requests >= int(self.limit):
+                self._new_round()
+            self.condition.notify_all()
+            self._report()
+
+    def _report(self):
+        now = time.monotonic()
+        if not self.report_interval or now - self.last_report < self.report_interval:
+            return
+        requests = self.requests - self.last_requests
+        errors = self.errors - self.last_errors
+        self.out.write("concurrency {0:d}, in flight {1:d}, {2:.1f} req/s, errors {3:.1%}, "
+                       "latency {4!s}\n".format(
+                           int(self.limit), self.in_flight,
+                           requests / (now - self.last_report),
+                           errors / requests if requests else 0,
+                           ", ".join("{0!s} {1:.0f} ms".format(path, value * 1000)
+                                     for path, value in sorted(self.latency.items()))))
+        self.out.flush()
+        self.last_report = now
+        self.last_requests = self.requests
+        self.last_errors = self.errors
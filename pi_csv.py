@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Readers for the CSV files of the scripts in this directory.
+
+This module only uses the Python standard library, so that the scripts,
+that use the privacyIDEA REST API, can read the same user files as the
+scripts, that use the privacyIDEA library, without its Python environment:
+
+    from pi_csv import read_users
+
+    for username, realm in read_users("users.csv", "defrealm"):
+        print(username, realm)
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+import csv
+import sys
+
+
+def read_users(path, realm=None):
+    """
+    Read the users from a CSV file with the columns username and optionally
+    realm. Empty lines and lines starting with # are skipped. The path "-"
+    reads from stdin.
+
+    :param realm: the realm of the users without a realm column
+    :return: generator of (username, realm)
+    """
+    f = sys.stdin if path == "-" else open(path, newline="")
+    try:
+        for row in csv.reader(f):
+            if not row or not row[0].strip() or row[0].startswith("#"):
+                continue
+            user_realm = row[1].strip() if len(row) > 1 and row[1].strip() else realm
+            yield row[0].strip(), user_realm
+    finally:
+        if f is not sys.stdin:
+            f.close()
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Shared client for the scripts, that use the privacyIDEA REST API.
+
+The client authenticates only once and keeps one keep-alive session with a
+connection pool, so that the TLS handshake is not repeated for every request:
+
+    from pi_rest import Client
+
+    client = Client("https://localhost", "admin", "test", verify=False)
+    response = client.post("/token/init", data={"type": "registration",
+                                                "user": "alice", "realm": "defrealm"})
+    if response.ok:
+        print(response.detail.get("serial"))
+
+The admin JWT is cached in memory and in the file JWT_CACHE_FILE until
+JWT_EXPIRY_MARGIN seconds before it expires. The cache file is locked, so
+that scripts running in parallel share one /auth request. Each response is
+parsed only once. If the cache file can not be used, the client logs one
+warning and only caches in memory.
+
+If the client gets a pi_concurrency.AdaptiveLimiter, each request waits for
+a slot of the limiter and its latency and server errors are recorded, so
+that the number of requests in flight adapts to the load of the server.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+import base64
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+
+import requests
+import requests.adapters
+
+# The file, in which the JWTs are cached. Set it to None to only cache in memory.
+JWT_CACHE_FILE = os.environ.get("PI_SCRIPTS_JWT_CACHE",
+                                os.path.expanduser("~/.cache/privacyidea-scripts/jwt.json"))
+# The URL of a privacyIDEA server, that replaces the URL of the scripts, e.g. of a
+# stand-in server for benchmarks
+URL_OVERRIDE = os.environ.get("PI_SCRIPTS_URL")
+# seconds before the expiry of the JWT, in which a new JWT is requested
+JWT_EXPIRY_MARGIN = 60
+# assumed validity of a JWT, if the expiry can not be read from the JWT
+JWT_DEFAULT_VALIDITY = 600
+# seconds to wait for a response
+TIMEOUT = 30
+# The number of keep-alive connections to the server
+POOL_SIZE = 20
+
+log = logging.getLogger("privacyidea.scripts.pi_rest")
+
+
+class APIError(Exception):
+    pass
+
+
+class APIResponse(object):
+    """
+    The parsed response of the privacyIDEA API.
+    """
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        self.result = body.get("result") or {}
+        self.detail = body.get("detail") or {}
+        self.value = self.result.get("value")
+        self.error = self.result.get("error") or {}
+
+    @property
+    def ok(self):
+        return self.status_code == 200 and self.result.get("status") is True
+
+    @property
+    def error_message(self):
+        return self.error.get("message") or "HTTP status {0!s}".format(self.status_code)
+
+
+def jwt_expiry(token):
+    """
+    Read the expiry time from the payload of the JWT.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload.encode("ascii")))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return time.time() + JWT_DEFAULT_VALIDITY
+
+
+class Client(object):
+
+    def __init__(self, url, username, password, verify=True, cache_file=JWT_CACHE_FILE,
+                 timeout=TIMEOUT, pool_size=POOL_SIZE, limiter=None):
+        self.url = (URL_OVERRIDE or url).rstrip("/")
+        self.username = username
+        self.password = password
+        self.verify = verify
+        self.cache_file = cache_file
+        self.timeout = timeout
+        self.limiter = limiter
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._token = None
+        self._expiry = 0
+        # The password is not part of the key, a changed password invalidates the JWT anyway
+        self._cache_key = hashlib.sha256("{0!s} {1!s}".format(self.url, username)
+                                         .encode("utf-8")).hexdigest()
+
+    def _valid(self, expiry):
+        return expiry - JWT_EXPIRY_MARGIN > time.time()
+
+    def _disable_cache(self, err):
+        log.warning("The JWT cache file {0!s} can not be used, the JWT is only cached in "
+                    "memory: {1!s}".format(self.cache_file, err))
+        self.cache_file = None
+
+    def _open_cache(self):
+        """
+        Open and lock the cache file.
+
+        :return: the locked file or None, if the file can not be used
+        """
+        try:
+            directory = os.path.dirname(self.cache_file)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+            fd = os.open(self.cache_file, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as err:
+            self._disable_cache(err)
+            return None
+        f = os.fdopen(fd, "r+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        except OSError as err:
+            f.close()
+            self._disable_cache(err)
+            return None
+        return f
+
+    @contextlib.contextmanager
+    def _locked_cache(self):
+        """
+        Lock the cache file and yield its content. Changes of the content are
+        written back. If the file can not be used, an empty content is
+        yielded and the file cache is disabled.
+        """
+        f = self._open_cache()
+        if f is None:
+            yield {}
+            return
+        with f:
+            try:
+                cache = json.loads(f.read() or "{}")
+            except ValueError:
+                cache = {}
+            except OSError as err:
+                self._disable_cache(err)
+                cache = {}
+            before = dict(cache)
+            yield cache
+            if self.cache_file and cache != before:
+                try:
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(cache))
+                    f.flush()
+                except OSError as err:
+                    self._disable_cache(err)
+
+    def _authenticate(self):
+        r = self.session.post(self.url + "/auth", timeout=self.timeout, verify=self.verify,
+                              data={"username": self.username, "password": self.password})
+        response = APIResponse(r)
+        if not response.ok:
+            raise APIError("Authentication at {0!s} failed: {1!s}".format(
+                self.url, response.error_message))
+        token = response.value.get("token")
+        return token, jwt_expiry(token)
+
+    def token(self):
+        """
+        Return a valid JWT. A new JWT is only requested, if neither the
+        memory nor the file cache contain one.
+        """
+        if self._token and self._valid(self._expiry):
+            return self._token
+        if not self.cache_file:
+            self._token, self._expiry = self._authenticate()
+            return self._token
+        with self._locked_cache() as cache:
+            now = time.time()
+            for key in [k for k, v in cache.items() if v.get("exp", 0) < now]:
+                del cache[key]
+            entry = cache.get(self._cache_key)
+            if entry and self._valid(entry["exp"]):
+                self._token, self._expiry = entry["token"], entry["exp"]
+            else:
+                self._token, self._expiry = self._authenticate()
+                cache[self._cache_key] = {"token": self._token, "exp": self._expiry}
+        return self._token
+
+    def invalidate(self):
+        """
+        Forget the JWT, e.g. if the server did not accept it.
+        """
+        token = self._token
+        self._token = None
+        self._expiry = 0
+        if self.cache_file and token:
+            with self._locked_cache() as cache:
+                if cache.get(self._cache_key, {}).get("token") == token:
+                    del cache[self._cache_key]
+
+    def request(self, method, path, **kwargs):
+        """
+        Send an authenticated request. If the JWT is rejected, the client
+        authenticates again and repeats the request once.
+
+        :param path: the path like "/token/init"
+        :return: APIResponse
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", self.verify)
+        headers = dict(kwargs.pop("headers", None) or {})
+        for attempt in range(2):
+            headers["Authorization"] = self.token()
+            r = self._send(method, path, headers=headers, **kwargs)
+            if r.status_code != 401 or attempt:
+                return APIResponse(r)
+            self.invalidate()
+
+    def _send(self, method, path, **kwargs):
+        if not self.limiter:
+            return self.session.request(method, self.url + path, **kwargs)
+        with self.limiter.slot():
+            start = time.monotonic()
+            try:
+                r = self.session.request(method, self.url + path, **kwargs)
+            except requests.RequestException:
+                self.limiter.record(path, time.monotonic() - start, error=True)
+                raise
+            self.limiter.record(path, time.monotonic() - start, error=r.status_code >= 500)
+        return r
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        self.session.close()
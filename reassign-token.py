@@ -1,9 +1,6 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import unassign_token, assign_token
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context, lazy_import
 import argparse
-from flask_sqlalchemy import SQLAlchemy
 
 __doc__ = """
 This is a script that can be called by the privacyIDEA script handler.
@@ -35,25 +32,27 @@ Adapt it (like the NEW_REALM) to your needs.
 
 NEW_REALM = "new_realm"
 
+token_lib = lazy_import("privacyidea.lib.token")
+user_lib = lazy_import("privacyidea.lib.user")
+
 
 def reassign_token(serial, username):
-    app = Flask(__name__, static_folder="static",
-                template_folder="static/templates")
-    app.config.from_pyfile("/etc/privacyidea/pi.cfg", silent=True)
-    db = SQLAlchemy()
-    db.init_app(app)
-    
-    with app.app_context():
+    with app_context():
         # Set global values
-        unassign_token(serial)
-        assign_token(serial, User(username, NEW_REALM))
+        token_lib.unassign_token(serial)
+        token_lib.assign_token(serial, user_lib.User(username, NEW_REALM))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial')
+    parser.add_argument('--user', dest='username')
+    args = parser.parse_args(argv)
 
+    # reassign the token to a new realm
+    if args.serial and args.username:
+        reassign_token(args.serial, args.username)
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', dest='serial')
-parser.add_argument('--user', dest='username')
-args = parser.parse_args()
 
-# reassign the token to a new realm
-if args.serial and args.username:
-    reassign_token(args.serial, args.username)
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,8 @@
 #!/opt/privacyidea/bin/python
 
-from privacyidea.lib.token import get_tokens, get_one_token, remove_token
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context
+import pi_bulk
 import argparse
-from privacyidea.app import create_app
 import logging
 
 __doc__ = """
@@ -26,6 +25,10 @@ You can place the script in your scripts directory /etc/privacyidea/scripts/
 and use it in the script event handler. It logs with level info and debug to
 the privacyidea log file.
 
+All tokens of the user are read with one query. The tokens to remove are
+planned in memory and deleted in one transaction. The remaining tokens are
+logged from the same snapshot.
+
 Adapt REMOVE_OTHER_TOKENS_PER, ONLY_ACTIVE and TOKENINFO to your needs.
 
 (c) 2021, Henning Hollermann <henning.hollermann@netknights.it>
@@ -56,40 +59,46 @@ log = logging.getLogger("privacyidea.scripts.remove-other-user-tokens")
 
 
 def remove_other_tokens(serial, username, realm):
-    user_obj = User(login=username, realm=realm)
-    # get the token which was enrolled during the triggering /token/init
-    token_obj = get_one_token(serial=serial, user=user_obj)
-    if token_obj:
-        tokentype = token_obj.type if REMOVE_OTHER_TOKENS_PER == "type" else None
-        active = True if ONLY_ACTIVE is True else None
+    owners = pi_bulk.resolve_users([(username, realm)])
+    # get all tokens of the user at once
+    tokens = pi_bulk.find_tokens(owners=list(owners))
+    # the token which was enrolled during the triggering /token/init
+    enrolled = [tok for tok in tokens if tok.serial == serial]
+    if enrolled:
+        tokentype = enrolled[0].tokentype if REMOVE_OTHER_TOKENS_PER == "type" else None
+        matching = pi_bulk.match_tokeninfo(tokens, TOKENINFO)
+        removal, remaining = pi_bulk.plan_removal(
+            tokens, lambda tok: (tok.serial != serial and tok.id in matching
+                                 and (tokentype is None or tok.tokentype == tokentype)
+                                 and (tok.active or ONLY_ACTIVE is not True)))
         # remove tokens if any
-        for tok in get_tokens(user=user_obj, tokentype=tokentype, active=active,
-                              tokeninfo=TOKENINFO or None):
-            if tok.token.serial and tok.token.serial != serial:
-                remove_token(serial=tok.token.serial)
-                log.debug("- Remove token with serial {0!s}".format(tok.token.serial))
+        pi_bulk.delete_tokens(removal)
+        pi_bulk.commit()
+        for tok in removal:
+            log.debug("- Remove token with serial {0!s}".format(tok.serial))
         # check remaining tokens
-        remaining_tokens = get_tokens(user=user_obj)
         log.debug("User {0!s}@{1!s} has {2!s} remaining tokens."
-                  "".format(username, realm, len(remaining_tokens)))
-        for tok in remaining_tokens:
-            log.debug("~ a {0!s} token with serial {1!s}".format(tok.type.upper(),
-                                                                 tok.token.serial))
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', required=True, dest='serial',
-                    help="The serial of the enrolled token.")
-parser.add_argument('--user', required=True, dest='username',
-                    help="The username of the user of whom other tokens will be removed.")
-parser.add_argument('--realm', required=True, dest='realm',
-                    help="The realm of the user to act on.")
-args = parser.parse_args()
-
-app = create_app(config_name="production",
-                 config_file="/etc/privacyidea/pi.cfg",
-                 silent=True)
-
-with app.app_context():
-    log.info("Starting script to remove tokens different from {0!s} per {1!s} with tokeninfo {2}"
-             "".format(args.serial, REMOVE_OTHER_TOKENS_PER, TOKENINFO))
-    remove_other_tokens(args.serial, args.username, args.realm)
+                  "".format(username, realm, len(remaining)))
+        for tok in remaining:
+            log.debug("~ a {0!s} token with serial {1!s}".format(tok.tokentype.upper(),
+                                                                 tok.serial))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', required=True, dest='serial',
+                        help="The serial of the enrolled token.")
+    parser.add_argument('--user', required=True, dest='username',
+                        help="The username of the user of whom other tokens will be removed.")
+    parser.add_argument('--realm', required=True, dest='realm',
+                        help="The realm of the user to act on.")
+    args = parser.parse_args(argv)
+
+    with app_context():
+        log.info("Starting script to remove tokens different from {0!s} per {1!s} "
+                 "with tokeninfo {2}".format(args.serial, REMOVE_OTHER_TOKENS_PER, TOKENINFO))
+        remove_other_tokens(args.serial, args.username, args.realm)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
 #!/opt/privacyidea/bin/python
 
-from privacyidea.lib.token import get_tokens, remove_token
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context
+import pi_bulk
 import argparse
-from privacyidea.app import create_app
+import collections
 import logging
 
 __doc__ = """
@@ -23,6 +23,16 @@ It takes the arguments
 
    remove-user-tokens.py --user <user> --realm <realm>
 
+To clean up before the enrollment of a whole cohort, it can also take a CSV
+file with the columns username and optionally realm ("-" reads stdin):
+
+   remove-user-tokens.py --users <file> [--realm <default realm>]
+
+All tokens of the users are read with one query per chunk of CHUNK_SIZE
+users. The tokens to remove are planned in memory and deleted in one
+transaction per chunk. The remaining tokens are logged from the same
+snapshot.
+
 You can place the script in your scripts directory /etc/privacyidea/scripts/
 and use it in the script event handler. It logs with level info and debug to
 the privacyidea log file.
@@ -52,41 +62,66 @@ REMOVE_TYPE = "totp"
 ONLY_ACTIVE = True
 # remove only tokens which have the following tokeninfo
 TOKENINFO = {"tokenkind": "software"}
+# The number of users, that are handled in one transaction
+CHUNK_SIZE = 500
 
 log = logging.getLogger("privacyidea.scripts.remove-other-tokens")
 
 
-def remove_user_tokens(username, realm):
-    user_obj = User(login=username, realm=realm)
-    # get the token which was enrolled during the triggering /token/init
-    active = True if ONLY_ACTIVE is True else None
+def remove_user_tokens(users):
+    """
+    Remove the tokens of the given users.
+
+    :param users: list of (username, realm)
+    """
     tokentype = None if REMOVE_TYPE == "all" else REMOVE_TYPE.lower()
-    # remove tokens if any
-    for tok in get_tokens(user=user_obj, tokentype=tokentype, active=active,
-                          tokeninfo=TOKENINFO or None):
-        if tok.token.serial:
-            remove_token(serial=tok.token.serial)
-            log.debug("- Remove token with serial {0!s}".format(tok.token.serial))
-    # check remaining tokens
-    remaining_tokens = get_tokens(user=user_obj)
-    log.debug("User {0!s}@{1!s} has {2!s} remaining tokens."
-              "".format(username, realm, len(remaining_tokens)))
-    for tok in remaining_tokens:
-        log.debug("~ a {0!s} token with serial {1!s}".format(tok.type.upper(),
-                                                             tok.token.serial))
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--user', required=True, dest='username',
-                    help="The username of the user of whom the tokens will be removed.")
-parser.add_argument('--realm', required=True, dest='realm',
-                    help="The realm of the user to act on.")
-args = parser.parse_args()
-
-app = create_app(config_name="production",
-                 config_file="/etc/privacyidea/pi.cfg",
-                 silent=True)
-
-with app.app_context():
-    log.info("Starting script to remove tokens of type {0!s} with tokeninfo {1}"
-             "".format(REMOVE_TYPE, TOKENINFO))
-    remove_user_tokens(args.username, args.realm)
+    for chunk in pi_bulk.chunked(users, CHUNK_SIZE):
+        owners = pi_bulk.resolve_users(chunk)
+        # get all tokens of the users at once
+        tokens = pi_bulk.find_tokens(owners=list(owners))
+        matching = pi_bulk.match_tokeninfo(tokens, TOKENINFO)
+        removal, remaining = pi_bulk.plan_removal(
+            tokens, lambda tok: (tok.id in matching
+                                 and (tokentype is None or tok.tokentype == tokentype)
+                                 and (tok.active or ONLY_ACTIVE is not True)))
+        # remove tokens if any
+        pi_bulk.delete_tokens(removal)
+        pi_bulk.commit()
+        for tok in removal:
+            log.debug("- Remove token with serial {0!s}".format(tok.serial))
+        # log the remaining tokens of each user
+        remaining_tokens = collections.defaultdict(list)
+        for tok in remaining:
+            remaining_tokens[(tok.resolver, tok.user_id)].append(tok)
+        for owner, (username, realm) in owners.items():
+            log.debug("User {0!s}@{1!s} has {2!s} remaining tokens."
+                      "".format(username, realm, len(remaining_tokens[owner])))
+            for tok in remaining_tokens[owner]:
+                log.debug("~ a {0!s} token with serial {1!s}".format(tok.tokentype.upper(),
+                                                                     tok.serial))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--user', dest='username',
+                        help="The username of the user of whom the tokens will be removed.")
+    parser.add_argument('--realm', dest='realm',
+                        help="The realm of the user to act on.")
+    parser.add_argument('--users', dest='users',
+                        help="CSV file with the columns username and realm, - for stdin.")
+    args = parser.parse_args(argv)
+    if args.users:
+        users = pi_bulk.read_users(args.users, args.realm)
+    elif args.username and args.realm:
+        users = [(args.username, args.realm)]
+    else:
+        parser.error("either --user and --realm or --users are required")
+
+    with app_context():
+        log.info("Starting script to remove tokens of type {0!s} with tokeninfo {1}"
+                 "".format(REMOVE_TYPE, TOKENINFO))
+        remove_user_tokens(users)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,7 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import get_tokens
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context, lazy_import
+import pi_bulk
 import argparse
-from flask_sqlalchemy import SQLAlchemy
-from privacyidea.app import create_app
-import re
-import sys
  
 __doc__ = """
 This script resets the failcounter of all remote tokens 
@@ -20,6 +15,15 @@ it takes the arguments
  
    reset-failcounter.py --user <user> --realm <realm>
  
+After a lockout storm it can reset the remote tokens of all users of a realm:
+
+   reset-failcounter.py --realm-wide --realm <realm>
+
+The linked serials (tokeninfo remote.serial) and the linked tokens are read
+with one query each. The failcounters of the remote and the linked tokens
+are reset with one statement in one transaction per chunk of CHUNK_SIZE
+remote tokens.
+
  You can place the script in your scripts directory /etc/privacyidea/scripts/
 and use it in the script event handler.
  
@@ -41,35 +45,71 @@ Adapt it (like the TOKENTYPE and REALM) to your needs.
     Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 """
 
+# The number of remote tokens, that are handled in one transaction
+CHUNK_SIZE = 1000
+
+user_lib = lazy_import("privacyidea.lib.user")
+
+
+def reset_tokens(remote_tokens):
+    """
+    Reset the failcounters of the remote tokens and their linked tokens in
+    one transaction. The linked serials are read with one query and the
+    linked tokens are selected with one query.
+
+    :param remote_tokens: list of pi_bulk.TokenRow of remote tokens
+    """
+    if not remote_tokens:
+        return
+    r_serials = pi_bulk.get_tokeninfo([tok.id for tok in remote_tokens], "remote.serial")
+    linked = {tok.serial: tok for tok in pi_bulk.find_tokens(serials=set(r_serials.values()))}
+    token_ids = [tok.id for tok in remote_tokens] + [tok.id for tok in linked.values()]
+    pi_bulk.reset_failcount(token_ids)
+    pi_bulk.commit()
+    for tok in remote_tokens:
+        r_serial = r_serials.get(tok.id)
+        if r_serial in linked:
+            print("Reset failcounter of remote token {0!s} and linked token {1!s}".format(
+                tok.serial, r_serial))
+
 
 def reset_failcounter(username, realm):
     """
     find all remote tokens of a user and reset the failcounters of the linked tokens.
     """
-    app = create_app(config_name="production",
-                     config_file="/etc/privacyidea/pi.cfg",
-                     silent=True)
- 
-    with (app.app_context()):
-        # get all remote tokens of the user
-        toks = get_tokens(tokentype="remote", user=User(username, realm))
-        for tok in toks:
-            # Reset this own failcounter
-            tok.set_failcount(0)
-            tok.save()
-            r_serial = tok.get_tokeninfo("remote.serial")
-            # Find the linked token
-            r_toks = get_tokens(serial=r_serial)
-            if r_toks:
-                linked_tok = r_toks[0]
-                linked_tok.set_failcount(0)
-                linked_tok.save()
-                print(f"Reset failcounter of remote token {tok.get_serial()} and linked token {r_serial}")
+    with app_context():
+        user_obj = user_lib.User(username, realm)
+        if user_obj:
+            # get all remote tokens of the user
+            reset_tokens(pi_bulk.find_tokens(tokentypes=["remote"], resolver=user_obj.resolver,
+                                             user_id=user_obj.uid))
+
+
+def reset_realm_failcounters(realm):
+    """
+    Reset the failcounters of the remote tokens of all users in the realm.
+    """
+    with app_context():
+        tokens = pi_bulk.find_tokens(tokentypes=["remote"], realm=realm)
+        for chunk in pi_bulk.chunked(tokens, CHUNK_SIZE):
+            reset_tokens(chunk)
 
  
-parser = argparse.ArgumentParser()
-parser.add_argument('--user', dest='user')
-parser.add_argument('--realm', dest='realm')
-args = parser.parse_args()
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--user', dest='user')
+    parser.add_argument('--realm', dest='realm')
+    parser.add_argument('--realm-wide', dest='realm_wide', action='store_true',
+                        help="Reset the remote tokens of all users of the realm.")
+    args = parser.parse_args(argv)
+
+    if args.realm_wide:
+        if not args.realm:
+            parser.error("--realm-wide needs --realm")
+        reset_realm_failcounters(args.realm)
+    else:
+        reset_failcounter(args.user, args.realm)
+
 
-reset_failcounter(args.user, args.realm)
+if __name__ == "__main__":
+    main()
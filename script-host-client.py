@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import json
+import os
+import socket
+import sys
+
+__doc__ = """
+This is the client for the script host (script-host.py). It can be called
+by the privacyIDEA script handler instead of the actual script.
+
+It only uses the Python standard library, so that it starts fast. It sends
+the name of the script and the arguments to the script host, which runs the
+script in its already initialized privacyIDEA app. The output and the return
+code of the script are passed through.
+
+   script-host-client.py set-pin.py --serial <existing serial>
+
+If the client is called via a symlink with the prefix "hosted-", the script
+name is taken from the name of the symlink:
+
+   ln -s script-host-client.py hosted-set-pin.py
+   hosted-set-pin.py --serial <existing serial>
+
+If the script host is not running, the script is executed directly, if
+FALLBACK_DIRECT is set. An executable script is run with the interpreter of
+its shebang, otherwise with FALLBACK_PYTHON.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+SOCKET_PATH = '/run/privacyidea/script-host.sock'
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+HOSTED_PREFIX = "hosted-"
+# seconds to wait for the script to finish
+TIMEOUT = 120
+# run the script directly, if the script host can not be reached
+FALLBACK_DIRECT = True
+# The interpreter for the direct run of a script, that is not executable.
+# Executable scripts are run with the interpreter of their shebang.
+FALLBACK_PYTHON = "/opt/privacyidea/bin/python"
+
+
+def connect():
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(TIMEOUT)
+    try:
+        sock.connect(SOCKET_PATH)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def call_host(sock, script, argv):
+    """
+    Send the request to the script host and return the response.
+    """
+    request = {"script": script, "argv": argv}
+    sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+    data = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    # The response is empty, if the forked child of the host died
+    response = json.loads(data.decode("utf-8"))
+    if not isinstance(response, dict):
+        raise ValueError("The response is not a JSON object.")
+    return response
+
+
+def main():
+    name = os.path.basename(sys.argv[0])
+    if name.startswith(HOSTED_PREFIX):
+        script = name[len(HOSTED_PREFIX):]
+        argv = sys.argv[1:]
+    elif len(sys.argv) > 1:
+        script = sys.argv[1]
+        argv = sys.argv[2:]
+    else:
+        sys.stderr.write("Usage: {0!s} <script> [arguments]\n".format(name))
+        sys.exit(2)
+
+    try:
+        sock = connect()
+    except OSError as err:
+        if not FALLBACK_DIRECT:
+            sys.stderr.write("Could not reach the script host: {0!s}\n".format(err))
+            sys.exit(1)
+        # Only fall back, if the request was not sent, so that the script is never run twice
+        path = os.path.join(SCRIPT_DIR, os.path.basename(script))
+        if not os.path.isfile(path):
+            sys.stderr.write("Could not reach the script host and there is no script "
+                             "{0!s}.\n".format(path))
+            sys.exit(1)
+        try:
+            if os.access(path, os.X_OK):
+                os.execv(path, [path] + argv)
+            os.execv(FALLBACK_PYTHON, [FALLBACK_PYTHON, path] + argv)
+        except OSError as err:
+            sys.stderr.write("Could not reach the script host and could not run the script "
+                             "{0!s}: {1!s}\n".format(path, err))
+            sys.exit(1)
+
+    with sock:
+        try:
+            response = call_host(sock, script, argv)
+        except socket.timeout:
+            # The request was sent, so the script must not be run again
+            sys.stderr.write("The script host did not answer within {0!s} seconds, the script "
+                             "{1!s} may still be running.\n".format(TIMEOUT, script))
+            sys.exit(1)
+        except ValueError as err:
+            sys.stderr.write("The script host returned no valid response for the script "
+                             "{0!s}: {1!s}\n".format(script, err))
+            sys.exit(1)
+    sys.stdout.write(response.get("stdout", ""))
+    sys.stderr.write(response.get("stderr", ""))
+    sys.exit(response.get("returncode", 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/opt/privacyidea/bin/python
+# -*- coding: utf-8 -*-
+
+import pi_bootstrap
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+import traceback
+
+__doc__ = """
+This is a long-running host process for the event handler scripts in this
+directory.
+
+Each event handler script usually calls create_app() on every event. The
+Python start, the imports of privacyIDEA and the creation of the app take a
+lot longer than the actual database operation. This host creates the
+privacyIDEA app only once, keeps the database connection pool of the app and
+runs the scripts in-process. It listens on a Unix socket for requests of the
+small client script-host-client.py.
+
+Start the host as the user, that runs privacyIDEA, e.g. with a systemd unit:
+
+   script-host.py [--socket /run/privacyidea/script-host.sock]
+
+In the script event handler use the client instead of the script itself. The
+client can either be called with the name of the script as first argument
+
+   script-host-client.py set-pin.py --serial <serial>
+
+or you create a symlink with the prefix "hosted-" in your scripts directory:
+
+   ln -s script-host-client.py hosted-set-pin.py
+
+and configure "hosted-set-pin.py" in the script event handler.
+
+Only the scripts listed in HOSTED_SCRIPTS are run. The scripts need to
+provide a function main(argv). The script modules are loaded only once, so
+module level values are not recalculated per event.
+
+Scripts, that need to run process-isolated, can be listed in ISOLATED_SCRIPTS.
+With the option --isolate all scripts are run isolated. The host then works
+like a zygote: the privacyIDEA modules in PRELOAD_MODULES, the app and the
+scripts are loaded once and for each event a child process is forked, that
+runs the main function of the script with a fresh database session and exits
+afterwards. Forking only takes milliseconds, while a fresh interpreter needs
+seconds. Isolated events are run in parallel up to MAX_CHILDREN processes.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+SOCKET_PATH = '/run/privacyidea/script-host.sock'
+# The scripts, that may be run by the host
+HOSTED_SCRIPTS = ["add_tokeninfo_timestamp.py",
+                  "assign_ssh_token.py",
+                  "attach_offline.py",
+                  "create-remote-and-spass.py",
+                  "create-remote-tokens.py",
+                  "create-token.py",
+                  "delete-or-disable-token.py",
+                  "disable-tan.py",
+                  "enable-tan.py",
+                  "reassign-token.py",
+                  "remove-other-user-tokens.py",
+                  "remove-user-tokens-pre.py",
+                  "reset-failcounter.py",
+                  "set-pin.py",
+                  "unassign_ssh_token.py"]
+# The scripts, that are run in a forked child process
+ISOLATED_SCRIPTS = []
+# The modules, that are imported before the children are forked
+PRELOAD_MODULES = ["privacyidea.app",
+                   "privacyidea.lib.token",
+                   "privacyidea.lib.user",
+                   "privacyidea.lib.machine"]
+# The maximum number of isolated scripts running at the same time
+MAX_CHILDREN = 40
+
+log = logging.getLogger("privacyidea.scripts.script-host")
+
+
+def load_script(script):
+    """
+    Load the given script as a module and return it.
+
+    The scripts create their app with pi_bootstrap, so all scripts share the
+    app of the host. Each script still pushes its own app context, so that
+    every event gets a fresh database session from the pool of the app.
+
+    :param script: The file name of the script like "set-pin.py"
+    :return: The module of the script
+    """
+    if script not in HOSTED_SCRIPTS:
+        raise ValueError("The script {0!s} is not hosted.".format(script))
+    return pi_bootstrap.load_script(script)
+
+
+def exit_code(code):
+    """
+    Convert the code of a SystemExit to a return code like the interpreter does.
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write("{0!s}\n".format(code))
+    return 1
+
+
+def run_script(script, argv):
+    """
+    Run the main function of the script with the given arguments.
+
+    :return: dictionary with the returncode and the output of the script
+    """
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    returncode = 0
+    if script not in HOSTED_SCRIPTS:
+        return {"returncode": 2, "stdout": "",
+                "stderr": "The script {0!s} is not hosted.\n".format(script)}
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            load_script(script).main(argv)
+        except SystemExit as exx:
+            returncode = exit_code(exx.code)
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+    return {"returncode": returncode,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue()}
+
+
+def reset_after_fork():
+    """
+    Drop the database connections, that the child inherited from the host.
+
+    The connections are not closed, since they still belong to the host.
+    The child opens its own connections on first use.
+    """
+    from privacyidea.models import db
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for app in pi_bootstrap.apps():
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+
+class ScriptRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one request of the client. The request is a single JSON line like
+    {"script": "set-pin.py", "argv": ["--serial", "HOTP0001"]}
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            script = request.get("script")
+            argv = [str(x) for x in request.get("argv", [])]
+        except (ValueError, AttributeError) as err:
+            response = {"returncode": 2, "stdout": "",
+                        "stderr": "Invalid request: {0!s}\n".format(err)}
+        else:
+            if self.server.is_isolated(script):
+                self.fork(script, argv)
+                return
+            log.debug("Running {0!s} {1!s}".format(script, argv))
+            response = run_script(script, argv)
+            log.info("{0!s} finished with return code {1!s}".format(script,
+                                                                   response["returncode"]))
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+    def fork(self, script, argv):
+        """
+        Run the script in a child process. The child answers the client and
+        the host continues with the next request.
+        """
+        self.server.wait_for_child_slot()
+        pid = os.fork()
+        if pid:
+            log.debug("Running {0!s} {1!s} in child {2!s}".format(script, argv, pid))
+            self.server.add_child(pid, self.request)
+            return
+        returncode = 1
+        try:
+            reset_after_fork()
+            response = run_script(script, argv)
+            returncode = response["returncode"]
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        finally:
+            os._exit(returncode)
+
+
+class ScriptHost(socketserver.UnixStreamServer):
+    """
+    The requests are handled one after another. The scripts write to stdout,
+    which is redirected per request, so the requests must not run in parallel
+    in the host. Only isolated scripts run in parallel in child processes.
+    """
+
+    def __init__(self, server_address, handler_class, isolate_all=False):
+        self.isolate_all = isolate_all
+        self.children = set()
+        self.handed_over = set()
+        super().__init__(server_address, handler_class)
+
+    def is_isolated(self, script):
+        return self.isolate_all or script in ISOLATED_SCRIPTS
+
+    def add_child(self, pid, request):
+        self.children.add(pid)
+        # The connection now belongs to the child
+        self.handed_over.add(request)
+
+    def collect_children(self, blocking=False):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, 0 if blocking else os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                break
+            if not pid:
+                break
+            self.children.discard(pid)
+            log.info("Child {0!s} finished with return code {1!s}".format(
+                pid, os.waitstatus_to_exitcode(status)))
+            if blocking:
+                break
+
+    def wait_for_child_slot(self):
+        self.collect_children()
+        while len(self.children) >= MAX_CHILDREN:
+            self.collect_children(blocking=True)
+
+    def service_actions(self):
+        self.collect_children()
+
+    def shutdown_request(self, request):
+        if request in self.handed_over:
+            # Do not shut down the connection, the child is still answering
+            self.handed_over.discard(request)
+            self.close_request(request)
+        else:
+            super().shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def _terminate(signum, frame):
+    sys.exit(0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', dest='socket', default=SOCKET_PATH,
+                        help="The Unix socket to listen on.")
+    parser.add_argument('--isolate', dest='isolate', action='store_true',
+                        help="Run every script in a forked child process.")
+    args = parser.parse_args(argv)
+
+    # Import the modules, create the app and load the scripts before the first
+    # event arrives. Forked children inherit all of it.
+    for module_name in PRELOAD_MODULES:
+        importlib.import_module(module_name)
+    pi_bootstrap.get_app()
+    for script in HOSTED_SCRIPTS:
+        load_script(script)
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    server = ScriptHost(args.socket, ScriptRequestHandler, isolate_all=args.isolate)
+    os.chmod(args.socket, 0o660)
+    signal.signal(signal.SIGTERM, _terminate)
+    log.info("Script host listening on {0!s}".format(args.socket))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
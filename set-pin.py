@@ -1,12 +1,6 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import set_pin
-from privacyidea.lib.user import User
+from pi_bootstrap import app_context, lazy_import
 import argparse
-from flask_sqlalchemy import SQLAlchemy
-from privacyidea.lib.utils import BASE58
-from privacyidea.lib.crypto import generate_password
-from privacyidea.app import create_app
 
 __doc__ = """
 This scripts sets the pin for a token by serial number.
@@ -40,19 +34,22 @@ Adapt it (like the TOKENTYPE and REALM) to your needs.
 
 PIN = "1234"
 
+token_lib = lazy_import("privacyidea.lib.token")
 
-def setpin(serial):
-    app = create_app(config_name="production",
-                     config_file="/etc/privacyidea/pi.cfg",
-                     silent=True)
 
-    with app.app_context():
+def setpin(serial):
+    with app_context():
         # Set global values
-        set_pin(serial, PIN)
+        token_lib.set_pin(serial, PIN)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial')
+    args = parser.parse_args(argv)
+    setpin(args.serial)
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', dest='serial')
-args = parser.parse_args()
-setpin(args.serial)
+if __name__ == "__main__":
+    main()
 
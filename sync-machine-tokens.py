@@ -0,0 +1,260 @@
+#!/opt/privacyidea/bin/python
+# -*- coding: utf-8 -*-
+from pi_bootstrap import app_context, lazy_import, transaction
+import pi_bulk
+import argparse
+import collections
+import csv
+import sys
+
+__doc__ = """
+This script syncs the machine attachments of tokens (SSH keys and offline
+tokens) with a manifest.
+
+assign_ssh_token.py, unassign_ssh_token.py and attach_offline.py attach or
+detach one serial per call. To manage many SSH keys on many hosts, this
+script reads the desired state from a CSV manifest with the columns
+
+   serial, application, hostname, user
+
+e.g.
+
+   SSHK0001, ssh, web01.example.com, root
+   HOTP0001, offline, ,
+
+and compares it with the current attachments, that are read with two
+queries. Only the missing attachments are attached and only the surplus
+attachments are detached, in transactions of BATCH_SIZE operations. If a
+transaction fails, its operations are applied one by one.
+
+   sync-machine-tokens.py manifest.csv [--dry-run] [--prune-all]
+
+Only attachments of the applications, that are listed in the manifest, are
+detached. By default only the serials of the manifest are detached from
+machines, which are not listed for them. With --prune-all all attachments of
+these applications, that are not in the manifest, are detached.
+
+The machines of all machine resolvers are listed once and each hostname must
+match the hostname of exactly one machine. The attachments of a serial and
+application, that has a line with a hostname, that does not match exactly one
+machine, are not detached.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+# The applications, that can be synced
+APPLICATIONS = ["ssh", "offline"]
+# The number of attach or detach operations, that are applied in one transaction
+BATCH_SIZE = 500
+
+machine_lib = lazy_import("privacyidea.lib.machine")
+models = lazy_import("privacyidea.models")
+
+Attachment = collections.namedtuple("Attachment", ["serial", "application", "resolver_id",
+                                                   "machine_id", "user"])
+
+
+def read_manifest(path):
+    """
+    Read the manifest. Empty lines and lines starting with # are skipped.
+
+    :return: list of (serial, application, hostname, user)
+    """
+    entries = []
+    with open(path, newline="") as f:
+        for lineno, row in enumerate(csv.reader(f), 1):
+            row = [column.strip() for column in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            row += [""] * (4 - len(row))
+            serial, application, hostname, user = row[:4]
+            if application not in APPLICATIONS:
+                sys.stderr.write("Line {0!s}: unknown application {1!s}.\n".format(lineno,
+                                                                                   application))
+                continue
+            entries.append((serial, application, hostname, user))
+    return entries
+
+
+def resolve_hosts(hostnames):
+    """
+    List the machines of all machine resolvers once and match the hostnames
+    exactly with the hostnames of the machines.
+
+    :return: dictionary of hostname to (resolver id, machine id). Hostnames,
+        that do not match exactly one machine, are missing.
+    """
+    MachineResolver = models.MachineResolver
+    resolver_ids = dict(models.db.session.query(MachineResolver.name, MachineResolver.id))
+    matches = {hostname: [] for hostname in hostnames if hostname}
+    if matches:
+        for machine in machine_lib.get_machines():
+            # A machine of the hosts resolver can have several hostnames
+            names = machine.hostname if isinstance(machine.hostname, list) else [machine.hostname]
+            for name in set(names):
+                if name in matches:
+                    matches[name].append(machine)
+    hosts = {hostname: (None, None) for hostname in hostnames if not hostname}
+    for hostname, machines in matches.items():
+        if len(machines) != 1:
+            sys.stderr.write("The hostname {0!s} matches {1!s} "
+                             "machines.\n".format(hostname, len(machines)))
+            continue
+        hosts[hostname] = (resolver_ids.get(machines[0].resolver_name), str(machines[0].id))
+    return hosts
+
+
+def current_attachments(applications):
+    """
+    Read the attachments of the applications with one query and their ssh
+    users with a second query.
+
+    :return: dictionary of Attachment to the list of MachineToken ids
+    """
+    MachineToken = models.MachineToken
+    MachineTokenOptions = models.MachineTokenOptions
+    session = models.db.session
+    users = dict(session.query(MachineTokenOptions.machinetoken_id, MachineTokenOptions.mt_value)
+                 .join(MachineToken, MachineToken.id == MachineTokenOptions.machinetoken_id)
+                 .filter(MachineTokenOptions.mt_key == "user",
+                         MachineToken.application.in_(applications)))
+    query = session.query(MachineToken.id, models.Token.serial, MachineToken.application,
+                          MachineToken.machineresolver_id, MachineToken.machine_id)
+    query = query.join(models.Token, models.Token.id == MachineToken.token_id)
+    query = query.filter(MachineToken.application.in_(applications))
+    attachments = collections.defaultdict(list)
+    for mt_id, serial, application, resolver_id, machine_id in query:
+        machine_id = str(machine_id) if machine_id is not None else None
+        attachments[Attachment(serial, application, resolver_id, machine_id,
+                               users.get(mt_id))].append(mt_id)
+    return attachments
+
+
+def plan(entries, hosts, current, prune_all=False):
+    """
+    Compare the manifest with the current attachments.
+
+    :return: tuple of the list of (Attachment, hostname) to attach and the
+        dictionary of Attachment to MachineToken ids to detach
+    """
+    desired = collections.OrderedDict()
+    # The current attachments of these (serial, application) are unknown to
+    # the manifest, since one of their hostnames could not be resolved.
+    unresolved = set()
+    for serial, application, hostname, user in entries:
+        if hostname not in hosts:
+            unresolved.add((serial, application))
+            continue
+        resolver_id, machine_id = hosts[hostname]
+        attachment = Attachment(serial, application, resolver_id, machine_id,
+                                (user or None) if application == "ssh" else None)
+        desired[attachment] = hostname
+    serials = set(entry[0] for entry in entries)
+    to_attach = [(att, hostname) for att, hostname in desired.items() if att not in current]
+    to_detach = {att: ids for att, ids in current.items()
+                 if att not in desired and (prune_all or att.serial in serials)
+                 and (att.serial, att.application) not in unresolved}
+    return to_attach, to_detach
+
+
+def attach(attachment, hostname):
+    if attachment.application == "ssh":
+        machine_lib.attach_token(attachment.serial, "ssh", hostname=hostname,
+                                 options={"user": attachment.user})
+    else:
+        machine_lib.attach_token(attachment.serial, attachment.application,
+                                 hostname=hostname or None)
+
+
+def apply_batches(operations, apply, describe):
+    """
+    Apply the operations in transactions of BATCH_SIZE. If a transaction
+    fails, its operations are applied one by one.
+
+    :return: the number of failed operations
+    """
+    failed = 0
+    for chunk in pi_bulk.chunked(operations, BATCH_SIZE):
+        try:
+            with transaction():
+                for operation in chunk:
+                    apply(operation)
+            continue
+        except Exception as err:
+            sys.stderr.write("A batch failed ({0!s}), applying it one by one.\n".format(err))
+        for operation in chunk:
+            try:
+                with transaction():
+                    apply(operation)
+            except Exception as err:
+                failed += 1
+                sys.stderr.write("{0!s} failed: {1!s}\n".format(describe(operation), err))
+    return failed
+
+
+def describe_attach(operation):
+    attachment, hostname = operation
+    return "Attaching {0!s} for {1!s} to {2!s}".format(
+        attachment.serial, attachment.application, hostname or "-")
+
+
+def describe_detach(operation):
+    attachment, ids = operation
+    return "Detaching {0!s} for {1!s} from machine {2!s}".format(
+        attachment.serial, attachment.application, attachment.machine_id or "-")
+
+
+def sync(manifest, dry_run=False, prune_all=False):
+    entries = read_manifest(manifest)
+    with app_context():
+        hosts = resolve_hosts(set(entry[2] for entry in entries))
+        current = current_attachments(sorted(set(entry[1] for entry in entries)))
+        to_attach, to_detach = plan(entries, hosts, current, prune_all)
+        if dry_run:
+            for operation in to_detach.items():
+                print(describe_detach(operation))
+            for operation in to_attach:
+                print(describe_attach(operation))
+            print("Would detach {0!s} and attach {1!s} tokens.".format(
+                len(to_detach), len(to_attach)))
+            return 0
+        # Detaching first allows to move a serial to another user on the same machine
+        failed = apply_batches(list(to_detach.items()),
+                               lambda operation: pi_bulk.delete_machine_tokens(operation[1]),
+                               describe_detach)
+        failed += apply_batches(to_attach, lambda operation: attach(*operation),
+                                describe_attach)
+        print("Detached {0!s} and attached {1!s} tokens, {2!s} failed.".format(
+            len(to_detach), len(to_attach), failed))
+        return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest',
+                        help="CSV file with the columns serial, application, hostname and user.")
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help="Only print the changes.")
+    parser.add_argument('--prune-all', dest='prune_all', action='store_true',
+                        help="Also detach serials, that are not in the manifest.")
+    args = parser.parse_args(argv)
+
+    if sync(args.manifest, args.dry_run, args.prune_all):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
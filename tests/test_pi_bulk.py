@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the set-based token operations in pi_bulk.py.
+
+The tests use a token table in an in-memory SQLite database instead of the
+privacyIDEA models, they need SQLAlchemy. Run them from the top directory of
+the repository with
+
+    python3 -m unittest discover tests
+"""
+import types
+import unittest
+
+try:
+    import sqlalchemy
+    from sqlalchemy import orm
+except ImportError:  # pragma: no cover
+    sqlalchemy = None
+
+import pi_bulk
+
+
+@unittest.skipIf(sqlalchemy is None, "SQLAlchemy is not installed")
+class SetActiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        Base = orm.declarative_base()
+
+        class Token(Base):
+            __tablename__ = "token"
+            id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+            active = sqlalchemy.Column(sqlalchemy.Boolean, default=True)
+            locked = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
+            revoked = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
+
+        engine = sqlalchemy.create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.session = orm.sessionmaker(bind=engine)()
+        self.session.add_all([Token(id=1, active=False),
+                              Token(id=5, active=True),
+                              Token(id=2, active=False, locked=True),
+                              Token(id=3, active=False, revoked=True, locked=True),
+                              Token(id=4, active=True, locked=True)])
+        self.session.commit()
+        self.Token = Token
+        self._models = pi_bulk.models
+        pi_bulk.models = types.SimpleNamespace(Token=Token,
+                                               db=types.SimpleNamespace(session=self.session))
+
+    def tearDown(self):
+        pi_bulk.models = self._models
+        self.session.close()
+
+    def active(self):
+        return dict(self.session.query(self.Token.id, self.Token.active))
+
+    def test_01_enable_skips_locked_and_revoked(self):
+        self.assertEqual(pi_bulk.set_active([1, 2, 3], True), 1)
+        self.assertEqual(self.active(), {1: True, 2: False, 3: False, 4: True, 5: True})
+
+    def test_02_disable_skips_locked(self):
+        self.assertEqual(pi_bulk.set_active([1, 2, 3, 4, 5], False), 2)
+        self.assertEqual(self.active(), {1: False, 2: False, 3: False, 4: True, 5: False})
+
+
+if __name__ == '__main__':
+    unittest.main()
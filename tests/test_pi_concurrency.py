@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the adaptive concurrency limiter in pi_concurrency.py.
+
+Run them from the top directory of the repository with
+
+    python3 -m unittest discover tests
+"""
+import io
+import unittest
+
+from pi_concurrency import AdaptiveLimiter, DECREASE
+
+
+class AdaptiveLimiterTestCase(unittest.TestCase):
+
+    def _limiter(self, initial=32):
+        return AdaptiveLimiter(initial=initial, minimum=1, maximum=64, report_interval=0,
+                               out=io.StringIO())
+
+    def test_01_sustained_errors_keep_decreasing(self):
+        limiter = self._limiter()
+        limits = [limiter.limit]
+        for _ in range(100):
+            limiter.record("/token/init", 0.01, error=True)
+            if limiter.limit != limits[-1]:
+                limits.append(limiter.limit)
+        self.assertGreater(len(limits), 5)
+        for before, after in zip(limits, limits[1:]):
+            self.assertAlmostEqual(after, max(1, before * DECREASE))
+        for _ in range(200):
+            limiter.record("/token/init", 0.01, error=True)
+        self.assertEqual(limiter.limit, 1)
+
+    def test_02_one_decrease_per_round(self):
+        limiter = self._limiter()
+        limiter.record("/token/init", 0.01, error=True)
+        limiter.record("/token/init", 0.01, error=True)
+        self.assertAlmostEqual(limiter.limit, 32 * DECREASE)
+
+    def test_03_sustained_slowness_keeps_decreasing(self):
+        limiter = self._limiter()
+        for _ in range(50):
+            limiter.record("/validate/check", 0.01)
+        limit = limiter.limit
+        decreases = 0
+        for _ in range(500):
+            limiter.record("/validate/check", 1.0)
+            if limiter.limit < limit:
+                decreases += 1
+                limit = limiter.limit
+        self.assertGreater(decreases, 1)
+        self.assertEqual(limiter.limit, 1)
+
+    def test_04_increase_after_a_successful_round(self):
+        limiter = self._limiter(initial=4)
+        # the script uses all slots
+        limiter.in_flight = 4
+        for _ in range(4):
+            limiter.record("/token/init", 0.01)
+        self.assertEqual(limiter.limit, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
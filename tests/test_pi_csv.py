@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the CSV readers in pi_csv.py.
+
+Run them from the top directory of the repository with
+
+    python3 -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+
+from pi_csv import read_users
+
+
+class ReadUsersTestCase(unittest.TestCase):
+
+    def test_01_default_realm_comments_and_empty_lines(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "users.csv")
+            with open(path, "w") as f:
+                f.write("# username,realm\nalice\n\n bob , realm2\ncarol,\n")
+            self.assertEqual(list(read_users(path, "defrealm")),
+                             [("alice", "defrealm"), ("bob", "realm2"),
+                              ("carol", "defrealm")])
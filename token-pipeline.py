@@ -0,0 +1,166 @@
+#!/opt/privacyidea/bin/python
+# -*- coding: utf-8 -*-
+from pi_bootstrap import app_context, load_script, transaction
+import argparse
+import datetime
+import sys
+
+__doc__ = """
+This script runs a pipeline of token actions in one privacyIDEA app context
+and one database transaction.
+
+Chaining create-token.py, set-pin.py and attach_offline.py means three
+interpreter starts, three apps and three transactions for one token. This
+script runs the same actions one after another for the same serial or user:
+
+   token-pipeline.py --user <user> create_token setpin attach_offline
+   token-pipeline.py --serial <serial> setpin add_tokeninfo_creation_time
+   token-pipeline.py --serial <serial> --user <user> assign_ssh_token
+
+If no actions are given, the actions in ACTIONS are run. This way the script
+can directly be used in the script event handler.
+
+The actions are named like the functions of the scripts:
+
+ * create_token                 create-token.py, the new serial is used by the next actions
+ * setpin                       set-pin.py
+ * attach_offline               attach_offline.py
+ * assign_ssh_token             assign_ssh_token.py
+ * unassign_ssh_token           unassign_ssh_token.py
+ * add_tokeninfo_creation_time  add_tokeninfo_timestamp.py
+
+The actions call the functions of the scripts, so the configuration (like
+TOKENTYPE, PIN or SSH_HOST) is the one of the scripts. Adapt the scripts to
+your needs. If one action fails, none of the actions is committed. The serial
+and the password of a created token are only printed after the commit.
+
+You can place the script in your scripts directory /etc/privacyidea/scripts/
+and use it in the script event handler.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+ACTION_SCRIPTS = {"create_token": "create-token.py",
+                  "setpin": "set-pin.py",
+                  "attach_offline": "attach_offline.py",
+                  "assign_ssh_token": "assign_ssh_token.py",
+                  "unassign_ssh_token": "unassign_ssh_token.py",
+                  "add_tokeninfo_creation_time": "add_tokeninfo_timestamp.py"}
+# The actions, that are run, if no actions are given
+ACTIONS = ["setpin", "attach_offline", "add_tokeninfo_creation_time"]
+# The options of the script event handler, that the actions do not use
+HANDLER_OPTIONS = ["--tokenowner", "--tokenrealm", "--logged_in_user", "--logged_in_role"]
+
+
+class Pipeline(object):
+    """
+    Runs the actions for one serial and user. The actions share the serial,
+    so that create_token can hand over the new serial to the next actions.
+    The actions call the functions of the scripts, which share the app
+    context and the transaction of the pipeline.
+    """
+
+    def __init__(self, serial=None, username=None, realm=None):
+        self.serial = serial
+        self.username = username
+        self.realm = realm
+        # The serial and password of a created token, printed after the commit
+        self.created = None
+
+    def script(self, action):
+        return load_script(ACTION_SCRIPTS[action])
+
+    def require_serial(self, action):
+        if not self.serial:
+            raise Exception("The action {0!s} needs a serial.".format(action))
+        return self.serial
+
+    def require_user(self, action):
+        if not self.username:
+            raise Exception("The action {0!s} needs a user.".format(action))
+        return self.username
+
+    def create_token(self):
+        script = self.script("create_token")
+        if self.username:
+            user = script.user_lib.User(self.username, self.realm or script.REALM)
+        else:
+            user = script.user_lib.User()
+        password = script.generate_passwords(1)[0]
+        self.serial = script.create_token(user, password, self.serial)
+        self.created = (self.serial, password)
+
+    def setpin(self):
+        self.script("setpin").setpin(self.require_serial("setpin"))
+
+    def attach_offline(self):
+        self.script("attach_offline").attach_offline(self.require_serial("attach_offline"))
+
+    def assign_ssh_token(self):
+        self.script("assign_ssh_token").assign_ssh_token(
+            self.require_serial("assign_ssh_token"), self.require_user("assign_ssh_token"))
+
+    def unassign_ssh_token(self):
+        self.script("unassign_ssh_token").unassign_ssh_token(
+            self.require_serial("unassign_ssh_token"))
+
+    def add_tokeninfo_creation_time(self):
+        script = self.script("add_tokeninfo_creation_time")
+        script.add_tokeninfo_creation_time(
+            self.require_serial("add_tokeninfo_creation_time"), script.tokeninfo_key,
+            datetime.datetime.now().strftime(script.tokenclass_lib.DATE_FORMAT))
+
+    def run(self, actions):
+        with app_context():
+            with transaction():
+                for action in actions:
+                    getattr(self, action)()
+        if self.created:
+            print("{0!s}: {1!s}".format(*self.created))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial',
+                        help="The serial of the token to act on.")
+    parser.add_argument('--user', dest='username',
+                        help="The user of the token.")
+    parser.add_argument('--realm', dest='realm',
+                        help="The realm of the user. Defaults to the REALM of create-token.py.")
+    # The other options of the script event handler are accepted and ignored
+    for option in HANDLER_OPTIONS:
+        parser.add_argument(option, help=argparse.SUPPRESS)
+    parser.add_argument('actions', nargs='*',
+                        help="The actions to run in the given order: "
+                             "{0!s}".format(", ".join(sorted(ACTION_SCRIPTS))))
+    args = parser.parse_args(argv)
+
+    actions = args.actions or ACTIONS
+    for action in actions:
+        if action not in ACTION_SCRIPTS:
+            parser.error("unknown action {0!s}".format(action))
+
+    pipeline = Pipeline(args.serial, args.username, args.realm)
+    try:
+        pipeline.run(actions)
+    except Exception as err:
+        sys.stderr.write("The pipeline {0!s} failed and was rolled back: {1!s}\n".format(
+            " ".join(actions), err))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+#!/opt/privacyidea/bin/python
+# -*- coding: utf-8 -*-
+import argparse
+import importlib.abc
+import importlib.util
+import json
+import os
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+__doc__ = """
+This script measures the cold start of the scripts in this repository.
+
+It creates a throwaway pi.cfg with a local SQLite database, an encryption key,
+a passwd resolver with synthetic users and HOTP tokens for some of them. No
+privacyIDEA server or database server is needed. Each script is then started
+in a fresh interpreter with the arguments given in BENCHMARKS. The calls to
+create_app() are redirected to the throwaway pi.cfg.
+
+For each script the following phases are measured:
+
+ * imports      from the start of the interpreter until create_app() is called
+ * create_app   the duration of the first create_app() call
+ * first_query  from the end of create_app() until the first SQL statement
+                has returned, which includes opening the database connection
+ * total        the runtime of the whole process
+
+Scripts, that do not create an app, only report the total. The scripts, that
+use the REST API, are pointed to REST_URL with PI_SCRIPTS_URL, so they never
+reach the privacyIDEA of the host. By default nothing listens there and they
+fail to connect, which is fine for measuring the start.
+Each script is run --repeat times and the median is reported. Before each run
+the database is restored from a snapshot, that is taken after the setup, so
+that the runs do not depend on the changes of the runs before.
+
+   benchmark-startup.py --output results.json
+   benchmark-startup.py --output results.json --baseline baseline.json
+
+If a baseline is given, the results are compared with it. The script exits
+with 1, if a phase of a script got slower than THRESHOLD (relative) and
+MIN_DIFF (absolute seconds).
+
+You can restrict the run to single scripts:
+
+   benchmark-startup.py set-pin.py toolbox/create-default-tokens.py
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REALM = "benchrealm"
+RESOLVER = "benchresolver"
+USER_COUNT = 1000
+TOKEN_COUNT = 200
+SERIAL_FORMAT = "BENCH{0:05d}"
+REPEAT = 5
+# a phase of a script is slower, if it is slower by THRESHOLD and by MIN_DIFF seconds
+THRESHOLD = 0.10
+MIN_DIFF = 0.05
+# The URL for the scripts, that use the REST API. Nothing listens on port 9
+# (discard), so that the scripts fail to connect instead of changing the
+# tokens of a real privacyIDEA. Set it to the URL of standin-server.py to
+# measure the requests as well.
+REST_URL = os.environ.get("PI_BENCHMARK_REST_URL", "http://127.0.0.1:9")
+PHASES = ["imports", "create_app", "first_query", "total"]
+DATABASE = "privacyidea.sqlite"
+# The copy of the database after the setup, that is restored before each run
+SNAPSHOT = "privacyidea.sqlite.snapshot"
+
+# The scripts with their arguments and the data on stdin.
+# {serial}, {user}, {realm}, {resolver} and {workdir} are replaced.
+# Scripts with "skip" are not run, the reason is printed instead.
+BENCHMARKS = [
+    {"script": "add_tokeninfo_timestamp.py", "argv": ["--serial", "{serial}"]},
+    {"script": "assign_ssh_token.py", "argv": ["--serial", "{serial}", "--user", "{user}"]},
+    {"script": "attach_offline.py", "argv": ["--serial", "{serial}"]},
+    {"script": "create-registration.py", "argv": ["--user", "{user}", "--realm", "{realm}"]},
+    {"script": "create-remote-and-spass.py", "argv": ["--user", "{user}", "--realm", "{realm}"]},
+    {"script": "create-remote-tokens.py", "argv": ["--serial", "{serial}"]},
+    {"script": "create-token.py", "argv": ["--user", "{user}"]},
+    {"script": "delete-or-disable-token.py", "argv": ["--user", "{user}", "--realm", "{realm}"]},
+    {"script": "delete-totp.py", "argv": ["--user", "{user}", "--realm", "{realm}"]},
+    {"script": "disable-tan.py", "argv": ["--user", "{user}", "--realm", "{realm}"]},
+    {"script": "enable-tan.py", "argv": ["--serial", "{serial}"]},
+    {"script": "handler-spool.py",
+     "argv": ["--spool", "{workdir}/spool.sqlite",
+              "enqueue", "set-pin.py", "--serial", "{serial}"]},
+    {"script": "reassign-token.py", "argv": ["--serial", "{serial}", "--user", "{user}"]},
+    {"script": "remove-other-user-tokens.py",
+     "argv": ["--serial", "{serial}", "--user", "{user}", "--realm", "{realm}"]},
+    {"script": "remove-user-tokens-pre.py", "argv": ["--user", "{user}", "--realm", "{realm}"]},
+    {"script": "reset-failcounter.py", "argv": ["--user", "{user}", "--realm", "{realm}"]},
+    {"script": "script-host.py", "argv": [],
+     "skip": "a daemon, that does not exit"},
+    {"script": "script-host-client.py", "argv": [],
+     "skip": "talks to a running script host, its fallback runs the benchmarked scripts"},
+    {"script": "set-pin.py", "argv": ["--serial", "{serial}"]},
+    {"script": "sync-machine-tokens.py", "argv": ["{workdir}/manifest.csv", "--dry-run"]},
+    {"script": "token-pipeline.py", "argv": ["--serial", "{serial}", "setpin"]},
+    {"script": "unassign_ssh_token.py", "argv": ["--serial", "{serial}"]},
+    {"script": "toolbox/assign-token.py", "argv": ["--realm", "{realm}"],
+     "stdin": "{user}, {serial}\n"},
+    {"script": "toolbox/benchmark-startup.py", "argv": [],
+     "skip": "this benchmark"},
+    {"script": "toolbox/boomalert.py", "argv": [],
+     "skip": "sends an SMS with an external service"},
+    {"script": "toolbox/check_certificates.py",
+     "argv": ["--web", "--config-dir", "{workdir}/webconf"]},
+    {"script": "toolbox/create-default-tokens.py",
+     "argv": ["--realm", "{realm}", "--user", "{user}"]},
+    {"script": "toolbox/create-sms-email-from-attributes.py", "argv": ["--realm", "{realm}"]},
+    {"script": "toolbox/create-sms-token.py", "argv": ["--realm", "{realm}"], "stdin": ""},
+    {"script": "toolbox/create-token-via-api.py", "argv": [], "stdin": "{user}\n"},
+    {"script": "toolbox/create-user-assign-token-with-radius.py",
+     "argv": ["--resolver", "{resolver}", "--realm", "{realm}"], "stdin": ""},
+    {"script": "toolbox/create-user-assign-token.py",
+     "argv": ["--resolver", "{resolver}", "--realm", "{realm}"], "stdin": ""},
+    {"script": "toolbox/get-users-without-token.py", "argv": ["--realm", "{realm}"], "stdin": ""},
+    {"script": "toolbox/import-token.py", "argv": ["--tokenrealm", "{realm}"], "stdin": ""},
+    {"script": "toolbox/join-resolvers-keeping-tokens.py",
+     "argv": ["--source_realm", "{realm}", "--target_resolver", "{resolver}",
+              "--target_realm", "{realm}"]},
+    {"script": "toolbox/mass-create-token.py",
+     "argv": ["--resolver", "{resolver}", "--realm", "{realm}", "--tokentype", "registration"],
+     "stdin": ""},
+    {"script": "toolbox/migrate-tokens.py", "argv": ["--generate-example-config"]},
+    {"script": "toolbox/migrate_users.py", "argv": []},
+    {"script": "toolbox/privacyidea-decrypt-safeword.py",
+     "argv": ["--file", "{workdir}/safeword.ldif"]},
+    {"script": "toolbox/re-assign-token.py", "argv": ["--realm", "{realm}"], "stdin": ""},
+    {"script": "toolbox/reassign-tokens.py",
+     "argv": ["--from_realm", "{realm}", "--from_resolver", "{resolver}",
+              "--to_realm", "{realm}", "--to_resolver", "{resolver}", "--dry_run"]},
+    {"script": "toolbox/standin-server.py", "argv": [],
+     "skip": "a server, that does not exit"},
+    {"script": "toolbox/test-performance.py", "argv": [], "skip": "needs a server"},
+    ]
+
+PI_CFG = """
+SQLALCHEMY_DATABASE_URI = 'sqlite:///{workdir}/{database}'
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+SECRET_KEY = '{secret}'
+PI_PEPPER = '{pepper}'
+PI_ENCFILE = '{workdir}/enckey'
+PI_AUDIT_NO_SIGN = True
+PI_LOGFILE = '{workdir}/privacyidea.log'
+PI_LOGLEVEL = 30
+SUPERUSER_REALM = ['superusers']
+"""
+
+
+def create_environment(workdir):
+    """
+    Write the pi.cfg and the encryption key to the workdir. The database is
+    filled by a separate interpreter, so that the benchmark itself does not
+    import privacyIDEA.
+    """
+    with open(os.path.join(workdir, "enckey"), "wb") as f:
+        f.write(os.urandom(96))
+    config_file = os.path.join(workdir, "pi.cfg")
+    with open(config_file, "w") as f:
+        f.write(PI_CFG.format(workdir=workdir, database=DATABASE,
+                              secret=os.urandom(24).hex(),
+                              pepper=os.urandom(24).hex()))
+    with open(os.path.join(workdir, "passwd"), "w") as f:
+        for i in range(1, USER_COUNT + 1):
+            f.write("user{0:04d}:x:{1:d}:{1:d}:Bench User {0:d},,,:/home/user{0:04d}:"
+                    "/bin/false\n".format(i, 10000 + i))
+    with open(os.path.join(workdir, "manifest.csv"), "w") as f:
+        f.write("{0!s}, offline, ,\n".format(SERIAL_FORMAT.format(1)))
+    with open(os.path.join(workdir, "safeword.ldif"), "w"):
+        pass
+    os.mkdir(os.path.join(workdir, "webconf"))
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--setup", config_file],
+                   check=True)
+    shutil.copyfile(os.path.join(workdir, DATABASE), os.path.join(workdir, SNAPSHOT))
+    return config_file
+
+
+def reset_environment(workdir):
+    """
+    Restore the database from the snapshot and remove the spool, so that each
+    run starts with the same data.
+    """
+    shutil.copyfile(os.path.join(workdir, SNAPSHOT), os.path.join(workdir, DATABASE))
+    for name in ["spool.sqlite", "spool.sqlite-wal", "spool.sqlite-shm"]:
+        path = os.path.join(workdir, name)
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def setup_database(config_file):
+    """
+    Create the tables, the resolver, the realm and the tokens.
+    """
+    from privacyidea.app import create_app
+    from privacyidea.lib.realm import set_default_realm, set_realm
+    from privacyidea.lib.resolver import save_resolver
+    from privacyidea.lib.token import init_token
+    from privacyidea.lib.user import User
+    from privacyidea.models import db
+
+    workdir = os.path.dirname(config_file)
+    app = create_app(config_name="production", config_file=config_file, silent=True)
+    with app.app_context():
+        db.create_all()
+        save_resolver({"resolver": RESOLVER,
+                       "type": "passwdresolver",
+                       "fileName": os.path.join(workdir, "passwd")})
+        try:
+            set_realm(REALM, resolvers=[{"name": RESOLVER}])
+        except Exception:
+            # privacyIDEA before 3.10 takes a list of resolver names
+            db.session.rollback()
+            set_realm(REALM, resolvers=[RESOLVER])
+        set_default_realm(REALM)
+        for i in range(1, TOKEN_COUNT + 1):
+            init_token({"type": "hotp", "genkey": 1, "serial": SERIAL_FORMAT.format(i)},
+                       user=User("user{0:04d}".format(i), REALM))
+
+
+class ImportWatcher(importlib.abc.MetaPathFinder):
+    """
+    Calls the callback with the module, right after the module was imported
+    by the benchmarked script.
+    """
+
+    def __init__(self, fullname, callback):
+        self.fullname = fullname
+        self.callback = callback
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname != self.fullname:
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        exec_module = spec.loader.exec_module
+        callback = self.callback
+
+        def watched_exec_module(module):
+            exec_module(module)
+            callback(module)
+
+        spec.loader.exec_module = watched_exec_module
+        return spec
+
+
+def run_instrumented(spec):
+    """
+    Run the script given in the spec and write the phases to the result file.
+    This runs in the benchmarked interpreter.
+    """
+    start = spec["start"]
+    phases = {}
+
+    def first_query(*args, **kwargs):
+        if "first_query" not in phases:
+            phases["first_query"] = time.time() - phases.pop("_create_app_end")
+
+    def watch_app(module):
+        create_app = module.create_app
+
+        def timed_create_app(*args, **kwargs):
+            kwargs["config_file"] = spec["config_file"]
+            called = time.time()
+            app = create_app(*args, **kwargs)
+            if "create_app" not in phases:
+                from sqlalchemy import event
+                from sqlalchemy.engine import Engine
+                phases["imports"] = called - start
+                phases["_create_app_end"] = time.time()
+                phases["create_app"] = phases["_create_app_end"] - called
+                event.listen(Engine, "after_cursor_execute", first_query)
+            return app
+
+        module.create_app = timed_create_app
+
+    sys.meta_path.insert(0, ImportWatcher("privacyidea.app", watch_app))
+    os.environ["PRIVACYIDEA_CONFIGFILE"] = spec["config_file"]
+    sys.argv = [spec["script"]] + spec["argv"]
+    sys.path.insert(0, os.path.dirname(spec["script"]))
+    returncode = 0
+    try:
+        runpy.run_path(spec["script"], run_name="__main__")
+    except SystemExit as exx:
+        returncode = exx.code if isinstance(exx.code, int) else (0 if exx.code is None else 1)
+    except Exception:
+        returncode = 1
+    finally:
+        phases.pop("_create_app_end", None)
+        phases["returncode"] = returncode
+        with open(spec["result_file"], "w") as f:
+            json.dump(phases, f)
+    sys.exit(returncode)
+
+
+def benchmark_script(benchmark, config_file, workdir, repeat):
+    """
+    Run one script repeat times and return the medians of the phases.
+    """
+    values = {"workdir": workdir, "serial": SERIAL_FORMAT.format(1),
+              "user": "user0001", "realm": REALM, "resolver": RESOLVER}
+    argv = [arg.format(**values) for arg in benchmark["argv"]]
+    stdin = benchmark.get("stdin", "").format(**values)
+    result_file = os.path.join(workdir, "result.json")
+    # The scripts, that use pi_rest.py, must never reach a real privacyIDEA
+    env = dict(os.environ, PI_SCRIPTS_URL=REST_URL,
+               PI_SCRIPTS_JWT_CACHE=os.path.join(workdir, "jwt.json"))
+    runs = []
+    for _i in range(repeat):
+        reset_environment(workdir)
+        spec = {"script": os.path.join(REPO_DIR, benchmark["script"]),
+                "argv": argv,
+                "config_file": config_file,
+                "result_file": result_file}
+        spec["start"] = time.time()
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__),
+                               "--instrument", json.dumps(spec)],
+                              input=stdin.encode("utf-8"), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        total = time.time() - spec["start"]
+        try:
+            with open(result_file) as f:
+                run = json.load(f)
+            os.unlink(result_file)
+        except (OSError, ValueError):
+            run = {"returncode": proc.returncode}
+        run["total"] = total
+        runs.append(run)
+    result = {"returncode": runs[-1]["returncode"], "runs": repeat}
+    for phase in PHASES:
+        phase_values = [run[phase] for run in runs if phase in run]
+        if phase_values:
+            result[phase] = statistics.median(phase_values)
+    return result
+
+
+def compare(results, baseline):
+    """
+    Compare each phase of the results with the baseline and print the
+    differences.
+
+    :return: list of (script, phase), that got slower
+    """
+    regressions = []
+    print("{0:45} {1:12} {2:>10} {3:>10} {4:>8}".format("script", "phase", "baseline",
+                                                        "result", "change"))
+    for script, result in sorted(results["scripts"].items()):
+        base = baseline.get("scripts", {}).get(script) or {}
+        for phase in PHASES:
+            if phase not in result:
+                continue
+            if phase not in base:
+                print("{0:45} {1:12} {2:>10} {3:>10.3f}".format(
+                    script, phase, "-", result[phase]))
+                continue
+            diff = result[phase] - base[phase]
+            change = diff / base[phase] if base[phase] else 0
+            marker = ""
+            if change > THRESHOLD and diff > MIN_DIFF:
+                regressions.append((script, phase))
+                marker = "  SLOWER"
+            print("{0:45} {1:12} {2:>10.3f} {3:>10.3f} {4:>+7.1%}{5!s}".format(
+                script, phase, base[phase], result[phase], change, marker))
+    return regressions
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--instrument":
+        run_instrumented(json.loads(sys.argv[2]))
+    if len(sys.argv) == 3 and sys.argv[1] == "--setup":
+        setup_database(sys.argv[2])
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scripts', nargs='*',
+                        help="Only benchmark these scripts (relative to the repository).")
+    parser.add_argument('--repeat', dest='repeat', type=int, default=REPEAT,
+                        help="Number of runs per script.")
+    parser.add_argument('--output', dest='output',
+                        help="Write the results as JSON to this file.")
+    parser.add_argument('--baseline', dest='baseline',
+                        help="Compare the results with this JSON file of an earlier run.")
+    parser.add_argument('--keep', dest='keep', action='store_true',
+                        help="Do not remove the throwaway pi.cfg and database.")
+    args = parser.parse_args()
+
+    benchmarks = [b for b in BENCHMARKS if not args.scripts or b["script"] in args.scripts]
+    workdir = tempfile.mkdtemp(prefix="pi-benchmark-")
+    try:
+        config_file = create_environment(workdir)
+        results = {"python": sys.version.split()[0],
+                   "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "scripts": {}}
+        for benchmark in benchmarks:
+            if benchmark.get("skip"):
+                sys.stderr.write("Skipping {0!s}: {1!s}\n".format(benchmark["script"],
+                                                                  benchmark["skip"]))
+                continue
+            result = benchmark_script(benchmark, config_file, workdir, args.repeat)
+            results["scripts"][benchmark["script"]] = result
+            print("{0:45} {1!s}".format(benchmark["script"],
+                                        "  ".join("{0!s}={1:.3f}".format(phase, result[phase])
+                                                  for phase in PHASES if phase in result)))
+    finally:
+        if args.keep:
+            print("The benchmark environment is kept in {0!s}".format(workdir))
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,25 @@
 #!/opt/privacyidea/bin/python
+import argparse
+import collections
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import timeit
+import urllib3
+# The shared modules are located in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pi_concurrency import AdaptiveLimiter  # noqa: E402
+from pi_rest import APIError, Client  # noqa: E402
 
 # debug enables logging of script runtimes to the privacyidea DEBUG log
 TRACK_TIME = True
 
 if TRACK_TIME:
-    import timeit
     start = timeit.default_timer()
 
-import argparse
-import sys
-import logging
-import urllib3
-import requests
-
-
-
-
 __doc__ = """
 This scripts creates new tokens of the specified types for all users in a
 given realm who do not already have a token of this type.
@@ -36,6 +40,11 @@ has a token of this given type.
 The tokens are either enrolled via Lib function (faster) or use the REST API
 to enroll the token which also triggers event handlers configured in privacyIDEA. 
 Set this via the variable INIT_VIA_API.
+With INIT_VIA_API the users are scanned, while API_WORKERS threads already
+enroll the tokens of the scanned users. With ADAPTIVE_CONCURRENCY the number of
+concurrent /token/init requests starts low and adapts to the latency and the
+errors of the server up to API_WORKERS. The current concurrency and latency
+are written to stderr. At the end a summary with the throughput is printed.
 Note that the script must access also the library functions of privacyIDEA, so in
 most cases it must be run on the privacyIDEA server.
 
@@ -62,6 +71,12 @@ ADMIN_USER = "admin"
 ADMIN_PASSWORD = "test"
 # the list of token types to enroll. Overwritten by --tokentype option.
 PRIMARY_TOKEN_TYPES = ["registration"]
+# The number of threads, that enroll the tokens via API
+API_WORKERS = 16
+# Adapt the number of concurrent API requests to the load of the server
+ADAPTIVE_CONCURRENCY = True
+# The number of users, that are scanned ahead of the API workers
+QUEUE_SIZE = 200
 # dictionary with parameters to add for the respective tokentype
 ADD_PARAMS = {"sms": {"dynamic_phone": True},
               "email": {"dynamic_email": True},
@@ -72,17 +87,15 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 log = logging.getLogger("privacyidea.scripts.create-default-tokens")
 
 
-def get_auth_tok():
-    r = requests.post(URL + '/auth', verify=VERIFY,
-                      data={"username": ADMIN_USER, "password": ADMIN_PASSWORD})
-    if r.status_code == 200:
-        authorization = r.json().get("result").get("value").get("token")
+def get_client():
+    limiter = AdaptiveLimiter(maximum=API_WORKERS) if ADAPTIVE_CONCURRENCY else None
+    client = Client(URL, ADMIN_USER, ADMIN_PASSWORD, verify=VERIFY, limiter=limiter)
+    try:
+        client.token()
         print('Auth token obtained')
-        return authorization
-    else:
-        error_msg = r.json().get("result").get("error").get("message")
-        error_code = r.json().get("result").get("error").get("code")
-        print("Error {0!s}: {1!s}".format(error_code, error_msg))
+        return client
+    except APIError as err:
+        print("Error: {0!s}".format(err))
         sys.exit()
 
 
@@ -101,101 +114,172 @@ def check_userinfo(user_obj, userinfo_key=None, userinfo_value=None):
             return True
     else:
         print("Userinfo key does not exists or value does not match"
-                 " for user {0!s} in realm {1!s}.".format(user_obj.login,
-                                                          user_obj.realm))
+              " for user {0!s} in realm {1!s}.".format(user_obj.login,
+                                                       user_obj.realm))
         return False
 
 
-def create_default_tokens(realm, auth_token=None, username=None,
-                          userinfo_key=None, userinfo_value=None,
-                          tokentype=None, check_existing_tokentypes=None):
+def eligible_tokens(realm, username=None, userinfo_key=None, userinfo_value=None,
+                    tokentypes=None, check_existing_tokentypes=None, stats=None,
+                    lock=None):
     """
-    This method creates the default tokens for the users in the given realm.
-    You may add a userinfo condition.
+    This method streams the users of the given realm and yields the user
+    object and the init parameters of each token, that should be created.
+    You may add a userinfo condition. It must run in an app context.
+    The stats are shared with the API workers, so they are only updated
+    with the lock.
     """
     # for reasons of speed in the unprivileged case, imports are placed here
-    from privacyidea.lib.token import init_token, get_tokens
+    from privacyidea.lib.token import get_tokens
     from privacyidea.lib.user import User, get_user_list
-    from privacyidea.app import create_app
 
+    # if no username is given, get all users from the specified realm
+    if not username:
+        user_objects = (User(user["username"], realm)
+                        for user in get_user_list({"realm": realm}))
+    # else, get only the specified user
+    else:
+        user_objects = [User(username, realm)]
+    for user_obj in user_objects:
+        with lock:
+            stats["users"] += 1
+        if not user_obj.exist():
+            print('User {0!s} does not exists in any resolver in '
+                  'realm {1!s}'.format(user_obj.login, user_obj.realm))
+            continue
+        if not check_userinfo(user_obj, userinfo_key, userinfo_value):
+            continue
+        tokens = get_tokens(user=user_obj, token_type_list=check_existing_tokentypes)
+        # The types of the new tokens, that count as existing tokens
+        created_types = []
+        for type in tokentypes:
+            # if no token of the specified type exists, create one
+            # create sms token only if mobile number exists
+            if not tokens and not created_types:
+                if (type == "email" and not user_obj.info.get("email")) or \
+                   (type == "sms" and not user_obj.get_user_phone(index=0,
+                                                                  phone_type='mobile')):
+                    print("User attribute missing for user {0!s}@{1!s}."
+                          "Cannot create {2!s} token.".format(user_obj.login,
+                                                              user_obj.realm, type))
+                    with lock:
+                        stats["skipped"] += 1
+                    continue
+                params = {"type": type}
+                params.update(ADD_PARAMS[type])
+                params.update({"user": user_obj.login, "realm": user_obj.realm})
+                yield user_obj, params
+                # The new token counts as existing token for the next types
+                if not check_existing_tokentypes or type in check_existing_tokentypes:
+                    created_types.append(type)
+            else:
+                matched_token_types = ", ".join(sorted(set(
+                    [tok.get_tokentype() for tok in tokens] + created_types)))
+                print("User {0!s} in realm {1!s} already has at least one of these tokens: {2!s}. "
+                      "Not creating another one.".format(user_obj.login,
+                                                         user_obj.realm,
+                                                         matched_token_types or "**any**"))
+                with lock:
+                    stats["skipped"] += 1
+
+
+def enroll_via_api(client, login, realm, params):
+    """
+    Enroll the token via API (triggers event handlers at token_init)
+
+    :return: the serial or None
+    """
+    response = client.post('/token/init', data=params)
+    if response.ok:
+        return response.detail.get("serial")
+    print("Enrolling {0!s} token for user {1!s} in realm "
+          "{2!s} via API: {3!s}".format(params["type"], login, realm,
+                                        response.error_message))
+
+
+def api_worker(client, jobs, stats, lock):
+    """
+    Enroll the tokens from the queue until it gets None.
+    """
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        login, realm, params = job
+        try:
+            serial = enroll_via_api(client, login, realm, params)
+        except Exception as err:
+            print("Enrolling {0!s} token for user {1!s} in realm "
+                  "{2!s} via API: {3!s}".format(params["type"], login, realm, err))
+            serial = None
+        with lock:
+            stats["enrolled" if serial else "failed"] += 1
+        if serial:
+            print('Enrolled a primary {0!s} token for '
+                  'user {1!s} in realm {2!s}'.format(params["type"], login, realm))
+
+
+def create_default_tokens(realm, client=None, username=None,
+                          userinfo_key=None, userinfo_value=None,
+                          tokentype=None, check_existing_tokentypes=None):
+    """
+    This method creates the default tokens for the users in the given realm.
+
+    With INIT_VIA_API the users are scanned in this thread and put into a
+    queue of QUEUE_SIZE tokens, from which API_WORKERS threads enroll the
+    tokens in parallel. So scanning and enrolling overlap.
 
+    :return: dictionary with the numbers of users, enrolled, failed and skipped tokens
+    """
+    from privacyidea.lib.token import init_token
+    from privacyidea.app import create_app
 
     tokentypes = [tokentype] if tokentype else PRIMARY_TOKEN_TYPES
+    stats = collections.Counter(users=0, enrolled=0, failed=0, skipped=0)
+    lock = threading.Lock()
+    workers = []
+    jobs = queue.Queue(maxsize=QUEUE_SIZE)
+    if INIT_VIA_API:
+        for i in range(API_WORKERS):
+            worker = threading.Thread(target=api_worker, args=(client, jobs, stats, lock),
+                                      daemon=True)
+            worker.start()
+            workers.append(worker)
 
     app = create_app(config_name="production",
                      config_file="/etc/privacyidea/pi.cfg",
                      silent=True)
 
-    with app.app_context():
-        # if no username is given, get all users from the specified realm
-        if not username:
-            user_list = get_user_list({"realm": realm})
-            user_objects = [User(user["username"], realm)
-                            for user in user_list]
-        # else, get only the specified user
-        else:
-            user_objects = [User(username, realm)]
-        for user_obj in user_objects:
-            if user_obj.exist():
-                if check_userinfo(user_obj, userinfo_key, userinfo_value):
-                    for type in tokentypes:
-                        serial = None
-                        tokens = get_tokens(user=user_obj, token_type_list=check_existing_tokentypes)
-                        # if no token of the specified type exists, create one
-                        # create sms token only if mobile number exists
-                        if len(tokens) == 0:
-                            if (type == "email" and not user_obj.info.get("email")) or \
-                               (type == "sms" and not user_obj.get_user_phone(index=0,
-                                                                              phone_type='mobile')):
-                                print("User attribute missing for user {0!s}@{1!s}."
-                                         "Cannot create {2!s} token.".format(user_obj.login,
-                                                                             user_obj.realm, type))
-                                continue
-                            else:
-                                params = {"type": type}
-                                params.update(ADD_PARAMS[type])
-                                params.update({"user": user_obj.login, "realm": user_obj.realm})
-                                if INIT_VIA_API:
-                                    # enroll token via API (triggers event handlers at token_init)
-                                    r = requests.post(URL + '/token/init', verify=VERIFY,
-                                                      data=params,
-                                                      headers={"Authorization": auth_token})
-                                    status = r.json().get("result").get("status")
-                                    if status is True:
-                                        serial = r.json().get("detail").get("serial")
-                                    else:
-                                        error = r.json().get("result").get("error")
-                                        print("Enrolling {0!s} token for user {1!s} in realm "
-                                                 "{2!s} via API: {3!s}".format(type,
-                                                                               user_obj.login,
-                                                                               user_obj.realm,
-                                                                               error.get("message")))
-                                else:
-                                    # enroll token via lib method (faster)
-                                    token_obj = init_token(params, user_obj)
-                                    serial = token_obj.token.serial
-                                if serial:
-                                    print('Enrolled a primary {0!s} token for '
-                                             'user {1!s} in realm {2!s}'.format(type,
-                                                                                user_obj.login,
-                                                                                user_obj.realm))
-                        else:
-
-                            matched_token_types = ""
-                            for token in tokens:
-                                if matched_token_types.count(token.get_tokentype()) == 0:
-                                    matched_token_types = matched_token_types + token.get_tokentype()
-                                    matched_token_types = matched_token_types + ", "
-                            matched_token_types = matched_token_types[:-2]
-
-
-                            print("User {0!s} in realm {1!s} already has at least one of these tokens: {2!s}. "
-                                     "Not creating another one.".format(user_obj.login,
-                                                                        user_obj.realm,
-                                                                        matched_token_types or "**any**"))
-            else:
-                print('User {0!s} does not exists in any resolver in '
-                         'realm {1!s}'.format(user_obj.login, user_obj.realm))
+    try:
+        with app.app_context():
+            for user_obj, params in eligible_tokens(realm, username, userinfo_key,
+                                                    userinfo_value, tokentypes,
+                                                    check_existing_tokentypes, stats, lock):
+                if INIT_VIA_API:
+                    jobs.put((user_obj.login, user_obj.realm, params))
+                else:
+                    # enroll token via lib method (faster)
+                    token_obj = init_token(params, user_obj)
+                    with lock:
+                        stats["enrolled"] += 1
+                    print('Enrolled a primary {0!s} token for '
+                          'user {1!s} in realm {2!s}'.format(params["type"],
+                                                             user_obj.login,
+                                                             user_obj.realm))
+    finally:
+        for worker in workers:
+            jobs.put(None)
+        for worker in workers:
+            worker.join()
+    return stats
+
+
+def print_summary(stats, duration):
+    print("Scanned {0!s} users, enrolled {1!s} tokens, {2!s} failed, {3!s} skipped in "
+          "{4:.1f} s ({5:.1f} tokens/s, {6:.1f} users/s).".format(
+              stats["users"], stats["enrolled"], stats["failed"], stats["skipped"], duration,
+              stats["enrolled"] / duration if duration else 0,
+              stats["users"] / duration if duration else 0))
 
 
 # parse input arguments
@@ -226,21 +310,24 @@ args = parser.parse_args()
 if args.realm == 'none' or args.username == 'none':
     sys.exit()
 
-# get auth token
+# get the API client with the auth token
 if INIT_VIA_API:
     URL = URL if 'URL' in locals() else "https://localhost/"
     VERIFY = VERIFY if 'VERIFY' in locals() else False
-    auth_tok = get_auth_tok()
+    client = get_client()
 else:
-    auth_tok = None
+    client = None
 
 # create tokens for users
-create_default_tokens(args.realm,
-                      auth_token=auth_tok, username=args.username,
-                      userinfo_key=args.userinfo_key,
-                      userinfo_value=args.userinfo_value,
-                      tokentype=args.tokentype,
-                      check_existing_tokentypes=args.check_existing_tokentypes)
+pipeline_start = time.time()
+stats = create_default_tokens(args.realm,
+                              client=client, username=args.username,
+                              userinfo_key=args.userinfo_key,
+                              userinfo_value=args.userinfo_value,
+                              tokentype=args.tokentype,
+                              check_existing_tokentypes=args.check_existing_tokentypes)
+if not args.username:
+    print_summary(stats, time.time() - pipeline_start)
 
 
 if TRACK_TIME:
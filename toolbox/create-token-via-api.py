@@ -1,23 +1,26 @@
 #!/opt/privacyidea/bin/python
-from flask import Flask
-from privacyidea.lib.token import init_token, get_tokens
-from privacyidea.lib.user import User
 import argparse
-from flask_sqlalchemy import SQLAlchemy
-from privacyidea.lib.utils import BASE58
-from privacyidea.lib.crypto import generate_password
-from privacyidea.app import create_app
-import requests
-import re
+import collections
+import concurrent.futures
+import os
 import sys
 import urllib3
+# The shared modules are located in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pi_rest import APIError, Client  # noqa: E402
 
  
 __doc__ = """
 This scripts creates a tokentype via the API
-It expects usernames from stdin
+It expects usernames from stdin or a file
  
-   create-token-via-api.py  
+   create-token-via-api.py [--concurrency 10] [--timeout 30] [users.txt]
+
+The tokens are enrolled via /token/init, so that the event handlers fire.
+CONCURRENCY threads send the requests at the same time over one pool of
+keep-alive connections. The serials are printed in the order of the input.
+For each failed enrollment a line "ERROR <username>: <message>" is printed
+instead of the serial.
  
 You can place the script in your scripts directory /etc/privacyidea/scripts/
  
@@ -44,43 +47,81 @@ TOKEN_TYPE = "registration"
 API_USER = "super"
 API_PASSWORD = "test"
 REALM = None
+# The number of /token/init requests in flight
+CONCURRENCY = 10
+# seconds to wait for a response
+TIMEOUT = 30
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-def get_auth_tok():
-    r = requests.post('https://localhost/auth', verify=False,
-                      data={"username": API_USER, "password": API_PASSWORD})
-    authorization = r.json().get("result").get("value").get("token")
-    return authorization
+def create_token(client, username, realm):
+    params = {"type": TOKEN_TYPE, "genkey": 1, "user": username}
+    if realm:
+        params["realm"] = realm
+    response = client.post('/token/init', data=params)
+    if not response.ok:
+        raise APIError(response.error_message)
+    return response.detail.get("serial")
 
 
-def create_token(username, realm, authorization):
-    app = create_app(config_name="production",
-                     config_file="/etc/privacyidea/pi.cfg",
-                     silent=True)
- 
-    with app.app_context():
-
-        params = {"type": TOKEN_TYPE, "genkey": 1}
-        if username:
-            params["user"] = username.strip()
-            if realm:
-                params["realm"] = realm
-            r = requests.post('https://localhost/token/init', verify=False,
-                              data=params,
-                              headers={"Authorization": authorization})
-            serial = r.json().get("detail").get("serial")
-            return serial
- 
- 
-parser = argparse.ArgumentParser()
-parser.add_argument('infile', nargs='?', type=argparse.FileType('r'),
-                    default=sys.stdin)
-args = parser.parse_args()
+def print_result(username, future):
+    """
+    Wait for the enrollment of the user and print the serial or the error.
+
+    :return: 1 if the enrollment failed, otherwise 0
+    """
+    try:
+        print(future.result(), flush=True)
+        return 0
+    except Exception as err:
+        print("ERROR {0!s}: {1!s}".format(username, err), flush=True)
+        return 1
+
+
+def create_tokens(client, usernames, realm, concurrency):
+    """
+    Enroll the tokens in a pool of concurrency threads and print the results
+    in the order of the usernames.
+
+    :return: the number of failed enrollments
+    """
+    # Only a limited number of results is kept, while waiting for a slow request
+    window = concurrency * 4
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = collections.deque()
+        for username in usernames:
+            pending.append((username, executor.submit(create_token, client, username, realm)))
+            if len(pending) >= window:
+                failed += print_result(*pending.popleft())
+        while pending:
+            failed += print_result(*pending.popleft())
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('infile', nargs='?', type=argparse.FileType('r'),
+                        default=sys.stdin)
+    parser.add_argument('--concurrency', dest='concurrency', type=int, default=CONCURRENCY,
+                        help="The number of requests in flight.")
+    parser.add_argument('--timeout', dest='timeout', type=float, default=TIMEOUT,
+                        help="Seconds to wait for each response.")
+    args = parser.parse_args()
+
+    client = Client("https://localhost", API_USER, API_PASSWORD, verify=False,
+                    timeout=args.timeout, pool_size=args.concurrency)
+    try:
+        # Authenticate once before the requests are sent in parallel
+        client.token()
+    except Exception as err:
+        sys.stderr.write("{0!s}\n".format(err))
+        sys.exit(1)
+    usernames = (line.strip() for line in args.infile if line.strip())
+    if create_tokens(client, usernames, REALM, max(1, args.concurrency)):
+        sys.exit(1)
 
-auth_tok = get_auth_tok()
 
-for user in args.infile:
-    serial = create_token(user, REALM, auth_tok)
-    print(serial)
+if __name__ == "__main__":
+    main()
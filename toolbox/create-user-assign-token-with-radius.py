@@ -6,11 +6,14 @@ from privacyidea.lib.user import User, create_user
 import argparse
 from flask_sqlalchemy import SQLAlchemy
 from privacyidea.app import create_app
+import os
 import sys
 import urllib3
 import datetime
-import requests
 import traceback
+# The shared modules are located in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pi_rest import Client
 
 
 __doc__ = """
@@ -61,11 +64,7 @@ SOFTWARE = "S"
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
-def get_auth_tok():
-    r = requests.post('https://localhost/auth', verify=False,
-                      data={"username": API_USER, "password": API_PASSWORD})
-    authorization = r.json().get("result").get("value").get("token")
-    return authorization
+client = Client("https://localhost", API_USER, API_PASSWORD, verify=False)
 
 
 def assign_user(resolver, realm, username, email, givenname, surname, serial, pin, validity, hard_or_soft):
@@ -127,10 +126,7 @@ def assign_user(resolver, realm, username, email, givenname, surname, serial, pi
                       "genkey": 1,
                       "user": user_obj.login,
                       "realm": user_obj.realm}
-            r = requests.post('https://localhost/token/init', verify=False,
-                              data=params,
-                              headers={"Authorization": get_auth_tok()})
-            if not r.json().get("result").get("status"):
+            if not client.post('/token/init', data=params).ok:
                 sys.stderr.write(" +-- Failed to create token for user {0!s}.".format(user_obj))
         else:
             sys.stderr.write("+-- Unknown Hard/Soft specifier for user {0!s}: {1!s}".format(user_obj, hard_or_soft))
@@ -5,10 +5,16 @@ from privacyidea.lib.error import TokenAdminError, UserError, ResourceNotFoundEr
 import argparse
 from flask_sqlalchemy import SQLAlchemy
 from privacyidea.app import create_app
-import requests
+import collections
+import concurrent.futures
+import os
 import re
 import sys
 import urllib3
+# The shared modules are located in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pi_concurrency import AdaptiveLimiter
+from pi_rest import Client
 
  
 __doc__ = """
@@ -23,6 +29,13 @@ The CSV file should look like this:
 
 username, email, givenname, surname, pin
 
+The users are checked and created in the main thread, while up to WORKERS
+threads create the tokens via /token/init. With ADAPTIVE_CONCURRENCY the
+number of concurrent requests starts low and adapts to the latency and the
+errors of the server, so that a mass enrollment does not overload it. The
+current concurrency and latency are written to stderr. The created tokens
+are printed in the order of the CSV file.
+
 Adapt it to your needs.
  
 (c) 2020, Cornelius Kölbel <cornelius.koelbel@netknights.it>
@@ -43,58 +56,71 @@ Adapt it to your needs.
 
 API_USER = "massenroll"
 API_PASSWORD = "changeme"
+# The maximum number of concurrent /token/init requests
+WORKERS = 16
+# Adapt the number of concurrent requests to the load of the server
+ADAPTIVE_CONCURRENCY = True
+
+limiter = AdaptiveLimiter(maximum=WORKERS) if ADAPTIVE_CONCURRENCY else None
+client = Client("https://localhost", API_USER, API_PASSWORD, verify=False, limiter=limiter)
 
 
-def create_token(resolver, realm, tokentype, username, email, givenname, surname, pin):
-    app = create_app(config_name="production",
-                     config_file="/etc/privacyidea/pi.cfg",
-                     silent=True)
+def ensure_user(resolver, realm, username, email, givenname, surname):
+    """
+    Create the user, if it does not exist. It must run in an app context.
 
-    with app.app_context():
-        # User operations
+    :return: True, if the user exists
+    """
+    try:
+        print("+ Processing user {0!s} in {1!s}/{2!s}.".format(username, resolver, realm))
+        user_obj = User(username, realm, resolver=resolver)
+    except UserError as err:
+        sys.stderr.write(" +-- Failed finding user: {0!s}.\n".format(err))
+        return False
+
+    if not user_obj.exist():
+        print(" +- Creating user {0!s} in {1!s}/{2!s}.".format(username, resolver, realm))
         try:
-            print("+ Processing user {0!s} in {1!s}/{2!s}.".format(username, resolver, realm))
-            user_obj = User(username, realm, resolver=resolver)
+            create_user(resolver, {"username": username,
+                                   "email": email,
+                                   "givenname": givenname,
+                                   "surname": surname}, password="")
         except UserError as err:
-            sys.stderr.write(" +-- Failed finding user: {0!s}.\n".format(err))
-            return
-
-        if not user_obj.exist():
-            print(" +- Creating user {0!s} in {1!s}/{2!s}.".format(username, resolver, realm))
-            try:
-                create_user(resolver, {"username": username,
-                                       "email": email,
-                                       "givenname": givenname,
-                                       "surname": surname}, password="")
-            except UserError as err:
-                sys.stderr.write(" +-- Failed to create user: {0!s}.\n".format(err))
-                return
-            except Exception as err:
-                sys.stderr.write(" +-- Failed to create user: {0!s}.\n".format(err))
-                return
-
-        # Token operations
-        try:
-            params = {}
-            params["user"] = username
-            params["realm"] = realm
-            params["type"] = tokentype
-            params["genkey"] = 1
-            params["pin"] = pin
-            r = requests.post('https://localhost/auth', verify=False,
-                              data={"username": API_USER, "password": API_PASSWORD})
-            authorization = r.json().get("result").get("value").get("token")
-            r = requests.post('https://localhost/token/init', verify=False,
-                              data=params,
-                              headers={"Authorization": authorization})
-            result = r.json().get("result")
-            detail = r.json().get("detail")
-            if not result.get("status"):
-                sys.stderr.write(" +-- Failed to create token: {0!s}\n".format(result.get("error", {}).get("message")))
-            if result.get("value"):
-                print(" +-- Created token {0!s}.".format(detail.get("serial")))
+            sys.stderr.write(" +-- Failed to create user: {0!s}.\n".format(err))
+            return False
         except Exception as err:
-            sys.stderr.write(" +-- Failed to communicated to privacyIDEA: {0!s}\n".format(err))
+            sys.stderr.write(" +-- Failed to create user: {0!s}.\n".format(err))
+            return False
+    return True
+
+
+def create_token(realm, tokentype, username, pin):
+    """
+    Create the token via API. It runs in a worker thread.
+
+    :return: tuple of the serial and the error message
+    """
+    params = {}
+    params["user"] = username
+    params["realm"] = realm
+    params["type"] = tokentype
+    params["genkey"] = 1
+    params["pin"] = pin
+    try:
+        response = client.post('/token/init', data=params)
+    except Exception as err:
+        return None, "Failed to communicated to privacyIDEA: {0!s}".format(err)
+    if not response.result.get("status"):
+        return None, "Failed to create token: {0!s}".format(response.error.get("message"))
+    return response.detail.get("serial"), None
+
+
+def print_result(future):
+    serial, error = future.result()
+    if error:
+        sys.stderr.write(" +-- {0!s}\n".format(error))
+    elif serial:
+        print(" +-- Created token {0!s}.".format(serial), flush=True)
 
 
 parser = argparse.ArgumentParser()
@@ -111,15 +137,27 @@ args = parser.parse_args()
 if args.disablewarn:
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-i = 0
-for line in sys.stdin:
-    i += 1
-    try:
-        username, email, givenname, surname, pin = [x.strip() for x in line.split(",")]
-        create_token(args.resolver, args.realm, args.tokentype,
-                     username, email, givenname, surname, pin)
-    except ValueError:
-        sys.stderr.write("Malformed line {0!s}. Probably wrong number of columns.\n".format(i))
-
-
-
+# Authenticate once before the worker threads start
+client.token()
+app = create_app(config_name="production",
+                 config_file="/etc/privacyidea/pi.cfg",
+                 silent=True)
+
+# The pending enrollments in the order of the input
+pending = collections.deque()
+with app.app_context(), concurrent.futures.ThreadPoolExecutor(WORKERS) as executor:
+    i = 0
+    for line in sys.stdin:
+        i += 1
+        try:
+            username, email, givenname, surname, pin = [x.strip() for x in line.split(",")]
+        except ValueError:
+            sys.stderr.write("Malformed line {0!s}. Probably wrong number of columns.\n".format(i))
+            continue
+        if ensure_user(args.resolver, args.realm, username, email, givenname, surname):
+            pending.append(executor.submit(create_token, args.realm, args.tokentype,
+                                           username, pin))
+        while pending and (pending[0].done() or len(pending) > 4 * WORKERS):
+            print_result(pending.popleft())
+    while pending:
+        print_result(pending.popleft())
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import argparse
+import base64
+import binascii
+import csv
+import hashlib
+import hmac
+import http.server
+import itertools
+import json
+import random
+import re
+import signal
+import ssl
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+__doc__ = """
+This script runs a local stand-in for the privacyIDEA REST API, so that the
+scripts, that use the REST API, can be benchmarked without a privacyIDEA
+server.
+
+It implements the endpoints
+
+   POST   /auth
+   POST   /token/init
+   GET    /token/
+   DELETE /token/<serial>
+   POST   /validate/check
+   POST   /validate/triggerchallenge
+
+with the same JSON envelope as privacyIDEA (result.status, result.value,
+result.error and detail). The tokens are only kept in memory. /auth accepts
+every user, /validate/check accepts the password --valid-pass for every
+user. The admin endpoints need the JWT of /auth in the Authorization header.
+Deleting an unknown serial fails with HTTP 404 like in privacyIDEA.
+
+   standin-server.py --port 5000 --latency 20 --jitter 5 --error-rate 0.01
+
+The latency of each request is --latency plus an exponentially distributed
+jitter with the mean --jitter (milliseconds). With --error-rate a random
+share of the requests fails with HTTP 500. The throughput can be limited
+with --max-concurrency, the number of requests processed at the same time
+like the worker processes of a WSGI server, and --max-rps. Requests above
+the limits wait, like they would in the listen queue of a real server.
+
+The scripts, that use pi_rest.py, can be pointed to the stand-in with the
+environment variable PI_SCRIPTS_URL:
+
+   PI_SCRIPTS_URL=http://localhost:5000 create-token-via-api.py users.txt
+
+With --certfile and --keyfile the stand-in serves HTTPS. Every
+--stats-interval seconds and on exit the number of requests and the status
+codes per path are written to stderr.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+VERSION = "privacyIDEA stand-in"
+# seconds, for which the JWTs of /auth are valid
+JWT_VALIDITY = 3600
+# The default page size of GET /token/
+PAGESIZE = 15
+# The look-ahead window of HOTP tokens and the allowed time steps of TOTP tokens
+WINDOW = 10
+# The serial prefixes of the token types, the others use "PI"
+SERIAL_PREFIX = {"hotp": "OATH", "totp": "TOTP", "registration": "REG", "sms": "PISM",
+                 "email": "PIEM", "spass": "PISP", "remote": "PIRE"}
+
+
+class TokenBucket(object):
+    """
+    Limit the rate of requests. acquire() waits until a request may pass.
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def hotp(key, counter, digits=6):
+    digest = hashlib.sha256 if len(key) == 32 else hashlib.sha1
+    mac = hmac.new(key, struct.pack(">Q", counter), digest).digest()
+    offset = mac[-1] & 0x0f
+    binary = struct.unpack(">I", mac[offset:offset + 4])[0] & 0x7fffffff
+    return "{0:0{1}d}".format(binary % 10 ** digits, digits)
+
+
+def read_pool(path):
+    """
+    Read a token pool with the columns serial, seed, counter, user and
+    optionally type and timestep.
+
+    :return: dictionary of user to the list of token dictionaries
+    """
+    pool = {}
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            row = [column.strip() for column in row]
+            if len(row) < 4 or row[0].startswith("#"):
+                continue
+            pool.setdefault(row[3], []).append({
+                "serial": row[0], "key": binascii.unhexlify(row[1]), "counter": int(row[2] or 0),
+                "totp": len(row) > 4 and row[4].lower() == "totp",
+                "timestep": int(row[5]) if len(row) > 5 and row[5] else 30})
+    return pool
+
+
+class Backend(object):
+    """
+    The in-memory state of the stand-in.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        # serial to token dictionary
+        self.tokens = {}
+        self.jwts = set()
+        self.counter = itertools.count(1)
+        self.stats = {}
+        self.slots = threading.BoundedSemaphore(args.max_concurrency) \
+            if args.max_concurrency else None
+        self.bucket = TokenBucket(args.max_rps) if args.max_rps else None
+        self.pool = read_pool(args.pool) if args.pool else None
+
+    def count(self, path, status):
+        with self.lock:
+            per_path = self.stats.setdefault(path, {})
+            per_path[status] = per_path.get(status, 0) + 1
+
+    def write_stats(self):
+        with self.lock:
+            lines = ["{0:30} {1:8d}  {2!s}".format(
+                path, sum(codes.values()),
+                " ".join("{0!s}:{1!s}".format(code, num) for code, num in sorted(codes.items())))
+                for path, codes in sorted(self.stats.items())]
+        sys.stderr.write("\n".join(lines + [""]))
+        sys.stderr.flush()
+
+    def new_jwt(self, username):
+        def encode(data):
+            return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode(
+                "ascii").rstrip("=")
+        payload = {"username": username, "role": "admin", "nonce": uuid.uuid4().hex,
+                   "exp": int(time.time()) + JWT_VALIDITY}
+        token = "{0!s}.{1!s}.standin".format(encode({"typ": "JWT", "alg": "none"}),
+                                             encode(payload))
+        with self.lock:
+            self.jwts.add(token)
+        return token
+
+    def valid_jwt(self, token):
+        with self.lock:
+            return token in self.jwts
+
+    def init_token(self, params):
+        tokentype = params.get("type", "hotp").lower()
+        serial = params.get("serial") or "{0!s}{1:08X}".format(
+            SERIAL_PREFIX.get(tokentype, "PI"), next(self.counter))
+        token = {"serial": serial, "tokentype": tokentype,
+                 "username": params.get("user", ""), "user_realm": params.get("realm", ""),
+                 "active": True, "count": 0, "failcount": 0,
+                 "description": params.get("description", ""), "rollout_state": ""}
+        with self.lock:
+            self.tokens[serial] = token
+        detail = {"serial": serial, "rollout_state": ""}
+        if tokentype == "registration":
+            detail["registrationcode"] = uuid.uuid4().hex[:20]
+        elif params.get("genkey"):
+            detail["googleurl"] = {"description": "URL for google Authenticator",
+                                   "value": "otpauth://{0!s}/{1!s}?secret=JBSWY3DPEHPK3PXP"
+                                            .format(tokentype, serial)}
+        return True, detail
+
+    def list_tokens(self, params):
+        with self.lock:
+            tokens = [tok for tok in self.tokens.values()
+                      if (not params.get("user") or tok["username"] == params["user"])
+                      and (not params.get("realm") or tok["user_realm"] == params["realm"])
+                      and (not params.get("type") or tok["tokentype"] == params["type"].lower())
+                      and (not params.get("serial") or tok["serial"] == params["serial"])]
+        tokens.sort(key=lambda tok: tok["serial"])
+        pagesize = int(params.get("pagesize") or PAGESIZE)
+        page = int(params.get("page") or 1)
+        pages = (len(tokens) + pagesize - 1) // pagesize
+        return {"tokens": tokens[(page - 1) * pagesize:page * pagesize],
+                "count": len(tokens),
+                "current": page,
+                "next": page + 1 if page < pages else None,
+                "prev": page - 1 if page > 1 else None}
+
+    def delete_token(self, serial):
+        with self.lock:
+            return 1 if self.tokens.pop(serial, None) else 0
+
+    def check(self, user, password):
+        """
+        Check the password of the user against --valid-pass or the OTP values
+        of the tokens of the user in the pool. A used counter or time step
+        is not accepted again.
+        """
+        if self.pool is None:
+            return password == self.args.valid_pass
+        with self.lock:
+            for token in self.pool.get(user, []):
+                if token["totp"]:
+                    current = int(time.time() // token["timestep"])
+                    counters = range(max(current - 1, token["counter"]), current + 2)
+                else:
+                    counters = range(token["counter"], token["counter"] + WINDOW)
+                for counter in counters:
+                    if hotp(token["key"], counter, len(password)) == password:
+                        token["counter"] = counter + 1
+                        return True
+        return False
+
+    def user_tokens(self, params):
+        with self.lock:
+            return [tok for tok in self.tokens.values()
+                    if tok["username"] == params.get("user")
+                    and (not params.get("realm") or tok["user_realm"] == params["realm"])
+                    and tok["active"]]
+
+
+class APIError(Exception):
+
+    def __init__(self, status, code, message):
+        super(APIError, self).__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written separately
+    disable_nagle_algorithm = True
+    server_version = VERSION
+    # set in main()
+    backend = None
+
+    def log_message(self, format, *args):
+        if self.backend.args.verbose:
+            super(Handler, self).log_message(format, *args)
+
+    def params(self):
+        """
+        Read the parameters of the query string and of the form or JSON body.
+
+        :raises ValueError: if the body can not be decoded
+        """
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+        if body and content_type == "application/json":
+            data = json.loads(body.decode("utf-8"))
+            if not isinstance(data, dict):
+                raise ValueError("The JSON body must be an object.")
+            params.update(data)
+        elif body:
+            params.update(urllib.parse.parse_qsl(body.decode("utf-8")))
+        return url.path, params
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def require_admin(self):
+        if not self.backend.valid_jwt(self.headers.get("Authorization", "")):
+            raise APIError(401, 4033, "Authentication failure. Missing or invalid "
+                                      "Authorization header.")
+
+    def dispatch(self, method, path, params):
+        """
+        :return: tuple of value and detail of the response
+        """
+        backend = self.backend
+        if method == "POST" and path == "/auth":
+            return {"token": backend.new_jwt(params.get("username")),
+                    "role": "admin", "username": params.get("username")}, None
+        if method == "POST" and path == "/validate/check":
+            success = backend.check(params.get("user"), params.get("pass", ""))
+            return success, {"message": "matching 1 tokens" if success else "wrong otp pin"}
+        if method == "POST" and path == "/validate/triggerchallenge":
+            self.require_admin()
+            tokens = backend.user_tokens(params)
+            if not tokens:
+                return 0, {"messages": []}
+            transaction_id = "{0:020d}".format(random.getrandbits(64))
+            challenges = [{"serial": tok["serial"], "transaction_id": transaction_id,
+                           "type": tok["tokentype"]} for tok in tokens]
+            return len(challenges), {"transaction_id": transaction_id,
+                                     "multi_challenge": challenges,
+                                     "messages": ["please enter otp: "]}
+        if method == "POST" and path == "/token/init":
+            self.require_admin()
+            return backend.init_token(params)
+        if method == "GET" and path in ("/token/", "/token"):
+            self.require_admin()
+            return backend.list_tokens(params), None
+        match = re.match(r"^/token/([^/]+)$", path)
+        if method == "DELETE" and match:
+            self.require_admin()
+            serial = urllib.parse.unquote(match.group(1))
+            if not backend.delete_token(serial):
+                raise APIError(404, 601, "The requested token could not be found.")
+            return 1, None
+        raise APIError(404, 601, "The requested URL was not found on the server.")
+
+    def handle_request(self, method):
+        backend = self.backend
+        args = backend.args
+        path = urllib.parse.urlsplit(self.path).path
+        if backend.bucket:
+            backend.bucket.acquire()
+        if backend.slots:
+            backend.slots.acquire()
+        try:
+            # A malformed body is answered with a 400 like privacyIDEA does
+            path, params = self.params()
+            delay = args.latency + (random.expovariate(1.0 / args.jitter) if args.jitter else 0)
+            time.sleep(delay / 1000.0)
+            if args.error_rate and random.random() < args.error_rate:
+                raise APIError(500, 500, "Injected error of the stand-in server.")
+            value, detail = self.dispatch(method, path, params)
+            status = 200
+            body = {"id": 1, "jsonrpc": "2.0", "version": VERSION, "time": time.time(),
+                    "result": {"status": True, "value": value}, "detail": detail}
+        except APIError as err:
+            status = err.status
+            body = {"id": 1, "jsonrpc": "2.0", "version": VERSION, "time": time.time(),
+                    "result": {"status": False, "error": {"code": err.code,
+                                                          "message": err.message}},
+                    "detail": None}
+        except (ValueError, KeyError) as err:
+            status = 400
+            body = {"id": 1, "jsonrpc": "2.0", "version": VERSION, "time": time.time(),
+                    "result": {"status": False, "error": {"code": 905,
+                                                          "message": str(err)}},
+                    "detail": None}
+        finally:
+            if backend.slots:
+                backend.slots.release()
+        # Count the token deletions as one path
+        backend.count(re.sub(r"^/token/(?!init$).+$", "/token/<serial>", path), status)
+        self.send_json(status, body)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops new connections under load
+    request_queue_size = 1024
+
+
+def write_stats_periodically(backend, interval):
+    while True:
+        time.sleep(interval)
+        backend.write_stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', dest='host', default="localhost",
+                        help="The address to listen on.")
+    parser.add_argument('--port', dest='port', type=int, default=5000,
+                        help="The port to listen on.")
+    parser.add_argument('--latency', dest='latency', type=float, default=0,
+                        help="The latency of each request in milliseconds.")
+    parser.add_argument('--jitter', dest='jitter', type=float, default=0,
+                        help="The mean of the random additional latency in milliseconds.")
+    parser.add_argument('--error-rate', dest='error_rate', type=float, default=0,
+                        help="The share of requests, that fail with HTTP 500, like 0.01.")
+    parser.add_argument('--max-concurrency', dest='max_concurrency', type=int, default=0,
+                        help="The number of requests, that are processed at the same time.")
+    parser.add_argument('--max-rps', dest='max_rps', type=float, default=0,
+                        help="The maximum number of requests per second.")
+    parser.add_argument('--valid-pass', dest='valid_pass', default="test",
+                        help="The password, that /validate/check accepts.")
+    parser.add_argument('--pool', dest='pool',
+                        help="Check the OTP values of the users in this token pool.")
+    parser.add_argument('--certfile', dest='certfile',
+                        help="The certificate to serve HTTPS.")
+    parser.add_argument('--keyfile', dest='keyfile',
+                        help="The private key of the certificate.")
+    parser.add_argument('--stats-interval', dest='stats_interval', type=float, default=0,
+                        help="Write the request statistics every N seconds.")
+    parser.add_argument('--verbose', dest='verbose', action='store_true',
+                        help="Log each request.")
+    args = parser.parse_args(argv)
+
+    Handler.backend = Backend(args)
+    server = Server((args.host, args.port), Handler)
+    scheme = "http"
+    if args.certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(args.certfile, args.keyfile)
+        # The handshake takes place on the first read in the handler thread, not in accept()
+        server.socket = context.wrap_socket(server.socket, server_side=True,
+                                            do_handshake_on_connect=False)
+        scheme = "https"
+    if args.stats_interval:
+        threading.Thread(target=write_stats_periodically,
+                         args=(Handler.backend, args.stats_interval), daemon=True).start()
+    # Write the statistics also, if the stand-in is terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    sys.stderr.write("Serving the privacyIDEA stand-in on {0!s}://{1!s}:{2!s}\n".format(
+        scheme, args.host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        Handler.backend.write_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,1405 @@
 #!/opt/privacyidea/bin/python
+import argparse
+import array
+import binascii
+import bisect
+import collections
+import csv
+import hashlib
+import hmac
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import platform
+import queue
+import random
 import requests
+import requests.adapters
+import socket
+import ssl
+import statistics
+import struct
+import sys
+import threading
 import time
+import traceback
+import urllib.parse
 import urllib3
 urllib3.disable_warnings()
-import statistics
+
+__doc__ = """
+This script measures the performance of /validate/check and of mixed
+workloads.
+
+Without further options it sends 9 requests one after the other and prints
+the median, the minimum, the maximum and the standard deviation of the
+response times.
+
+In the load modes many worker threads send the requests over keep-alive
+connections for --duration seconds or until --requests requests are sent:
+
+   test-performance.py --rate 500 --duration 60 --workers 200
+   test-performance.py --concurrency 50 --requests 10000
+
+With --rate the load is open-loop: the requests are started at the target
+rate, independent of the responses, like the requests of many independent
+users. If all workers are busy, the requests wait in a queue and the time
+they waited is reported, so a server, that can not keep up, shows up as a
+growing queue delay instead of a lower rate. With --poisson the gaps
+between the requests are exponentially distributed instead of constant.
+
+With --concurrency the load is closed-loop: each of the workers sends the
+next request as soon as it got the response of the previous request.
+
+With --processes the load is generated by several worker processes, so
+that the load generator is not limited by the Python GIL or by the CPU time
+of TLS in one process. The rate, the concurrency, the workers and the
+number of requests are split between the processes, and each process has
+its own connections, its own share of the token pool and its own
+histograms. The histograms and counters of the processes are merged into
+one report every second and at the end.
+
+With --connection the requests are sent with http.client instead of
+requests and the time of each phase of a request is recorded in its own
+histogram:
+
+ * dns       the lookup of the hostname
+ * connect   the TCP connect
+ * tls       the TLS handshake
+ * ttfb      from sending the request until the headers of the response
+             are received, this is the processing time of the server
+ * transfer  the reading of the response body
+
+The policy of --connection determines, how the connections are used:
+
+ * keep-alive  each worker keeps its connection open for the next request
+ * resume      a new connection per request, that resumes the TLS session
+               of the previous connection
+ * new         a new connection with a full TLS handshake per request
+
+So a slow reverse proxy or TLS termination can be told apart from a slow
+privacyIDEA. The summary also shows, how many TLS handshakes resumed a
+session.
+
+During a load run the throughput and the errors of the last second are
+written to stderr. At the end the achieved throughput, the errors and the
+percentiles p50, p90, p99, p99.9 and the maximum of the latency are printed.
+
+The latencies are recorded in HDR-style histograms, that have a fixed size
+independent of the number of requests and an error of less than 1% (two
+significant digits). With --histogram-json the histograms are written to a
+JSON file.
+
+With --pool the requests are spread over many users and tokens like in
+production. The pool is a CSV file in the format of import-token.py
+
+    serial, seed, counter, user[, type[, timestep]]
+
+with the hex seed, the last counter of HOTP tokens, the type "hotp" (the
+default) or "totp" and the time step of TOTP tokens in seconds (default 30).
+The OTP values are calculated by this script. Each token is used by only one
+worker at a time. The counter of a HOTP token is advanced after each
+request, a TOTP token is used only once per time step, so the pool must
+contain at least rate times time step TOTP tokens. The HOTP and the TOTP
+tokens of a mixed pool are used in turns. The HOTP counters and the next
+time steps of the TOTP tokens are written to the state file <pool>.state
+(JSON) at the end of the run, also if the run failed, so that the next run
+does not reuse OTP values. The pool file itself
+is not changed. The users are looked up in --realm, --pin is prepended to
+the OTP values.
+
+With --scenario the load runs mix several request types. The scenario is a
+JSON file like
+
+    {"admin": {"username": "admin", "password": "test"},
+     "requests": [
+         {"type": "check", "weight": 80},
+         {"type": "triggerchallenge", "weight": 5, "think_time": 5},
+         {"type": "auth", "weight": 2},
+         {"type": "token_list", "weight": 5, "params": {"pagesize": 50}},
+         {"type": "token_init", "weight": 1, "params": {"type": "registration"},
+          "delete": true}]}
+
+Each request of the load run is one of these types, chosen randomly by
+weight:
+
+ * check             /validate/check of a user of the pool or of --user
+ * triggerchallenge  /validate/triggerchallenge for a user of the pool or
+                     of --user, which is answered with /validate/check and
+                     the transaction id after the think time
+ * auth              /auth of the admin like a login to the web UI
+ * token_list        GET /token/ with the params
+ * token_init        POST /token/init with the params, with "delete" the
+                     token is deleted again with DELETE /token/<serial>
+
+The admin requests use a JWT of the admin, that is requested once. In the
+closed-loop mode a worker waits for the think time of a request type before
+it sends its next request, like a user. The optional "name" of a request
+type distinguishes several entries of the same type. The summary and the
+JSON file break the results down by request type, the answers of challenges
+and the deletions are counted as "<name> answer" and "<name> delete".
+
+Each load run is stored with the URL, the scenario, the load options, the
+histograms, the throughput per second and details of the environment in
+RESULTS_DIR (or the environment variable PI_SCRIPTS_RESULTS_DIR), unless
+--no-save is given. --label adds a description. The stored runs are listed
+with
+
+   test-performance.py list
+
+and two runs are compared with
+
+   test-performance.py compare <baseline> [<run>] [--threshold 0.1]
+
+The runs are given by their id, a unique prefix of the id or a path. The
+second run defaults to the latest run. For the throughput and the p50 and
+p99 latency of all requests and of each request type the relative change
+and its 95% confidence interval are calculated with a bootstrap. A change
+is significant, if the confidence interval does not contain zero. The
+command exits with 1, if a latency got significantly slower or the
+throughput got significantly lower by more than the threshold. Only runs
+with the same load mode, concurrency, rate, scenario and connection policy
+are compared, unless --force is given. A different URL is only reported.
+
+A load generator, that waits for slow responses before it sends the next
+request, measures too few slow requests (coordinated omission). In the
+open-loop mode the latency is therefore also reported from the intended
+start of each request, which includes the time the request had to wait for
+a free worker. This corrected latency is what the users would have seen.
+
+(c) 2026, NetKnights GmbH
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License version 3 as
+    published by the Free Software Foundation.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program; if not, write to the Free Software
+    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
 
 PI_SERVER = "https://10.0.4.225/"
 USER = "user"
 PASS = "pass"
 VERIFY_TLS = False
+# seconds to wait for a response
+TIMEOUT = 30
+# The number of worker threads of the open-loop mode
+WORKERS = 100
+# The default duration of a load run in seconds
+DURATION = 10
+
+# The directory of the stored runs
+RESULTS_DIR = os.environ.get("PI_SCRIPTS_RESULTS_DIR",
+                             os.path.expanduser("~/.local/share/privacyidea-scripts/runs"))
+# The relative change, above which a significant change is a regression
+THRESHOLD = 0.1
+# The number of bootstrap samples of the comparison
+BOOTSTRAP_SAMPLES = 2000
+# The phases of a request, that are timed with --connection
+PHASES = ["dns", "connect", "tls", "ttfb", "transfer"]
+# The connection policies of --connection
+CONNECTION_POLICIES = ["keep-alive", "resume", "new"]
+# The admin of the scenarios, that do not contain an admin
+ADMIN_USER = "admin"
+ADMIN_PASSWORD = "test"
+# The request types of the scenario files
+REQUEST_TYPES = ["check", "triggerchallenge", "auth", "token_list", "token_init"]
+# The number of digits of the OTP values
+OTPLEN = 6
+# The default time step of TOTP tokens in seconds
+TIMESTEP = 30
+# The significant bits of the histogram buckets, 8 bits give an error below 1%
+SUB_BUCKET_BITS = 8
+# The highest latency, that can be recorded, in microseconds
+HIGHEST_VALUE = 3600 * 1000 * 1000
+# The percentiles of the summary
+PERCENTILES = [50, 90, 99, 99.9]
+
+# The result of one request. intended is the time, at which the request
+# should have been sent, start the time, at which it was sent.
+# phases is a dictionary of the phases of PHASES, that took place, to
+# their duration, and "resumed", if a TLS session was resumed.
+Result = collections.namedtuple("Result", ["name", "intended", "start", "end", "status", "ok",
+                                           "phases"])
+
+
+class Histogram(object):
+    """
+    A histogram of values in microseconds with logarithmic buckets, that are
+    linearly divided into 2**SUB_BUCKET_BITS sub-buckets like HdrHistogram.
+    The relative error of a value is below 2**(1 - SUB_BUCKET_BITS).
+    """
+
+    def __init__(self):
+        self.half = 1 << (SUB_BUCKET_BITS - 1)
+        self.counts = array.array("q", [0] * (self.index(HIGHEST_VALUE) + 1))
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.sum = 0
+
+    def index(self, value):
+        bucket = max(0, value.bit_length() - SUB_BUCKET_BITS)
+        return bucket * self.half + (value >> bucket)
+
+    def highest_equivalent(self, index):
+        """
+        Return the highest value, that is counted at the index.
+        """
+        if index < 2 * self.half:
+            return index
+        bucket = index // self.half - 1
+        sub_bucket = index % self.half + self.half
+        return ((sub_bucket + 1) << bucket) - 1
+
+    def record(self, seconds, count=1):
+        value = min(HIGHEST_VALUE, max(0, int(seconds * 1000000)))
+        self.counts[self.index(value)] += count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def add(self, other):
+        """
+        Add the counts of another histogram.
+        """
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """
+        :return: the value in seconds, below or at which percent of the values are
+        """
+        if not self.total:
+            return 0
+        rank = max(1, int(math.ceil(percent / 100.0 * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.highest_equivalent(index), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+    def mean(self):
+        return self.sum / self.total / 1000000.0 if self.total else 0
+
+    def to_dict(self):
+        return {"unit": "us", "sub_bucket_bits": SUB_BUCKET_BITS, "total": self.total,
+                "min": self.min, "max": self.max, "sum": self.sum,
+                "counts": [[self.highest_equivalent(index), count]
+                           for index, count in enumerate(self.counts) if count]}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        for value, count in data["counts"]:
+            histogram.counts[histogram.index(value)] += count
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        histogram.sum = data["sum"]
+        return histogram
+
+
+def hotp(key, counter, digits=OTPLEN):
+    """
+    Calculate the HOTP value of RFC 4226. The hash algorithm is determined by
+    the length of the key like in import-token.py.
+    """
+    digest = hashlib.sha256 if len(key) == 32 else hashlib.sha1
+    mac = hmac.new(key, struct.pack(">Q", counter), digest).digest()
+    offset = mac[-1] & 0x0f
+    binary = struct.unpack(">I", mac[offset:offset + 4])[0] & 0x7fffffff
+    return "{0:0{1}d}".format(binary % 10 ** digits, digits)
+
+
+class PoolToken(object):
+
+    def __init__(self, serial, seed, counter, user, tokentype="hotp", timestep=TIMESTEP):
+        self.serial = serial
+        self.key = binascii.unhexlify(seed)
+        self.seed = seed
+        self.counter = int(counter or 0)
+        self.user = user
+        self.tokentype = tokentype.lower()
+        self.timestep = int(timestep)
+
+    def available(self, now):
+        # The counter of a TOTP token is the next unused time step
+        return self.tokentype != "totp" or int(now // self.timestep) >= self.counter
+
+    def otp(self, now):
+        if self.tokentype == "totp":
+            step = int(now // self.timestep)
+            self.counter = step + 1
+            return hotp(self.key, step)
+        value = hotp(self.key, self.counter)
+        self.counter += 1
+        return value
+
+
+class StaticCredentials(object):
+    """
+    The single user and password of --user and --pass.
+    """
+
+    def __init__(self, user, password, realm=None):
+        self.user = user
+        self.password = password
+        self.realm = realm
+
+    def checkout(self):
+        return None, self.user, self.realm, "", self.password
+
+    def checkin(self, token):
+        pass
+
+
+class TokenPool(object):
+    """
+    The users and tokens of a pool file. checkout() returns the least recently
+    used token, that is not in use and has an unused OTP value. The HOTP
+    and TOTP counters of the earlier runs are read from the state file.
+    """
+
+    def __init__(self, path, realm=None, pin="", part=0, parts=1):
+        self.path = path
+        self.state_path = path + ".state"
+        self.realm = realm
+        self.pin = pin
+        self.tokens = []
+        with open(path, newline="") as f:
+            for lineno, row in enumerate(csv.reader(f), 1):
+                row = [column.strip() for column in row]
+                if not row or not row[0] or row[0].startswith("#"):
+                    continue
+                try:
+                    self.tokens.append(PoolToken(*row[:6]))
+                except (TypeError, ValueError) as err:
+                    sys.stderr.write("Malformed line {0!s} of the pool: "
+                                     "{1!s}\n".format(lineno, err))
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.update(json.load(f))
+        # The share of the tokens of one worker process
+        self.tokens = self.tokens[part::parts]
+        if not self.tokens:
+            raise ValueError("The pool {0!s} contains no tokens.".format(path))
+        # The free tokens of each type, the least recently used first
+        self.free = {"hotp": collections.deque(), "totp": collections.deque()}
+        for token in self.tokens:
+            self.free["totp" if token.tokentype == "totp" else "hotp"].append(token)
+        self.condition = threading.Condition()
+        # The token type, that is tried first by the next checkout
+        self.turn = 0
+
+    def checkout(self):
+        with self.condition:
+            while True:
+                now = time.time()
+                types = list(self.free.values())
+                self.turn = (self.turn + 1) % len(types)
+                for tokens in types[self.turn:] + types[:self.turn]:
+                    if tokens and tokens[0].available(now):
+                        token = tokens.popleft()
+                        return token, token.user, self.realm, self.pin, token.otp(now)
+                # Wait for a token to be checked in or for the next time step
+                self.condition.wait(1)
+
+    def checkin(self, token):
+        with self.condition:
+            self.free["totp" if token.tokentype == "totp" else "hotp"].append(token)
+            self.condition.notify()
+
+    def counters(self):
+        return {token.serial: token.counter for token in self.tokens}
+
+    def update(self, counters):
+        """
+        Take the counters, that a worker process used or that the state file holds.
+        """
+        for token in self.tokens:
+            token.counter = max(token.counter, counters.get(token.serial, 0))
+
+    def save(self):
+        """
+        Write the current counters to the state file.
+        """
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.counters(), f)
+        os.replace(tmp, self.state_path)
+
+
+class PhaseResponse(object):
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content.decode("utf-8"))
+
+
+class PhaseSession(object):
+    """
+    Send requests with http.client over sockets, that are opened by this
+    class, so that the phases of each request can be timed. It provides the
+    request() method of a requests session.
+    """
+
+    def __init__(self, policy="keep-alive"):
+        self.policy = policy
+        self.connection = None
+        self.tls_session = None
+        self.contexts = {}
+        # The phases of the last request
+        self.last_phases = None
+
+    def context(self, verify):
+        if verify not in self.contexts:
+            context = ssl.create_default_context()
+            if not verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self.contexts[verify] = context
+        return self.contexts[verify]
+
+    def connect(self, url, verify, timeout, phases):
+        port = url.port or (443 if url.scheme == "https" else 80)
+        start = time.monotonic()
+        family, socktype, proto, _name, address = socket.getaddrinfo(
+            url.hostname, port, type=socket.SOCK_STREAM)[0]
+        phases["dns"] = time.monotonic() - start
+        start = time.monotonic()
+        sock = socket.socket(family, socktype, proto)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(address)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            phases["connect"] = time.monotonic() - start
+            if url.scheme == "https":
+                start = time.monotonic()
+                sock = self.context(verify).wrap_socket(
+                    sock, server_hostname=url.hostname, do_handshake_on_connect=False,
+                    session=self.tls_session if self.policy == "resume" else None)
+                sock.do_handshake()
+                phases["tls"] = time.monotonic() - start
+                phases["resumed"] = sock.session_reused
+        except Exception:
+            sock.close()
+            raise
+        connection = http.client.HTTPConnection(url.hostname, port, timeout=timeout)
+        connection.sock = sock
+        return connection
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def request(self, method, url, data=None, params=None, headers=None, verify=True,
+                timeout=None):
+        url = urllib.parse.urlsplit(url)
+        path = url.path or "/"
+        if params:
+            path += "?" + urllib.parse.urlencode(params)
+        body = urllib.parse.urlencode(data) if data else None
+        headers = dict(headers or {})
+        if body:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.policy != "keep-alive":
+            headers["Connection"] = "close"
+        for attempt in range(2):
+            phases = {}
+            self.last_phases = phases
+            # A kept connection may have been closed by the server in the meantime
+            reused = self.connection is not None
+            try:
+                if not self.connection:
+                    self.connection = self.connect(url, verify, timeout, phases)
+                start = time.monotonic()
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                phases["ttfb"] = time.monotonic() - start
+                start = time.monotonic()
+                content = response.read()
+                phases["transfer"] = time.monotonic() - start
+            except (OSError, http.client.HTTPException) as err:
+                self.close()
+                if reused and not attempt:
+                    continue
+                raise requests.ConnectionError(err)
+            if isinstance(self.connection.sock, ssl.SSLSocket):
+                # TLS 1.3 sends the session ticket after the handshake
+                self.tls_session = self.connection.sock.session
+            if self.policy != "keep-alive" or response.will_close:
+                self.close()
+            break
+        return PhaseResponse(response.status, content)
+
+
+def new_session(args, pool_size=1):
+    if args.connection:
+        return PhaseSession(args.connection)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def call(session, url, method, path, data=None, params=None, jwt=None):
+    """
+    Send one request to privacyIDEA.
+
+    :return: tuple of the HTTP status and the parsed response
+    """
+    headers = {"Authorization": jwt} if jwt else None
+    r = session.request(method, '{0!s}{1!s}'.format(url.rstrip("/"), path), data=data,
+                        params=params, headers=headers, verify=VERIFY_TLS, timeout=TIMEOUT)
+    try:
+        return r.status_code, r.json() or {}
+    except ValueError:
+        return r.status_code, {}
+
+
+def check(session, url, user, password, realm=None, transaction_id=None):
+    """
+    Send one /validate/check request.
+
+    :return: tuple of the HTTP status and the parsed response
+    """
+    data = {"user": user, "pass": password}
+    if realm:
+        data["realm"] = realm
+    if transaction_id:
+        data["transaction_id"] = transaction_id
+    return call(session, url, "POST", "/validate/check", data=data)
+
+
+class Scenario(object):
+    """
+    The weighted request types of a load run and the JWT of the admin.
+    """
+
+    def __init__(self, requests, admin_user=ADMIN_USER, admin_password=ADMIN_PASSWORD):
+        for request in requests:
+            if request.get("type") not in REQUEST_TYPES:
+                raise ValueError("Unknown request type {0!s}.".format(request.get("type")))
+            request.setdefault("name", request["type"])
+        self.requests = requests
+        self.weights = [float(request.get("weight", 1)) for request in requests]
+        self.admin_user = admin_user
+        self.admin_password = admin_password
+        self.jwt = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        admin = data.get("admin") or {}
+        return cls(data["requests"], admin.get("username", ADMIN_USER),
+                   admin.get("password", ADMIN_PASSWORD))
+
+    def choose(self):
+        return random.choices(self.requests, self.weights)[0]
+
+    def admin_login(self, session, url):
+        return call(session, url, "POST", "/auth",
+                    data={"username": self.admin_user, "password": self.admin_password})
+
+    def admin_call(self, session, url, method, path, **kwargs):
+        """
+        Send a request with the JWT of the admin. If the JWT is rejected, a
+        new JWT is requested and the request is repeated once.
+        """
+        for attempt in range(2):
+            with self.lock:
+                if not self.jwt:
+                    status, body = self.admin_login(session, url)
+                    self.jwt = ((body.get("result") or {}).get("value") or {}).get("token")
+                jwt = self.jwt
+            status, body = call(session, url, method, path, jwt=jwt, **kwargs)
+            if status != 401 or attempt:
+                return status, body
+            with self.lock:
+                if self.jwt == jwt:
+                    self.jwt = None
+
+
+def timed(recorder, session, name, intended, send, need_value=False):
+    """
+    Send a request of the session and record its result.
+
+    :param need_value: only count the request as successful, if the value is true
+    :return: the parsed response
+    """
+    start = time.monotonic()
+    try:
+        status, body = send()
+    except requests.RequestException:
+        status, body = 0, {}
+    result = body.get("result") or {}
+    ok = (status == 200 and result.get("status") is True
+          and (result.get("value") is True or not need_value))
+    recorder.add(Result(name, intended, start, time.monotonic(), status, ok,
+                        getattr(session, "last_phases", None)))
+    return body
+
+
+def execute(session, args, scenario, credentials, recorder, request, intended):
+    """
+    Send the requests of one request type of the scenario.
+    """
+    name = request["name"]
+    kind = request["type"]
+    url = args.url
+    if kind in ("check", "triggerchallenge"):
+        token, user, realm, pin, otp = credentials.checkout()
+        try:
+            if kind == "check":
+                timed(recorder, session, name, intended,
+                      lambda: check(session, url, user, pin + otp, realm), need_value=True)
+                return
+            data = {"user": user}
+            if realm:
+                data["realm"] = realm
+            body = timed(recorder, session, name, intended,
+                         lambda: scenario.admin_call(session, url, "POST",
+                                                     "/validate/triggerchallenge", data=data))
+            transaction_id = (body.get("detail") or {}).get("transaction_id")
+            if transaction_id:
+                time.sleep(request.get("think_time", 0))
+                timed(recorder, session, name + " answer", time.monotonic(),
+                      lambda: check(session, url, user, otp, realm, transaction_id),
+                      need_value=True)
+        finally:
+            credentials.checkin(token)
+    elif kind == "auth":
+        timed(recorder, session, name, intended, lambda: scenario.admin_login(session, url))
+    elif kind == "token_list":
+        timed(recorder, session, name, intended,
+              lambda: scenario.admin_call(session, url, "GET", "/token/",
+                                          params=request.get("params")))
+    elif kind == "token_init":
+        body = timed(recorder, session, name, intended,
+                     lambda: scenario.admin_call(session, url, "POST", "/token/init",
+                                                 data=request.get("params")))
+        serial = (body.get("detail") or {}).get("serial")
+        if serial and request.get("delete"):
+            timed(recorder, session, name + " delete", time.monotonic(),
+                  lambda: scenario.admin_call(session, url, "DELETE",
+                                              "/token/{0!s}".format(serial)))
+
+
+class Stats(object):
+    """
+    The histograms and counters of the requests of one type.
+    """
+
+    def __init__(self, corrected=False):
+        self.latency = Histogram()
+        # The latency from the intended start of the requests
+        self.corrected = Histogram() if corrected else None
+        self.statuses = collections.Counter()
+        self.count = 0
+        self.errors = 0
+        # The histograms of the phases and the number of resumed TLS sessions
+        self.phases = collections.OrderedDict()
+        self.resumed = 0
+
+    def phase(self, name):
+        if name not in self.phases:
+            self.phases[name] = Histogram()
+        return self.phases[name]
+
+    def add(self, result):
+        self.count += 1
+        self.statuses[result.status] += 1
+        self.latency.record(result.end - result.start)
+        if self.corrected:
+            self.corrected.record(result.end - result.intended)
+        if not result.ok:
+            self.errors += 1
+        for name in PHASES:
+            if result.phases and name in result.phases:
+                self.phase(name).record(result.phases[name])
+        if result.phases and result.phases.get("resumed"):
+            self.resumed += 1
+
+    def add_dict(self, data):
+        """
+        Add the histograms and counters of a worker process.
+        """
+        self.count += data["requests"]
+        self.errors += data["errors"]
+        self.statuses.update({int(status): num for status, num in data["statuses"].items()})
+        self.latency.add(Histogram.from_dict(data["latency"]))
+        if self.corrected and data.get("corrected"):
+            self.corrected.add(Histogram.from_dict(data["corrected"]))
+        for name in PHASES:
+            if name in data.get("phases", {}):
+                self.phase(name).add(Histogram.from_dict(data["phases"][name]))
+        self.resumed += data.get("resumed", 0)
+
+    def to_dict(self):
+        return {"requests": self.count, "errors": self.errors,
+                "statuses": {str(status): num for status, num in self.statuses.items()},
+                "latency": self.latency.to_dict(),
+                "corrected": self.corrected.to_dict() if self.corrected else None,
+                "phases": {name: histogram.to_dict() for name, histogram in self.phases.items()},
+                "resumed": self.resumed}
+
+
+class Recorder(object):
+    """
+    Count the results of the workers in histograms per request type and
+    write the progress every second.
+    """
+
+    def __init__(self, corrected=False, progress=True):
+        self.corrected = corrected
+        self.progress = progress
+        self.total = Stats(corrected)
+        self.types = collections.OrderedDict()
+        # The number of finished requests in each second of the run
+        self.timeline = collections.Counter()
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.last_count = 0
+        self.last_errors = 0
+
+    def add(self, result):
+        with self.lock:
+            self.total.add(result)
+            if result.name not in self.types:
+                self.types[result.name] = Stats(self.corrected)
+            self.types[result.name].add(result)
+            self.timeline[int(result.end - self.start)] += 1
+            now = time.monotonic()
+            if self.progress and now - self.last_report >= 1:
+                total = self.total
+                sys.stderr.write("{0:8.1f} req/s, {1:d} errors, p99 {2:.1f} ms\n".format(
+                    (total.count - self.last_count) / (now - self.last_report),
+                    total.errors - self.last_errors,
+                    (total.corrected or total.latency).percentile(99) * 1000))
+                self.last_report = now
+                self.last_count = total.count
+                self.last_errors = total.errors
+
+    def merge(self, data):
+        """
+        Add the results of a worker process.
+        """
+        self.total.add_dict(data)
+        for name, stats in data["types"].items():
+            if name not in self.types:
+                self.types[name] = Stats(self.corrected)
+            self.types[name].add_dict(stats)
+        for second, count in enumerate(data["timeline"]):
+            self.timeline[second] += count
+
+    def to_dict(self, duration):
+        data = self.total.to_dict()
+        data["duration"] = duration
+        data["types"] = {name: stats.to_dict() for name, stats in self.types.items()}
+        # The last bucket holds the partial last second and the requests,
+        # that finished after the duration
+        seconds = max(1, int(math.ceil(duration)))
+        data["timeline"] = [self.timeline[second] for second in range(seconds)]
+        data["timeline"][-1] += sum(count for second, count in self.timeline.items()
+                                    if second >= seconds)
+        return data
+
+    def snapshot(self):
+        with self.lock:
+            return self.to_dict(time.monotonic() - self.start)
+
+
+def run_open_loop(args, scenario, credentials, recorder):
+    """
+    Start the requests at the target rate. The workers take the intended
+    start times from a queue.
+    """
+    jobs = queue.Queue()
+
+    def worker():
+        session = new_session(args)
+        while True:
+            intended = jobs.get()
+            if intended is None:
+                return
+            execute(session, args, scenario, credentials, recorder, scenario.choose(), intended)
+
+    workers = [threading.Thread(target=worker, daemon=True) for i in range(args.workers)]
+    for thread in workers:
+        thread.start()
+    start = time.monotonic()
+    intended = start
+    sent = 0
+    while (not args.requests or sent < args.requests) and \
+            (args.requests or intended - start < args.duration):
+        delay = intended - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        jobs.put(intended)
+        sent += 1
+        gap = random.expovariate(args.rate) if args.poisson else 1.0 / args.rate
+        intended += gap
+    for thread in workers:
+        jobs.put(None)
+    for thread in workers:
+        thread.join()
+    return time.monotonic() - start
+
+
+def run_closed_loop(args, scenario, credentials, recorder):
+    """
+    Each worker sends the next request after the response of the previous one.
+    """
+    start = time.monotonic()
+    # The requests, that may still be sent, if the run is limited by --requests
+    budget = iter(range(args.requests)) if args.requests else None
+    lock = threading.Lock()
+
+    def worker():
+        session = new_session(args)
+        while True:
+            if budget is not None:
+                with lock:
+                    if next(budget, None) is None:
+                        return
+            elif time.monotonic() - start >= args.duration:
+                return
+            request = scenario.choose()
+            execute(session, args, scenario, credentials, recorder, request, time.monotonic())
+            if request["type"] != "triggerchallenge":
+                time.sleep(request.get("think_time", 0))
+
+    workers = [threading.Thread(target=worker, daemon=True) for i in range(args.concurrency)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.monotonic() - start
+
+
+def load_scenario(args):
+    if args.scenario:
+        return Scenario.load(args.scenario)
+    return Scenario([{"type": "check"}])
+
+
+def share(value, index, parts):
+    """
+    Split value into parts, that differ by at most one, and return the part
+    of the index.
+    """
+    return value // parts + (1 if index < value % parts else 0)
+
+
+def worker_process(index, args, messages):
+    """
+    Run the share of the load of one worker process and send the results
+    to the main process every second and at the end.
+    """
+    credentials = None
+    try:
+        # The forked processes must not choose the same random requests
+        random.seed()
+        parts = args.processes
+        args.workers = max(1, share(args.workers, index, parts))
+        args.requests = share(args.requests, index, parts)
+        if args.rate:
+            args.rate = args.rate / parts
+        else:
+            args.concurrency = share(args.concurrency, index, parts)
+        scenario = load_scenario(args)
+        if args.pool:
+            credentials = TokenPool(args.pool, args.realm, args.pin, index, parts)
+        else:
+            credentials = StaticCredentials(args.user, args.password, args.realm)
+        recorder = Recorder(corrected=bool(args.rate), progress=False)
+        done = threading.Event()
+
+        def report():
+            while not done.wait(1):
+                messages.put(("progress", index, recorder.snapshot(),
+                              credentials.counters() if args.pool else None))
+
+        threading.Thread(target=report, daemon=True).start()
+        if args.rate:
+            duration = run_open_loop(args, scenario, credentials, recorder)
+        else:
+            duration = run_closed_loop(args, scenario, credentials, recorder)
+        done.set()
+        counters = credentials.counters() if args.pool else None
+        messages.put(("done", index, recorder.to_dict(duration), counters))
+    except Exception:
+        counters = credentials.counters() if args.pool and credentials else None
+        messages.put(("error", index, traceback.format_exc(), counters))
+
+
+def run_processes(args, credentials):
+    """
+    Start the worker processes and merge their results. The counters,
+    that the processes report, are merged into the credentials as they
+    arrive, so that they are also saved, if a process fails.
+
+    :return: tuple of the merged Recorder and the duration
+    """
+    messages = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker_process, args=(index, args, messages),
+                                         daemon=True)
+                 for index in range(args.processes)]
+    for process in processes:
+        process.start()
+    snapshots = {}
+    results = {}
+    last_report = time.monotonic()
+    last_count = last_errors = 0
+    while len(results) < len(processes):
+        try:
+            kind, index, data, pool_counters = messages.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                raise RuntimeError("The worker processes exited without results.")
+            continue
+        if pool_counters:
+            credentials.update(pool_counters)
+        if kind == "error":
+            raise RuntimeError("Worker process {0!s} failed:\n{1!s}".format(index, data))
+        if kind == "done":
+            results[index] = data
+        snapshots[index] = data
+        now = time.monotonic()
+        if kind == "progress" and now - last_report >= 1:
+            merged = Recorder(corrected=bool(args.rate), progress=False)
+            for snapshot in snapshots.values():
+                merged.merge(snapshot)
+            total = merged.total
+            sys.stderr.write("{0:8.1f} req/s, {1:d} errors, p99 {2:.1f} ms\n".format(
+                (total.count - last_count) / (now - last_report), total.errors - last_errors,
+                (total.corrected or total.latency).percentile(99) * 1000))
+            last_report = now
+            last_count = total.count
+            last_errors = total.errors
+    for process in processes:
+        process.join()
+    recorder = Recorder(corrected=bool(args.rate), progress=False)
+    for data in results.values():
+        recorder.merge(data)
+    return recorder, max(data["duration"] for data in results.values())
+
+
+def print_percentiles(name, histogram):
+    print("{0:18} {1!s}, max {2:.1f}, mean {3:.1f}".format(
+        name, ", ".join("p{0!s} {1:.1f}".format(percent, histogram.percentile(percent) * 1000)
+                        for percent in PERCENTILES),
+        histogram.max / 1000.0, histogram.mean() * 1000))
+
+
+def print_summary(recorder, duration):
+    total = recorder.total
+    print("Sent {0!s} requests in {1:.1f} s: {2:.1f} req/s, {3!s} errors ({4:.2%}).".format(
+        total.count, duration, total.count / duration if duration else 0,
+        total.errors, total.errors / total.count if total.count else 0))
+    if not total.count:
+        return
+    print("HTTP status codes: {0!s}".format(
+        ", ".join("{0!s}: {1!s}".format(code or "no response", num)
+                  for code, num in sorted(total.statuses.items()))))
+    print("Latency in ms:")
+    print_percentiles("  service time", total.latency)
+    if total.corrected:
+        print_percentiles("  from schedule", total.corrected)
+    if total.phases:
+        print("Phases in ms (number of requests with the phase):")
+        for name, histogram in total.phases.items():
+            print_percentiles("  {0!s} ({1!s})".format(name, histogram.total), histogram)
+        if "tls" in total.phases:
+            print("TLS handshakes: {0!s}, resumed sessions: {1!s}".format(
+                total.phases["tls"].total, total.resumed))
+    if len(recorder.types) > 1:
+        print("By request type (service time in ms):")
+        for name, stats in recorder.types.items():
+            print("  {0:22} {1:8d} req {2:8.1f} req/s {3:6d} errors  p50 {4:.1f}, p99 {5:.1f}, "
+                  "max {6:.1f}".format(name, stats.count,
+                                       stats.count / duration if duration else 0, stats.errors,
+                                       stats.latency.percentile(50) * 1000,
+                                       stats.latency.percentile(99) * 1000,
+                                       stats.latency.max / 1000.0))
+
+
+def run_sequential(args, credentials):
+    times = []
+
+    for i in range(1, 10):
+        token, user, realm, pin, otp = credentials.checkout()
+
+        start = time.time()
+        # A new connection for each request
+        status, body = check(requests, args.url, user, pin + otp, realm)
+        value = (body.get("result") or {}).get("value")
+        end = time.time()
+        credentials.checkin(token)
+        diff = end - start
+        print("{0:0>3} : {1!s} : {2:.4f}".format(i, value, diff))
+        times.append(diff)
+
+    print("The median time for one request is {0!s}.".format(statistics.median(times)))
+    print("The slowest request took {0!s} seconds.".format(max(times)))
+    print("The fastest request took {0!s} seconds.".format(min(times)))
+    print("The standard deviation is {0!s} seconds.".format(statistics.stdev(times)))
+
+
+def save_run(args, scenario, data, directory=RESULTS_DIR):
+    """
+    Store the results of a load run with its options and environment.
+
+    :return: the id of the run
+    """
+    run_id = "{0!s}-{1!s}".format(time.strftime("%Y%m%d-%H%M%S"), os.urandom(2).hex())
+    run = {"id": run_id, "label": args.label, "time": time.time(), "url": args.url,
+           "scenario": {"path": args.scenario, "requests": scenario.requests},
+           "load": {"rate": args.rate, "concurrency": args.concurrency,
+                    "poisson": args.poisson, "workers": args.workers,
+                    "duration": args.duration, "requests": args.requests,
+                    "processes": args.processes, "connection": args.connection,
+                    "pool": args.pool, "realm": args.realm},
+           "environment": {"hostname": socket.gethostname(), "platform": platform.platform(),
+                           "python": platform.python_version(),
+                           "requests": requests.__version__, "cpus": os.cpu_count(),
+                           "argv": sys.argv},
+           "results": data}
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, run_id + ".json"), "w") as f:
+        json.dump(run, f)
+    return run_id
+
+
+def stored_runs(directory=RESULTS_DIR):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-5] for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def load_run(reference, directory=RESULTS_DIR):
+    """
+    Load a stored run by its path, its id or a unique prefix of its id.
+    """
+    if os.path.isfile(reference):
+        path = reference
+    else:
+        if reference.endswith(".json"):
+            reference = reference[:-5]
+        matches = [run_id for run_id in stored_runs(directory) if run_id.startswith(reference)]
+        if len(matches) != 1:
+            raise ValueError("{0!s} matches {1!s} stored runs.".format(reference, len(matches)))
+        path = os.path.join(directory, matches[0] + ".json")
+    with open(path) as f:
+        return json.load(f)
+
+
+class QuantileBootstrap(object):
+    """
+    The bootstrap distribution of a percentile of a stored histogram. A
+    bootstrap sample of N values has at least k values up to the bucket j
+    with the probability P(Binomial(N, F_j) >= k), where F_j is the share of
+    the values up to the bucket j. This is calculated with the normal
+    approximation, so the samples need not be drawn value by value.
+    """
+
+    def __init__(self, histogram, percent):
+        total = histogram["total"]
+        rank = max(1, int(math.ceil(percent / 100.0 * total)))
+        self.values = []
+        self.cdf = []
+        self.estimate = None
+        seen = 0
+        for value, count in histogram["counts"]:
+            seen += count
+            if self.estimate is None and seen >= rank:
+                self.estimate = value
+            share = seen / float(total)
+            if share >= 1:
+                probability = 1.0
+            else:
+                z = (rank - 0.5 - total * share) / math.sqrt(total * share * (1 - share))
+                probability = 0.5 * (1 - math.erf(z / math.sqrt(2)))
+            self.values.append(value)
+            self.cdf.append(probability)
+
+    def sample(self):
+        return self.values[min(bisect.bisect_left(self.cdf, random.random()),
+                               len(self.values) - 1)]
+
+
+class MeanBootstrap(object):
+    """
+    The bootstrap distribution of the throughput per second. The last second
+    of the timeline is only counted with its part of the duration, so that
+    the estimate is the number of requests divided by the duration.
+    """
+
+    def __init__(self, timeline, duration):
+        self.timeline = timeline or [0]
+        last = duration - (len(self.timeline) - 1)
+        self.widths = [1.0] * (len(self.timeline) - 1) + [min(1.0, last) if last > 0 else 1.0]
+        self.estimate = sum(self.timeline) / sum(self.widths)
+
+    def sample(self):
+        indexes = random.choices(range(len(self.timeline)), k=len(self.timeline))
+        return (sum(self.timeline[i] for i in indexes) /
+                sum(self.widths[i] for i in indexes))
+
+
+def relative_change(baseline, run, samples=BOOTSTRAP_SAMPLES):
+    """
+    :return: tuple of the relative change and the bounds of its 95% confidence interval
+    """
+    if not baseline.estimate:
+        return 0, 0, 0
+    change = run.estimate / baseline.estimate - 1
+    changes = []
+    for i in range(samples):
+        base = baseline.sample()
+        # A bootstrap sample of the baseline can be 0, e.g. an empty second
+        if base:
+            changes.append(run.sample() / base - 1)
+    if not changes:
+        return change, change, change
+    changes.sort()
+    return (change, changes[int(0.025 * len(changes))],
+            changes[max(0, int(0.975 * len(changes)) - 1)])
+
+
+def load_mode(run):
+    """
+    :return: the load mode of a stored run
+    """
+    load = run.get("load", {})
+    if load.get("rate"):
+        return "open-loop"
+    if load.get("concurrency"):
+        return "closed-loop"
+    return "sequential"
+
+
+def run_differences(baseline, run):
+    """
+    Find the settings, that make the runs incomparable.
+
+    :return: list of (setting, baseline value, run value)
+    """
+    def settings(stored):
+        load = stored.get("load", {})
+        return [("load mode", load_mode(stored)),
+                ("concurrency", load.get("concurrency")),
+                ("rate", load.get("rate")),
+                ("scenario", (stored.get("scenario") or {}).get("requests")),
+                ("connection", load.get("connection"))]
+    return [(name, base_value, run_value)
+            for (name, base_value), (_name, run_value) in zip(settings(baseline), settings(run))
+            if base_value != run_value]
+
+
+def compare_runs(baseline, run, threshold=THRESHOLD):
+    """
+    Print the changes of the run compared with the baseline.
+
+    :return: the number of regressions
+    """
+    def latency(results):
+        return results["corrected"] if results.get("corrected") else results["latency"]
+
+    metrics = [("throughput req/s", MeanBootstrap(baseline["results"].get("timeline"),
+                                                  baseline["results"]["duration"]),
+                MeanBootstrap(run["results"].get("timeline"), run["results"]["duration"]),
+                False)]
+    parts = [("all", baseline["results"], run["results"])]
+    parts += [(name, results, run["results"]["types"][name])
+              for name, results in baseline["results"].get("types", {}).items()
+              if name in run["results"].get("types", {}) and len(baseline["results"]["types"]) > 1]
+    for name, base_results, run_results in parts:
+        if not base_results["requests"] or not run_results["requests"]:
+            continue
+        for percent in (50, 99):
+            metrics.append(("{0!s} p{1!s} ms".format(name, percent),
+                            QuantileBootstrap(latency(base_results), percent),
+                            QuantileBootstrap(latency(run_results), percent), True))
+
+    print("Baseline {0!s} ({1!s}), run {2!s} ({3!s})".format(
+        baseline["id"], baseline.get("label") or baseline["url"],
+        run["id"], run.get("label") or run["url"]))
+    print("{0:32} {1:>10} {2:>10} {3:>7}  95% confidence".format(
+        "", "baseline", "run", "change"))
+    regressions = 0
+    for name, base_metric, run_metric, lower_is_better in metrics:
+        change, low, high = relative_change(base_metric, run_metric)
+        significant = low > 0 or high < 0
+        if lower_is_better:
+            regression = low > 0 and change > threshold
+        else:
+            regression = high < 0 and change < -threshold
+        regressions += regression
+        scale = 0.001 if lower_is_better else 1
+        print("{0:32} {1:10.1f} {2:10.1f} {3:+7.1%} [{4:+7.1%}, {5:+7.1%}] {6!s}".format(
+            name, base_metric.estimate * scale, run_metric.estimate * scale, change, low, high,
+            "REGRESSION" if regression else ("significant" if significant else "")))
+    return regressions
+
+
+def main_list(argv):
+    parser = argparse.ArgumentParser(prog="test-performance.py list")
+    parser.add_argument('--results-dir', dest='results_dir', default=RESULTS_DIR,
+                        help="The directory of the stored runs.")
+    args = parser.parse_args(argv)
+    for run_id in stored_runs(args.results_dir):
+        run = load_run(os.path.join(args.results_dir, run_id + ".json"))
+        results = run["results"]
+        print("{0!s}  {1:30} {2:8d} req {3:8.1f} req/s  {4!s}".format(
+            run_id, run["url"], results["requests"],
+            results["requests"] / results["duration"] if results["duration"] else 0,
+            run.get("label") or ""))
+
+
+def main_compare(argv):
+    parser = argparse.ArgumentParser(prog="test-performance.py compare")
+    parser.add_argument('baseline', help="The id or the path of the baseline run.")
+    parser.add_argument('run', nargs="?", help="The id or the path of the run to compare, "
+                                               "defaults to the latest run.")
+    parser.add_argument('--threshold', dest='threshold', type=float, default=THRESHOLD,
+                        help="The relative change, above which a significant change is "
+                             "a regression.")
+    parser.add_argument('--results-dir', dest='results_dir', default=RESULTS_DIR,
+                        help="The directory of the stored runs.")
+    parser.add_argument('--force', dest='force', action='store_true',
+                        help="Compare the runs, even if their load settings differ.")
+    args = parser.parse_args(argv)
+    try:
+        baseline = load_run(args.baseline, args.results_dir)
+        latest = stored_runs(args.results_dir)[-1:] or [""]
+        run = load_run(args.run or latest[0], args.results_dir)
+    except ValueError as err:
+        parser.error(str(err))
+    differences = run_differences(baseline, run)
+    for name, base_value, run_value in differences:
+        sys.stderr.write("The {0!s} differs, the baseline has {1!s:.60} and the run has "
+                         "{2!s:.60}.\n".format(name, base_value, run_value))
+    if differences and not args.force:
+        parser.error("The runs can not be compared, use --force to compare them anyway.")
+    if baseline["url"] != run["url"]:
+        sys.stderr.write("Warning: the baseline was run against {0!s} and the run against "
+                         "{1!s}.\n".format(baseline["url"], run["url"]))
+    if compare_runs(baseline, run, args.threshold):
+        sys.exit(1)
+
 
-times = []
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["list"]:
+        return main_list(argv[1:])
+    if argv[:1] == ["compare"]:
+        return main_compare(argv[1:])
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', dest='url', default=PI_SERVER,
+                        help="The URL of the privacyIDEA server.")
+    parser.add_argument('--user', dest='user', default=USER,
+                        help="The user to authenticate.")
+    parser.add_argument('--pass', dest='password', default=PASS,
+                        help="The password of the user.")
+    parser.add_argument('--realm', dest='realm',
+                        help="The realm of the users.")
+    parser.add_argument('--pool', dest='pool',
+                        help="A CSV file with the columns serial, seed, counter, user and "
+                             "optionally type and timestep. The requests use these users "
+                             "and the OTP values of their tokens.")
+    parser.add_argument('--pin', dest='pin', default="",
+                        help="The PIN of the tokens of the pool.")
+    parser.add_argument('--scenario', dest='scenario',
+                        help="A JSON file with the weighted request types of the load run.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--rate', dest='rate', type=float,
+                      help="Send this many requests per second (open-loop).")
+    mode.add_argument('--concurrency', dest='concurrency', type=int,
+                      help="Keep this many requests in flight (closed-loop).")
+    parser.add_argument('--poisson', dest='poisson', action='store_true',
+                        help="Send the requests of --rate with exponentially distributed gaps.")
+    parser.add_argument('--workers', dest='workers', type=int, default=WORKERS,
+                        help="The number of worker threads of --rate.")
+    parser.add_argument('--connection', dest='connection', choices=CONNECTION_POLICIES,
+                        help="Time the phases of the requests and use the connections with "
+                             "this policy.")
+    parser.add_argument('--processes', dest='processes', type=int, default=1,
+                        help="The number of worker processes of the load run.")
+    parser.add_argument('--duration', dest='duration', type=float, default=DURATION,
+                        help="The duration of the load run in seconds.")
+    parser.add_argument('--requests', dest='requests', type=int, default=0,
+                        help="The number of requests of the load run instead of a duration.")
+    parser.add_argument('--histogram-json', dest='histogram_json',
+                        help="Write the histograms of the load run to this JSON file.")
+    parser.add_argument('--label', dest='label',
+                        help="A description of the load run, like the tested change.")
+    parser.add_argument('--results-dir', dest='results_dir', default=RESULTS_DIR,
+                        help="The directory of the stored runs.")
+    parser.add_argument('--no-save', dest='save', action='store_false',
+                        help="Do not store the load run.")
+    args = parser.parse_args(argv)
 
-for i in range(1, 10):
-    otp = PASS
+    if args.processes > 1 and (args.concurrency or 0) and args.concurrency < args.processes:
+        parser.error("The concurrency must be at least the number of processes.")
+    if args.processes > 1 and args.requests and args.requests < args.processes:
+        parser.error("The requests must be at least the number of processes.")
+    try:
+        scenario = load_scenario(args)
+    except (KeyError, ValueError) as err:
+        parser.error("Invalid scenario {0!s}: {1!s}".format(args.scenario, err))
+    if args.pool:
+        credentials = TokenPool(args.pool, args.realm, args.pin)
+    else:
+        credentials = StaticCredentials(args.user, args.password, args.realm)
+    try:
+        if not args.rate and not args.concurrency:
+            run_sequential(args, credentials)
+            return
+        if args.processes > 1:
+            recorder, duration = run_processes(args, credentials)
+        elif args.rate:
+            recorder = Recorder(corrected=True)
+            duration = run_open_loop(args, scenario, credentials, recorder)
+        else:
+            recorder = Recorder(corrected=False)
+            duration = run_closed_loop(args, scenario, credentials, recorder)
+    finally:
+        if args.pool:
+            credentials.save()
+    print_summary(recorder, duration)
+    data = recorder.to_dict(duration)
+    if args.histogram_json:
+        with open(args.histogram_json, "w") as f:
+            json.dump(data, f)
+    if args.save:
+        print("Stored the run {0!s}.".format(save_run(args, scenario, data, args.results_dir)))
 
-    start = time.time()
-    r = requests.post('{0!s}/validate/check'.format(PI_SERVER), verify=VERIFY_TLS,
-                      data={"user": USER, "pass": otp})
-    end = time.time()
-    diff = end - start
-    print("{0:0>3} : {1!s} : {2:.4f}".format(i, r.json().get("result").get("value"), diff))
-    times.append(diff)
 
-print("The median time for one request is {0!s}.".format(statistics.median(times)))
-print("The slowest request took {0!s} seconds.".format(max(times)))
-print("The fastest request took {0!s} seconds.".format(min(times)))
-print("The standard deviation is {0!s} seconds.".format(statistics.stdev(times)))
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
 #!/opt/privacyidea/bin/python
 # -*- coding: utf-8 -*-
 
-from privacyidea.app import create_app
-from privacyidea.lib.machine import detach_token
+from pi_bootstrap import app_context, lazy_import
 import argparse
 
 __doc__ = """
@@ -40,19 +39,23 @@ Adapt SSH_HOST to your needs.
 SSH_HOST = "test_host"
 PI_CONFIG = '/etc/privacyidea/pi.cfg'
 
+machine_lib = lazy_import("privacyidea.lib.machine")
+
 
 def unassign_ssh_token(serial):
-    app = create_app(config_name='production',
-                     config_file=PI_CONFIG,
-                     silent=True)
-    with app.app_context():
-        detach_token(serial, 'ssh', hostname=SSH_HOST)
+    with app_context(PI_CONFIG):
+        machine_lib.detach_token(serial, 'ssh', hostname=SSH_HOST)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serial', dest='serial', required=True)
+    args, unknown = parser.parse_known_args(argv)
 
+    # unassign the token from a specific machine
+    if args.serial:
+        unassign_ssh_token(args.serial)
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--serial', dest='serial', required=True)
-args, unknown = parser.parse_known_args()
 
-# unassign the token from a specific machine
-if args.serial:
-    unassign_ssh_token(args.serial)
+if __name__ == "__main__":
+    main()